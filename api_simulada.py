@@ -0,0 +1,226 @@
+import json
+import os
+import random
+import re
+import threading
+import time
+import uuid
+
+from flask import Flask, Response, jsonify, request
+
+from pre_classificador import classificar_por_palavras_chave
+
+
+# Servidor local que imita os endpoints da OpenAI usados pelo projeto
+# (chat, arquivos e Batch API), para testar o fluxo sem chave nem custo.
+# Uso: python api_simulada.py e OPENAI_BASE_URL=http://127.0.0.1:8089/v1
+
+# Segundos até um batch enviado ficar "completed"
+ATRASO_BATCH_SIMULADO = 5.0
+
+# Latência de cada chamada de chat em milissegundos: média e variação uniforme (±)
+LATENCIA_CHAT_SIMULADA_MS = 0.0
+VARIACAO_LATENCIA_CHAT_MS = 0.0
+
+# Documentos de um prompt empacotado (ids numéricos; o "N" das instruções é ignorado)
+_DOCUMENTO_PACOTE = re.compile(r'<documento id="(\d+)">(.*?)</documento>', re.DOTALL)
+
+app = Flask(__name__)
+# Rate limit simulado: as próximas N chamadas de chat respondem 429 com Retry-After (em segundos)
+app.config["RESPOSTAS_429_SIMULADAS"] = int(os.getenv("RESPOSTAS_429_SIMULADAS", "0"))
+app.config["RETRY_AFTER_SIMULADO"] = os.getenv("RETRY_AFTER_SIMULADO", "1")
+# Contadores das chamadas de chat (pico_em_andamento mostra a concorrência real dos clientes)
+estatisticas_chat = {"requisicoes": 0, "respostas_429": 0, "em_andamento": 0, "pico_em_andamento": 0}
+_arquivos = {}   # id -> {"metadados": {...}, "conteudo": bytes}
+_batches = {}    # id -> objeto do batch
+_trava = threading.Lock()
+
+
+def _classificar(texto):
+    resultado = classificar_por_palavras_chave(texto)
+    return {"tipo": resultado["tipo"] or "descarte",
+            "indice_certeza": round(resultado["indice_certeza"], 2)}
+
+
+def responder_classificacao(mensagens, modelo):
+    """
+    Gera uma resposta de chat no formato da OpenAI classificando o texto
+    pelas palavras-chave do pré-classificador (um documento ou um pacote
+    de documentos marcados com <documento id="N">).
+    """
+    conteudo = "\n".join(m.get("content") or "" for m in mensagens)
+    documentos = _DOCUMENTO_PACOTE.findall(conteudo)
+    if documentos:
+        resposta = json.dumps({"documentos": [{"id": documento_id, **_classificar(texto)}
+                                              for documento_id, texto in documentos]})
+    else:
+        resposta = json.dumps(_classificar(conteudo.split("Aqui está o conteúdo do documento:")[-1]))
+    tokens_entrada = max(1, len(conteudo) // 4)
+    tokens_saida = max(1, len(resposta) // 4)
+    return {
+        "id": f"chatcmpl-{uuid.uuid4().hex}",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": modelo,
+        "choices": [{"index": 0, "finish_reason": "stop",
+                     "message": {"role": "assistant", "content": resposta}}],
+        "usage": {"prompt_tokens": tokens_entrada, "completion_tokens": tokens_saida,
+                  "total_tokens": tokens_entrada + tokens_saida}
+    }
+
+
+def _novo_arquivo(nome, conteudo, finalidade):
+    arquivo_id = f"file-{uuid.uuid4().hex}"
+    metadados = {"id": arquivo_id, "object": "file", "bytes": len(conteudo),
+                 "created_at": int(time.time()), "filename": nome,
+                 "purpose": finalidade, "status": "processed"}
+    _arquivos[arquivo_id] = {"metadados": metadados, "conteudo": conteudo}
+    return metadados
+
+
+def _executar_batch(batch):
+    """Processa as requisições do arquivo de entrada e gera os arquivos de saída e de erros."""
+    entrada = _arquivos[batch["input_file_id"]]["conteudo"].decode("utf-8")
+    saidas = []
+    erros = []
+    for linha in entrada.splitlines():
+        if not linha.strip():
+            continue
+        requisicao = json.loads(linha)
+        corpo = requisicao.get("body") or {}
+        if requisicao.get("url") != batch["endpoint"] or not corpo.get("messages"):
+            erros.append({"id": f"batch_req_{uuid.uuid4().hex}", "custom_id": requisicao.get("custom_id"),
+                          "response": None,
+                          "error": {"code": "invalid_request", "message": "requisição inválida"}})
+            continue
+        saidas.append({"id": f"batch_req_{uuid.uuid4().hex}", "custom_id": requisicao["custom_id"],
+                       "response": {"status_code": 200, "request_id": uuid.uuid4().hex,
+                                    "body": responder_classificacao(corpo["messages"], corpo.get("model"))},
+                       "error": None})
+
+    def _jsonl(linhas):
+        return "".join(json.dumps(l, ensure_ascii=False) + "\n" for l in linhas).encode("utf-8")
+
+    if saidas:
+        batch["output_file_id"] = _novo_arquivo(
+            f"{batch['id']}_output.jsonl", _jsonl(saidas), "batch_output")["id"]
+    if erros:
+        batch["error_file_id"] = _novo_arquivo(
+            f"{batch['id']}_error.jsonl", _jsonl(erros), "batch_output")["id"]
+    batch["request_counts"] = {"total": len(saidas) + len(erros),
+                               "completed": len(saidas), "failed": len(erros)}
+    batch["status"] = "completed"
+    batch["completed_at"] = int(time.time())
+
+
+@app.post("/v1/chat/completions")
+def chat_completions():
+    dados = request.get_json(silent=True) or {}
+    if not dados.get("messages"):
+        return jsonify({"error": {"message": "messages é obrigatório"}}), 400
+    with _trava:
+        estatisticas_chat["requisicoes"] += 1
+        if app.config["RESPOSTAS_429_SIMULADAS"] > 0:
+            app.config["RESPOSTAS_429_SIMULADAS"] -= 1
+            estatisticas_chat["respostas_429"] += 1
+            resposta = jsonify({"error": {"message": "Rate limit reached (simulado)",
+                                          "type": "requests", "code": "rate_limit_exceeded"}})
+            resposta.status_code = 429
+            resposta.headers["Retry-After"] = app.config["RETRY_AFTER_SIMULADO"]
+            return resposta
+        estatisticas_chat["em_andamento"] += 1
+        estatisticas_chat["pico_em_andamento"] = max(
+            estatisticas_chat["pico_em_andamento"], estatisticas_chat["em_andamento"])
+    try:
+        latencia = float(os.getenv("LATENCIA_CHAT_SIMULADA_MS", LATENCIA_CHAT_SIMULADA_MS))
+        variacao = float(os.getenv("VARIACAO_LATENCIA_CHAT_MS", VARIACAO_LATENCIA_CHAT_MS))
+        atraso = max(0.0, latencia + random.uniform(-variacao, variacao))
+        if atraso:
+            time.sleep(atraso / 1000)
+        return jsonify(responder_classificacao(dados["messages"], dados.get("model")))
+    finally:
+        with _trava:
+            estatisticas_chat["em_andamento"] -= 1
+
+
+@app.post("/v1/files")
+def criar_arquivo():
+    enviado = request.files["file"]
+    with _trava:
+        metadados = _novo_arquivo(enviado.filename, enviado.read(),
+                                  request.form.get("purpose", "batch"))
+    return jsonify(metadados)
+
+
+@app.get("/v1/files/<arquivo_id>")
+def obter_arquivo(arquivo_id):
+    arquivo = _arquivos.get(arquivo_id)
+    if arquivo is None:
+        return jsonify({"error": {"message": "arquivo não encontrado"}}), 404
+    return jsonify(arquivo["metadados"])
+
+
+@app.get("/v1/files/<arquivo_id>/content")
+def conteudo_arquivo(arquivo_id):
+    arquivo = _arquivos.get(arquivo_id)
+    if arquivo is None:
+        return jsonify({"error": {"message": "arquivo não encontrado"}}), 404
+    return Response(arquivo["conteudo"], mimetype="application/jsonl")
+
+
+@app.post("/v1/batches")
+def criar_batch():
+    dados = request.get_json()
+    if dados.get("input_file_id") not in _arquivos:
+        return jsonify({"error": {"message": "input_file_id não encontrado"}}), 400
+    batch = {
+        "id": f"batch_{uuid.uuid4().hex}",
+        "object": "batch",
+        "endpoint": dados.get("endpoint", "/v1/chat/completions"),
+        "input_file_id": dados["input_file_id"],
+        "completion_window": dados.get("completion_window", "24h"),
+        "status": "in_progress",
+        "created_at": int(time.time()),
+        "output_file_id": None,
+        "error_file_id": None,
+        "request_counts": {"total": 0, "completed": 0, "failed": 0},
+        "metadata": dados.get("metadata")
+    }
+    with _trava:
+        _batches[batch["id"]] = batch
+    return jsonify(batch)
+
+
+@app.get("/v1/batches/<batch_id>")
+def obter_batch(batch_id):
+    with _trava:
+        batch = _batches.get(batch_id)
+        if batch is None:
+            return jsonify({"error": {"message": "batch não encontrado"}}), 404
+        atraso = float(os.getenv("ATRASO_BATCH_SIMULADO", ATRASO_BATCH_SIMULADO))
+        if batch["status"] == "in_progress" and time.time() - batch["created_at"] >= atraso:
+            _executar_batch(batch)
+        return jsonify(batch)
+
+
+@app.post("/v1/batches/<batch_id>/cancel")
+def cancelar_batch(batch_id):
+    with _trava:
+        batch = _batches.get(batch_id)
+        if batch is None:
+            return jsonify({"error": {"message": "batch não encontrado"}}), 404
+        if batch["status"] not in ("completed", "failed", "expired"):
+            batch["status"] = "cancelled"
+        return jsonify(batch)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        description="Servidor local que imita os endpoints de chat, arquivos e batches da OpenAI.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--porta", type=int, default=8089)
+    args = parser.parse_args()
+
+    app.run(host=args.host, port=args.porta, threaded=True)
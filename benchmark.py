@@ -0,0 +1,426 @@
+import json
+import math
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+
+# Benchmark reprodutível do pipeline: gera um corpus sintético de PDFs com o
+# PyMuPDF, sobe api_simulada.py (chat com latência configurável) em uma
+# thread e mede páginas/s, latência por arquivo (p50/p95), pico de RSS e
+# tokens por documento. O resultado vai para um JSON por execução, para
+# comparar commits com `python benchmark.py comparar antigo.json novo.json`.
+
+DIRETORIO_CORPUS_BENCHMARK = "corpus_benchmark"
+DIRETORIO_RESULTADOS_BENCHMARK = "resultados_benchmark"
+
+# Documentos por subdiretório do corpus (listar_pdfs_amostragem lê subdiretórios)
+DOCUMENTOS_POR_LOTE = 25
+
+# Resolução das páginas "digitalizadas" (imagem sem camada de texto)
+DPI_DIGITALIZADO = 150
+
+_NOMES = ["Ana Souza", "Bruno Lima", "Carla Mendes", "Diego Rocha", "Elisa Prado", "Fábio Nunes"]
+_EMPRESAS = ["Hotel Atlântico Ltda", "Serviços Gerais Brasil S.A.", "Tecnologia Aurora ME",
+             "Consultoria Horizonte Ltda", "Pousada Serra Azul"]
+
+
+def _texto_voucher(aleatorio):
+    entrada = f"{aleatorio.randint(1, 28):02d}/{aleatorio.randint(1, 12):02d}/2024"
+    return "\n".join([
+        "VOUCHER DE HOSPEDAGEM",
+        _EMPRESAS[aleatorio.randrange(len(_EMPRESAS))],
+        f"Número da reserva: {aleatorio.randint(100000, 999999)}",
+        f"Hóspede: {_NOMES[aleatorio.randrange(len(_NOMES))]}",
+        f"Quarto nº {aleatorio.randint(100, 999)}",
+        f"Check-in: {entrada} 14:00",
+        "Check-out: 12:00",
+        f"Diárias: {aleatorio.randint(1, 7)}",
+        f"Valor total: R$ {aleatorio.uniform(200, 5000):.2f}",
+        "Forma de pagamento: cartão de crédito",
+    ])
+
+
+def _texto_boleto(aleatorio):
+    linha = (f"{aleatorio.randint(10000, 99999)}.{aleatorio.randint(10000, 99999)} "
+             f"{aleatorio.randint(10000, 99999)}.{aleatorio.randint(100000, 999999)} "
+             f"{aleatorio.randint(10000, 99999)}.{aleatorio.randint(100000, 999999)} "
+             f"{aleatorio.randint(1, 9)} {aleatorio.randint(10 ** 13, 10 ** 14 - 1)}")
+    return "\n".join([
+        "Recibo do Pagador",
+        f"Beneficiário: {_EMPRESAS[aleatorio.randrange(len(_EMPRESAS))]}",
+        f"Agência/Código do Beneficiário: {aleatorio.randint(1000, 9999)}/{aleatorio.randint(10000, 99999)}-0",
+        f"Nosso Número: {aleatorio.randint(10 ** 10, 10 ** 11 - 1)}",
+        f"Vencimento: {aleatorio.randint(1, 28):02d}/{aleatorio.randint(1, 12):02d}/2024",
+        f"Valor do Documento: R$ {aleatorio.uniform(50, 3000):.2f}",
+        "Local de pagamento: pagável em qualquer banco até o vencimento",
+        "Uso do banco",
+        "Juros/Multa",
+        f"Pagador: {_NOMES[aleatorio.randrange(len(_NOMES))]}",
+        linha,
+    ])
+
+
+def _texto_nota_fiscal(aleatorio):
+    return "\n".join([
+        "NOTA FISCAL DE SERVIÇOS ELETRÔNICA - NFS-e",
+        f"Número da Nota: {aleatorio.randint(1000, 99999)}",
+        f"Código de Verificação: {aleatorio.randint(10 ** 7, 10 ** 8 - 1):X}",
+        f"Prestador de Serviços: {_EMPRESAS[aleatorio.randrange(len(_EMPRESAS))]}",
+        f"CNPJ: {aleatorio.randint(10, 99)}.{aleatorio.randint(100, 999)}.{aleatorio.randint(100, 999)}/0001-{aleatorio.randint(10, 99)}",
+        f"Tomador de Serviços: {_NOMES[aleatorio.randrange(len(_NOMES))]}",
+        "Discriminação dos Serviços",
+        "Consultoria técnica e suporte mensal",
+        f"CNAE: {aleatorio.randint(1000, 9999)}-{aleatorio.randint(1, 9)}/00",
+        f"Valor do ISS: R$ {aleatorio.uniform(10, 500):.2f}",
+    ])
+
+
+def _texto_descarte(aleatorio):
+    return "\n".join([
+        "ATA DE REUNIÃO",
+        f"Participantes: {', '.join(aleatorio.sample(_NOMES, 3))}",
+        "Pauta: planejamento do trimestre e revisão de metas internas.",
+        "Foram discutidos os prazos das entregas e a distribuição das tarefas.",
+        "Ficou decidido que o próximo encontro acontecerá na sala de reuniões.",
+    ])
+
+
+GERADORES_TEXTO = {
+    "voucher": _texto_voucher,
+    "boleto": _texto_boleto,
+    "nota_fiscal": _texto_nota_fiscal,
+    "descarte": _texto_descarte,
+}
+
+
+def _texto_anexo(aleatorio, numero):
+    linhas = [f"ANEXO - PÁGINA {numero}"]
+    for _ in range(25):
+        linhas.append(" ".join(aleatorio.choice(
+            ["item", "quantidade", "descrição", "observação", "referência", "total", "data"])
+            for _ in range(10)))
+    return "\n".join(linhas)
+
+
+def _inserir_pagina_texto(doc, texto):
+    page = doc.new_page(width=595, height=842)  # A4 em pontos
+    page.insert_textbox((50, 50, 545, 800), texto, fontsize=11, fontname="helv")
+    return page
+
+
+def _inserir_pagina_digitalizada(doc, texto):
+    """Renderiza a página de texto em imagem e a insere sem camada de texto (como um scanner)."""
+    import fitz
+
+    with fitz.open() as temporario:
+        pix = _inserir_pagina_texto(temporario, texto).get_pixmap(
+            dpi=DPI_DIGITALIZADO, colorspace=fitz.csGRAY, alpha=False)
+    page = doc.new_page(width=595, height=842)
+    page.insert_image(page.rect, pixmap=pix)
+
+
+def gerar_corpus(diretorio=DIRETORIO_CORPUS_BENCHMARK, documentos=40, digitalizados=10, grandes=2,
+                 paginas_grandes=40, semente=42):
+    """
+    Gera o corpus sintético em <diretorio>/lote_NN/doc_NNNN.pdf e o gabarito
+    (tipo, variante e páginas de cada arquivo) em <diretorio>/gabarito.json.
+    A mesma semente gera sempre o mesmo corpus.
+
+    Args:
+        diretorio (str): Diretório do corpus (recriado do zero)
+        documentos (int): Documentos de uma página com camada de texto
+        digitalizados (int): Documentos de uma página só com imagem (vão para o OCR)
+        grandes (int): Documentos com camada de texto e páginas de anexo
+        paginas_grandes (int): Páginas de cada documento grande
+        semente (int): Semente do gerador aleatório
+
+    Returns:
+        dict: Gabarito {"semente", "documentos": {nome: {"tipo", "variante", "paginas"}}}
+    """
+    import shutil
+
+    import fitz
+
+    aleatorio = random.Random(semente)
+    shutil.rmtree(diretorio, ignore_errors=True)
+
+    variantes = ["texto"] * documentos + ["digitalizado"] * digitalizados + ["grande"] * grandes
+    aleatorio.shuffle(variantes)
+    tipos = list(GERADORES_TEXTO)
+
+    gabarito = {"semente": semente, "documentos": {}}
+    for indice, variante in enumerate(variantes, start=1):
+        tipo = tipos[aleatorio.randrange(len(tipos))]
+        texto = GERADORES_TEXTO[tipo](aleatorio)
+        lote = os.path.join(diretorio, f"lote_{(indice - 1) // DOCUMENTOS_POR_LOTE + 1:02d}")
+        os.makedirs(lote, exist_ok=True)
+        nome = f"doc_{indice:04d}.pdf"
+
+        with fitz.open() as doc:
+            if variante == "digitalizado":
+                _inserir_pagina_digitalizada(doc, texto)
+            else:
+                _inserir_pagina_texto(doc, texto)
+            if variante == "grande":
+                for numero in range(2, paginas_grandes + 1):
+                    _inserir_pagina_texto(doc, _texto_anexo(aleatorio, numero))
+            paginas = doc.page_count
+            doc.save(os.path.join(lote, nome), garbage=3, deflate=True)
+
+        gabarito["documentos"][nome] = {"tipo": tipo, "variante": variante, "paginas": paginas}
+
+    with open(os.path.join(diretorio, "gabarito.json"), "w", encoding="utf-8") as f:
+        json.dump(gabarito, f, indent=2, ensure_ascii=False)
+    print(f"Corpus gerado em {diretorio}: {len(variantes)} arquivo(s), "
+          f"{sum(d['paginas'] for d in gabarito['documentos'].values())} página(s)")
+    return gabarito
+
+
+def percentil(valores, p):
+    """Percentil p (0-100) pelo método do posto mais próximo; 0 para lista vazia."""
+    if not valores:
+        return 0.0
+    ordenados = sorted(valores)
+    posicao = max(0, min(len(ordenados) - 1, math.ceil(p / 100 * len(ordenados)) - 1))
+    return ordenados[posicao]
+
+
+def pico_rss_mb():
+    """Pico de memória residente deste processo e dos filhos já encerrados (pool de extração), em MB."""
+    import resource
+
+    # ru_maxrss vem em KB no Linux e em bytes no macOS
+    divisor = 1024 ** 2 if sys.platform == "darwin" else 1024
+    proprio = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / divisor
+    filhos = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / divisor
+    return {"processo": round(proprio, 1), "maior_filho": round(filhos, 1)}
+
+
+def versao_codigo():
+    """Commit atual (com "+" se houver alterações não commitadas), ou None fora do git."""
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                                text=True, check=True).stdout.strip()
+        alterado = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"],
+                                  capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return commit + ("+" if alterado else "")
+
+
+def iniciar_api_simulada(latencia_ms, variacao_ms):
+    """Sobe api_simulada.py em uma porta livre e retorna a URL base (/v1)."""
+    from werkzeug.serving import make_server
+
+    import api_simulada
+
+    os.environ["LATENCIA_CHAT_SIMULADA_MS"] = str(latencia_ms)
+    os.environ["VARIACAO_LATENCIA_CHAT_MS"] = str(variacao_ms)
+    servidor = make_server("127.0.0.1", 0, api_simulada.app, threaded=True)
+    threading.Thread(target=servidor.serve_forever, name="api-simulada", daemon=True).start()
+    return f"http://127.0.0.1:{servidor.server_port}/v1"
+
+
+def executar_benchmark(corpus=DIRETORIO_CORPUS_BENCHMARK, modo="sequencial", workers=4,
+                       latencia_ms=300.0, variacao_ms=100.0, com_cache=False,
+                       diretorio_resultados=DIRETORIO_RESULTADOS_BENCHMARK):
+    """
+    Processa o corpus com o pipeline de main.py contra a API simulada e
+    grava as métricas em <diretorio_resultados>/<data>_<commit>_<modo>.json.
+
+    Deve rodar em um processo novo: as configurações de main.py são lidas do
+    ambiente na importação, que acontece aqui depois de apontar o cliente da
+    OpenAI para a API simulada.
+
+    Args:
+        corpus (str): Diretório gerado por gerar_corpus
+        modo (str): "sequencial", "paralelo" ou "empacotado"
+        workers (int): Processos de extração no modo paralelo
+        latencia_ms (float): Latência média de cada chamada ao LLM simulado
+        variacao_ms (float): Variação uniforme (±) da latência
+        com_cache (bool): Mantém o cache de OCR em disco (padrão: desligado, mede o OCR de verdade)
+        diretorio_resultados (str): Onde gravar o JSON
+
+    Returns:
+        dict: Resultado gravado no JSON
+    """
+    import sqlite3
+
+    os.environ["OPENAI_BASE_URL"] = iniciar_api_simulada(latencia_ms, variacao_ms)
+    os.environ["OPENAI_API_KEY"] = "benchmark"
+    if not com_cache:
+        os.environ["CACHE_EXTRACAO"] = "0"
+        os.environ["MINIATURAS"] = "0"
+
+    import main
+
+    trabalho = tempfile.mkdtemp(prefix="benchmark_")
+    db_path = os.path.join(trabalho, "classificacoes.db")
+    saida = os.path.join(trabalho, "saida")
+    main.inicializar_banco_dados(db_path)
+
+    caminho_gabarito = os.path.join(corpus, "gabarito.json")
+    with open(caminho_gabarito, encoding="utf-8") as f:
+        gabarito = json.load(f)["documentos"]
+
+    inicio = time.perf_counter()
+    inicio_cpu = time.process_time()
+    if modo == "paralelo":
+        resultados = main.processar_diretorio_paralelo(
+            corpus, saida, workers=workers, forcar=True, db_path=db_path)
+    elif modo == "empacotado":
+        resultados = main.processar_diretorio_empacotado(corpus, saida, forcar=True, db_path=db_path)
+    else:
+        resultados = main.processar_diretorio_amostragem(corpus, saida, forcar=True, db_path=db_path)
+    duracao = time.perf_counter() - inicio
+    cpu = time.process_time() - inicio_cpu
+
+    main.sincronizar_escritor(db_path)
+    conn = sqlite3.connect(db_path)
+    try:
+        tempos_arquivos = [linha[0] for linha in conn.execute(
+            "SELECT segundos FROM tempos_etapas WHERE etapa = 'arquivo'")]
+        etapas = {linha[0]: {"segundos": round(linha[1], 3), "cpu_segundos": round(linha[2], 3),
+                             "chamadas": linha[3], "tentativas": linha[4]}
+                  for linha in conn.execute('''
+                      SELECT etapa, SUM(segundos), SUM(cpu_segundos), SUM(chamadas), SUM(tentativas)
+                      FROM tempos_etapas GROUP BY etapa ORDER BY etapa''')}
+        status = dict(conn.execute(
+            "SELECT status, COUNT(*) FROM execucao_arquivos GROUP BY status").fetchall())
+        origens = dict(conn.execute('''
+            SELECT COALESCE(origem_classificacao, 'llm'), COUNT(*) FROM classificacoes
+            GROUP BY COALESCE(origem_classificacao, 'llm')''').fetchall())
+    finally:
+        conn.close()
+
+    paginas = sum(d["paginas"] for d in gabarito.values())
+    tokens = sum(r["tokens_entrada"] + r["tokens_saida"] for r in resultados)
+    acertos = sum(1 for r in resultados
+                  if gabarito.get(r["nome_arquivo"], {}).get("tipo") == r["classificacao"]["tipo"])
+
+    resultado = {
+        "versao": versao_codigo(),
+        "data": datetime.now().isoformat(timespec="seconds"),
+        "configuracao": {"modo": modo, "workers": workers if modo == "paralelo" else 1,
+                         "latencia_ms": latencia_ms, "variacao_ms": variacao_ms,
+                         "com_cache": com_cache, "python": sys.version.split()[0],
+                         "cpus": os.cpu_count()},
+        "corpus": {"diretorio": corpus, "arquivos": len(gabarito), "paginas": paginas,
+                   "variantes": {v: sum(1 for d in gabarito.values() if d["variante"] == v)
+                                 for v in sorted({d["variante"] for d in gabarito.values()})}},
+        "metricas": {
+            "segundos": round(duracao, 3),
+            "cpu_segundos_processo": round(cpu, 3),
+            "paginas_por_segundo": round(paginas / duracao, 3) if duracao else 0.0,
+            "arquivos_por_segundo": round(len(gabarito) / duracao, 3) if duracao else 0.0,
+            "latencia_arquivo_p50": round(percentil(tempos_arquivos, 50), 3),
+            "latencia_arquivo_p95": round(percentil(tempos_arquivos, 95), 3),
+            "latencia_arquivo_max": round(max(tempos_arquivos, default=0.0), 3),
+            "pico_rss_mb": pico_rss_mb(),
+            "tokens_por_documento": round(tokens / len(resultados), 1) if resultados else 0.0,
+            "acuracia": round(acertos / len(gabarito), 4) if gabarito else 0.0,
+            "status_arquivos": status,
+            "origens": origens,
+        },
+        "etapas": etapas,
+    }
+
+    os.makedirs(diretorio_resultados, exist_ok=True)
+    nome = f"{datetime.now():%Y%m%d_%H%M%S}_{resultado['versao'] or 'sem_git'}_{modo}.json"
+    caminho = os.path.join(diretorio_resultados, nome.replace("+", "_alterado"))
+    with open(caminho, "w", encoding="utf-8") as f:
+        json.dump(resultado, f, indent=2, ensure_ascii=False)
+    print(f"Resultado gravado em {caminho}")
+    return resultado
+
+
+def comparar_resultados(caminho_antigo, caminho_novo):
+    """
+    Compara as métricas numéricas de dois JSONs do benchmark.
+
+    Returns:
+        list: (métrica, valor antigo, valor novo, variação percentual ou None)
+    """
+    with open(caminho_antigo, encoding="utf-8") as f:
+        antigo = json.load(f)
+    with open(caminho_novo, encoding="utf-8") as f:
+        novo = json.load(f)
+
+    def _numericas(metricas, prefixo=""):
+        valores = {}
+        for chave, valor in metricas.items():
+            if isinstance(valor, dict):
+                valores.update(_numericas(valor, f"{prefixo}{chave}."))
+            elif isinstance(valor, (int, float)) and not isinstance(valor, bool):
+                valores[prefixo + chave] = valor
+        return valores
+
+    valores_antigos = _numericas(antigo["metricas"])
+    valores_novos = _numericas(novo["metricas"])
+    linhas = []
+    for chave in sorted(set(valores_antigos) | set(valores_novos)):
+        valor_antigo = valores_antigos.get(chave)
+        valor_novo = valores_novos.get(chave)
+        variacao = None
+        if valor_antigo and valor_novo is not None:
+            variacao = (valor_novo - valor_antigo) / valor_antigo * 100
+        linhas.append((chave, valor_antigo, valor_novo, variacao))
+    return linhas
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        description="Benchmark do pipeline com corpus sintético e LLM simulado.")
+    subcomandos = parser.add_subparsers(dest="comando", required=True)
+
+    def _argumentos_corpus(subparser):
+        subparser.add_argument("--corpus", default=DIRETORIO_CORPUS_BENCHMARK)
+        subparser.add_argument("--documentos", type=int, default=40,
+                               help="Documentos de uma página com camada de texto")
+        subparser.add_argument("--digitalizados", type=int, default=10,
+                               help="Documentos de uma página só com imagem (OCR)")
+        subparser.add_argument("--grandes", type=int, default=2,
+                               help="Documentos com várias páginas")
+        subparser.add_argument("--paginas-grandes", type=int, default=40)
+        subparser.add_argument("--semente", type=int, default=42)
+
+    gerar = subcomandos.add_parser("gerar", help="Gera o corpus sintético")
+    _argumentos_corpus(gerar)
+
+    executar = subcomandos.add_parser("executar", help="Gera o corpus (se preciso) e mede o pipeline")
+    _argumentos_corpus(executar)
+    executar.add_argument("--modo", choices=["sequencial", "paralelo", "empacotado"], default="sequencial")
+    executar.add_argument("--workers", type=int, default=4)
+    executar.add_argument("--latencia-ms", type=float, default=300.0)
+    executar.add_argument("--variacao-ms", type=float, default=100.0)
+    executar.add_argument("--com-cache", action="store_true",
+                          help="Mantém o cache de OCR em disco entre execuções")
+    executar.add_argument("--regerar", action="store_true", help="Gera o corpus mesmo se já existir")
+    executar.add_argument("--resultados", default=DIRETORIO_RESULTADOS_BENCHMARK)
+
+    comparar = subcomandos.add_parser("comparar", help="Compara dois resultados em JSON")
+    comparar.add_argument("antigo")
+    comparar.add_argument("novo")
+    args = parser.parse_args()
+
+    if args.comando == "comparar":
+        for chave, antigo, novo, variacao in comparar_resultados(args.antigo, args.novo):
+            texto_variacao = f"{variacao:+.1f}%" if variacao is not None else "-"
+            print(f"{chave:40} {antigo!s:>12} {novo!s:>12} {texto_variacao:>9}")
+    else:
+        if args.comando == "gerar" or args.regerar or \
+                not os.path.exists(os.path.join(args.corpus, "gabarito.json")):
+            gerar_corpus(args.corpus, args.documentos, args.digitalizados, args.grandes,
+                         args.paginas_grandes, args.semente)
+        if args.comando == "executar":
+            resultado = executar_benchmark(args.corpus, args.modo, args.workers, args.latencia_ms,
+                                           args.variacao_ms, args.com_cache, args.resultados)
+            print(json.dumps(resultado["metricas"], indent=2, ensure_ascii=False))
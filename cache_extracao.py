@@ -0,0 +1,240 @@
+import argparse
+import hashlib
+import os
+import tempfile
+import time
+
+
+# Local e orçamento de disco padrão do cache (sobrescritos por
+# DIRETORIO_CACHE_EXTRACAO e MAX_BYTES_CACHE_EXTRACAO no .env)
+DIRETORIO_CACHE_EXTRACAO = "cache_extracao"
+MAX_BYTES_CACHE_EXTRACAO = 2 * 1024 ** 3
+
+# Temporários de _gravar_atomico mais novos que isto podem estar sendo gravados
+# por outro worker e não são podados; os mais velhos são sobras de gravações interrompidas
+SEGUNDOS_GRACA_TEMPORARIOS = 3600
+
+# Intervalo para recontar o tamanho em disco: a contagem local só soma as
+# gravações deste processo, e vários workers gravando no mesmo diretório
+# passariam do orçamento sem perceber
+SEGUNDOS_RECONTAGEM_TAMANHO = 60
+
+
+def calcular_hash_arquivo(caminho, tamanho_bloco=1024 * 1024):
+    """
+    Calcula o SHA-256 de um arquivo lendo-o em blocos.
+
+    Args:
+        caminho (str): Caminho do arquivo
+        tamanho_bloco (int): Bytes lidos por vez
+
+    Returns:
+        str: Hash hexadecimal
+    """
+    sha = hashlib.sha256()
+    with open(caminho, "rb") as f:
+        for bloco in iter(lambda: f.read(tamanho_bloco), b""):
+            sha.update(bloco)
+    return sha.hexdigest()
+
+
+class CacheExtracao:
+    """
+    Cache em disco do resultado do OCR por página.
+
+    Cada entrada é identificada por (SHA-256 do PDF, página, DPI, idioma e
+    configuração do Tesseract) e guarda o texto e, opcionalmente, a imagem
+    rasterizada. Quando o total em disco passa de max_bytes, as entradas
+    acessadas há mais tempo são removidas primeiro.
+    """
+
+    def __init__(self, diretorio=None, max_bytes=None, salvar_imagens=False):
+        """
+        Args:
+            diretorio (str): Diretório raiz do cache
+            max_bytes (int): Orçamento de disco em bytes
+            salvar_imagens (bool): Se True, guarda também a imagem PNG de cada página
+        """
+        self.diretorio = diretorio or os.getenv(
+            "DIRETORIO_CACHE_EXTRACAO", DIRETORIO_CACHE_EXTRACAO)
+        self.max_bytes = max_bytes if max_bytes is not None else int(
+            os.getenv("MAX_BYTES_CACHE_EXTRACAO", MAX_BYTES_CACHE_EXTRACAO))
+        self.salvar_imagens = salvar_imagens
+        self._tamanho = None
+        self._recontado_em = 0.0
+        os.makedirs(self.diretorio, exist_ok=True)
+
+    @staticmethod
+    def chave(hash_arquivo, pagina, dpi, lang, config=""):
+        """Monta a chave de uma página a partir dos parâmetros que influenciam o OCR."""
+        identificador = f"{hash_arquivo}:{pagina}:{dpi}:{lang}:{config}"
+        return hashlib.sha256(identificador.encode("utf-8")).hexdigest()
+
+    def _caminho(self, chave, extensao):
+        return os.path.join(self.diretorio, chave[:2], f"{chave}{extensao}")
+
+    def _gravar_atomico(self, caminho, dados):
+        """Grava em arquivo temporário e renomeia, para que workers concorrentes nunca leiam entradas pela metade."""
+        os.makedirs(os.path.dirname(caminho), exist_ok=True)
+        fd, temporario = tempfile.mkstemp(dir=os.path.dirname(caminho), suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(dados)
+            os.replace(temporario, caminho)
+        except BaseException:
+            if os.path.exists(temporario):
+                os.remove(temporario)
+            raise
+
+    def _tocar(self, caminho):
+        """
+        Atualiza o horário de acesso usado no despejo LRU.
+
+        Returns:
+            bool: False se a entrada foi podada por outro worker nesse meio-tempo
+        """
+        try:
+            os.utime(caminho)
+        except FileNotFoundError:
+            return False
+        return True
+
+    def _contabilizar(self, gravados):
+        """
+        Soma os bytes gravados ao tamanho do cache, recontando o diretório a
+        cada SEGUNDOS_RECONTAGEM_TAMANHO, e poda se o orçamento foi ultrapassado.
+        """
+        agora = time.monotonic()
+        if self._tamanho is None or agora - self._recontado_em >= SEGUNDOS_RECONTAGEM_TAMANHO:
+            self._tamanho = self.tamanho_total()
+            self._recontado_em = agora
+        else:
+            self._tamanho += gravados
+
+        if self._tamanho > self.max_bytes:
+            # Liberar uma folga para não podar a cada nova gravação
+            self.podar(int(self.max_bytes * 0.9))
+
+    def obter_texto(self, chave):
+        """
+        Returns:
+            str: Texto armazenado para a chave, ou None se não houver entrada
+        """
+        caminho = self._caminho(chave, ".txt")
+        try:
+            with open(caminho, "r", encoding="utf-8") as f:
+                texto = f.read()
+        except FileNotFoundError:
+            return None
+        # O texto já foi lido: serve mesmo que a entrada tenha sido podada agora
+        self._tocar(caminho)
+        return texto
+
+    def obter_imagem(self, chave):
+        """
+        Returns:
+            str: Caminho da imagem armazenada para a chave, ou None se não houver
+        """
+        caminho = self._caminho(chave, ".png")
+        if not self._tocar(caminho):
+            return None
+        return caminho
+
+    def gravar(self, chave, texto, imagem=None):
+        """
+        Armazena o texto (e a imagem, se salvar_imagens estiver ativo) de uma página.
+
+        Args:
+            chave (str): Chave retornada por CacheExtracao.chave
+            texto (str): Texto extraído pelo OCR
+            imagem (PIL.Image.Image): Imagem rasterizada da página (opcional)
+        """
+        dados = texto.encode("utf-8")
+        self._gravar_atomico(self._caminho(chave, ".txt"), dados)
+        gravados = len(dados)
+
+        if imagem is not None and self.salvar_imagens:
+            import io
+            buffer = io.BytesIO()
+            imagem.save(buffer, "PNG")
+            self._gravar_atomico(self._caminho(chave, ".png"), buffer.getvalue())
+            gravados += buffer.tell()
+
+        self._contabilizar(gravados)
+
+    def _entradas(self):
+        """Lista (último acesso, tamanho, caminho) de todos os arquivos do cache."""
+        entradas = []
+        for raiz, _, arquivos in os.walk(self.diretorio):
+            for nome in arquivos:
+                caminho = os.path.join(raiz, nome)
+                try:
+                    info = os.stat(caminho)
+                except FileNotFoundError:
+                    continue
+                entradas.append((info.st_mtime, info.st_size, caminho))
+        return entradas
+
+    def tamanho_total(self):
+        """Retorna o total de bytes ocupados pelo cache."""
+        return sum(tamanho for _, tamanho, _ in self._entradas())
+
+    def podar(self, max_bytes=None):
+        """
+        Remove as entradas acessadas há mais tempo até o cache caber no limite.
+
+        Args:
+            max_bytes (int): Limite em bytes (padrão: o orçamento do cache)
+
+        Returns:
+            tuple: (arquivos removidos, bytes liberados)
+        """
+        limite = self.max_bytes if max_bytes is None else max_bytes
+        entradas = sorted(self._entradas())
+        total = sum(tamanho for _, tamanho, _ in entradas)
+        limite_temporarios = time.time() - SEGUNDOS_GRACA_TEMPORARIOS
+
+        removidos = 0
+        liberados = 0
+        for acesso, tamanho, caminho in entradas:
+            if total <= limite:
+                break
+            if caminho.endswith(".tmp") and acesso > limite_temporarios:
+                continue
+            try:
+                os.remove(caminho)
+            except FileNotFoundError:
+                pass
+            total -= tamanho
+            liberados += tamanho
+            removidos += 1
+
+        self._tamanho = total
+        return removidos, liberados
+
+
+if __name__ == "__main__":
+    from dotenv import load_dotenv
+    load_dotenv()
+
+    parser = argparse.ArgumentParser(
+        description="Poda o cache de extração (texto/imagens de OCR por página).")
+    parser.add_argument("--diretorio", default=None,
+                        help="Diretório do cache (padrão: DIRETORIO_CACHE_EXTRACAO)")
+    parser.add_argument("--limite-mb", type=float, default=None,
+                        help="Tamanho máximo após a poda, em MB (padrão: MAX_BYTES_CACHE_EXTRACAO)")
+    parser.add_argument("--limpar", action="store_true",
+                        help="Remove todas as entradas")
+    args = parser.parse_args()
+
+    cache = CacheExtracao(args.diretorio)
+    antes = cache.tamanho_total()
+    if args.limpar:
+        limite = 0
+    elif args.limite_mb is not None:
+        limite = int(args.limite_mb * 1024 * 1024)
+    else:
+        limite = None
+    removidos, liberados = cache.podar(limite)
+    print(f"Cache de extração: {antes / 1024 ** 2:.1f} MB -> "
+          f"{(antes - liberados) / 1024 ** 2:.1f} MB ({removidos} arquivo(s) removido(s))")
@@ -0,0 +1,283 @@
+import asyncio
+import random
+import re
+import threading
+
+import openai
+from openai import AsyncOpenAI
+
+from classificador_knn import formatar_exemplos_few_shot
+from main import (FORMATO_RESPOSTA_CLASSIFICACAO, MODELO_CLASSIFICACAO, PROMPT_CLASSIFICACAO_PAGINA,
+                  PROMPT_REPARO_CLASSIFICACAO, SAIDA_ESTRUTURADA, TAMANHO_TRECHO_REPARO,
+                  interpretar_resposta_classificacao, registrar_metrica_resposta)
+from telemetria import medir_etapa
+
+
+# Erros que valem nova tentativa (os demais, como 400/401, são repassados)
+ERROS_TRANSITORIOS = (
+    openai.RateLimitError,
+    openai.APIConnectionError,
+    openai.APITimeoutError,
+    openai.InternalServerError,
+)
+
+
+def converter_duracao(valor):
+    """
+    Converte as durações dos cabeçalhos de rate limit da OpenAI
+    ("20ms", "1s", "6m0s", "1h2m3.5s" ou apenas segundos) em segundos.
+
+    Args:
+        valor (str): Valor do cabeçalho
+
+    Returns:
+        float: Duração em segundos (0.0 se o valor não puder ser interpretado)
+    """
+    if not valor:
+        return 0.0
+    try:
+        return float(valor)
+    except ValueError:
+        pass
+
+    unidades = {"h": 3600.0, "m": 60.0, "s": 1.0, "ms": 0.001}
+    total = 0.0
+    for numero, unidade in re.findall(r"([\d.]+)(ms|h|m|s)", valor):
+        total += float(numero) * unidades[unidade]
+    return total
+
+
+class ClassificadorAsync:
+    """
+    Cliente assíncrono de classificação de páginas.
+
+    Mantém um único AsyncOpenAI e o prompt de classificar_pagina já compilado,
+    limita as requisições simultâneas com um semáforo, pausa todas as chamadas
+    quando os cabeçalhos x-ratelimit-* indicam cota esgotada e refaz erros
+    transitórios com backoff exponencial e jitter.
+
+    O endpoint pode ser trocado por base_url (ou OPENAI_BASE_URL no .env),
+    o que permite rodar contra um servidor local que imite a API de chat.
+    """
+
+    def __init__(self, modelo=MODELO_CLASSIFICACAO, max_concorrencia=8, max_tentativas=6,
+                 espera_base=1.0, espera_maxima=60.0, base_url=None, api_key=None, timeout=60.0):
+        """
+        Args:
+            modelo (str): Modelo de chat usado na classificação
+            max_concorrencia (int): Máximo de requisições em andamento
+            max_tentativas (int): Tentativas por página antes de desistir
+            espera_base (float): Espera inicial do backoff, em segundos
+            espera_maxima (float): Limite da espera entre tentativas, em segundos
+            base_url (str): URL base da API (None usa o padrão do SDK)
+            api_key (str): Chave da API (None usa OPENAI_API_KEY)
+            timeout (float): Timeout de cada requisição, em segundos
+        """
+        self.modelo = modelo
+        self.max_tentativas = max_tentativas
+        self.espera_base = espera_base
+        self.espera_maxima = espera_maxima
+        # As novas tentativas são feitas aqui, e não pelo SDK, para respeitar a pausa global
+        self.client = AsyncOpenAI(
+            base_url=base_url, api_key=api_key, timeout=timeout, max_retries=0)
+        self._semaforo = asyncio.Semaphore(max_concorrencia)
+        self._pausa_ate = 0.0
+        self.estatisticas = {"requisicoes": 0,
+                             "novas_tentativas": 0, "pausas_rate_limit": 0}
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.fechar()
+
+    async def fechar(self):
+        await self.client.close()
+
+    async def _aguardar_pausa(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            restante = self._pausa_ate - loop.time()
+            if restante <= 0:
+                return
+            await asyncio.sleep(restante)
+
+    def _pausar(self, segundos):
+        """Adia o envio de novas requisições por todas as tarefas."""
+        if segundos <= 0:
+            return
+        loop = asyncio.get_running_loop()
+        if loop.time() + segundos > self._pausa_ate:
+            self._pausa_ate = loop.time() + segundos
+            self.estatisticas["pausas_rate_limit"] += 1
+
+    def _observar_cabecalhos(self, headers):
+        """Pausa as próximas requisições quando a cota de requisições ou tokens se esgota."""
+        for recurso in ("requests", "tokens"):
+            restante = headers.get(f"x-ratelimit-remaining-{recurso}")
+            if restante is None:
+                continue
+            try:
+                restante = int(restante)
+            except ValueError:
+                continue
+            if restante <= 0:
+                self._pausar(converter_duracao(
+                    headers.get(f"x-ratelimit-reset-{recurso}")))
+
+    def _espera_nova_tentativa(self, tentativa, erro):
+        """Usa retry-after quando o provedor informa; senão backoff exponencial com jitter total."""
+        headers = getattr(getattr(erro, "response", None), "headers", None) or {}
+        if headers.get("retry-after-ms"):
+            return converter_duracao(headers["retry-after-ms"]) / 1000.0
+        if headers.get("retry-after"):
+            return converter_duracao(headers["retry-after"])
+        limite = min(self.espera_maxima, self.espera_base * (2 ** tentativa))
+        return random.uniform(0, limite)
+
+    async def _completar(self, conteudo):
+        """Envia uma mensagem ao modelo com as novas tentativas e pausas de rate limit."""
+        mensagens = [{"role": "user", "content": conteudo}]
+        extras = {"response_format": FORMATO_RESPOSTA_CLASSIFICACAO} if SAIDA_ESTRUTURADA else {}
+
+        for tentativa in range(self.max_tentativas):
+            async with self._semaforo:
+                await self._aguardar_pausa()
+                try:
+                    self.estatisticas["requisicoes"] += 1
+                    bruta = await self.client.chat.completions.with_raw_response.create(
+                        model=self.modelo, messages=mensagens, temperature=0, **extras)
+                except ERROS_TRANSITORIOS as e:
+                    if tentativa == self.max_tentativas - 1:
+                        raise
+                    espera = self._espera_nova_tentativa(tentativa, e)
+                    if isinstance(e, openai.RateLimitError):
+                        # Um 429 afeta todas as tarefas, não só esta
+                        self._pausar(espera)
+                    self.estatisticas["novas_tentativas"] += 1
+                    print(f"[LLM] {type(e).__name__}; nova tentativa em {espera:.1f}s "
+                          f"({tentativa + 1}/{self.max_tentativas})")
+                else:
+                    self._observar_cabecalhos(bruta.headers)
+                    resposta = bruta.parse()
+                    uso = resposta.usage
+                    return (resposta.choices[0].message.content or "",
+                            uso.prompt_tokens if uso else 0,
+                            uso.completion_tokens if uso else 0)
+
+            # Esperar fora do semáforo para não bloquear as outras tarefas
+            await asyncio.sleep(espera)
+
+    async def classificar(self, texto_pagina, exemplos=None):
+        """
+        Versão assíncrona de classificar_pagina, inclusive com o reparo das
+        respostas fora do esquema.
+
+        Args:
+            texto_pagina (str): Texto extraído da página do documento
+            exemplos (list): Exemplos few-shot [{"tipo", "texto"}] incluídos no prompt (opcional)
+
+        Returns:
+            dict: Dicionário com a classificação, índice de certeza e métricas de tokens
+        """
+        resultado = interpretar_resposta_classificacao(*await self._completar(
+            PROMPT_CLASSIFICACAO_PAGINA.format(conteudo=texto_pagina,
+                                               exemplos=formatar_exemplos_few_shot(exemplos))))
+        if "erro" not in resultado:
+            return resultado
+
+        registrar_metrica_resposta("reparos")
+        text, tokens_entrada, tokens_saida = await self._completar(PROMPT_REPARO_CLASSIFICACAO.format(
+            motivo=resultado["erro"], resposta=(resultado.get("raw") or "")[:1000],
+            trecho=texto_pagina[:TAMANHO_TRECHO_REPARO]))
+        reparado = interpretar_resposta_classificacao(
+            text, resultado["tokens_entrada"] + tokens_entrada, resultado["tokens_saida"] + tokens_saida)
+        if "erro" in reparado:
+            registrar_metrica_resposta("reparos_sem_sucesso")
+        return reparado
+
+    async def classificar_lote(self, textos):
+        """
+        Classifica vários textos concorrentemente.
+
+        Args:
+            textos (list): Textos das páginas
+
+        Returns:
+            list: Classificações na mesma ordem dos textos; falhas definitivas
+                  viram {"erro": ...} para não derrubar o lote inteiro
+        """
+        async def _classificar(texto):
+            try:
+                return await self.classificar(texto)
+            except Exception as e:
+                print(f"[LLM] Falha definitiva na classificação: {str(e)}")
+                return {"erro": str(e), "tokens_entrada": 0, "tokens_saida": 0}
+
+        return await asyncio.gather(*(_classificar(t) for t in textos))
+
+
+def classificar_textos(textos, **kwargs):
+    """
+    Atalho síncrono: classifica uma lista de textos com um ClassificadorAsync.
+
+    Args:
+        textos (list): Textos das páginas
+        **kwargs: Parâmetros repassados para ClassificadorAsync
+
+    Returns:
+        list: Classificações na mesma ordem dos textos
+    """
+    async def _executar():
+        async with ClassificadorAsync(**kwargs) as classificador:
+            return await classificador.classificar_lote(textos)
+
+    return asyncio.run(_executar())
+
+
+class ClassificadorAsyncEmThread:
+    """
+    Um ClassificadorAsync rodando no seu próprio event loop, em uma thread
+    daemon, para ser usado por código síncrono: várias threads (o pool de
+    classificação do modo paralelo) compartilham o mesmo cliente, o mesmo
+    limite de concorrência e a mesma pausa de rate limit.
+    """
+
+    def __init__(self, **kwargs):
+        """
+        Args:
+            **kwargs: Parâmetros repassados para ClassificadorAsync
+        """
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(
+            target=self._loop.run_forever, name="classificador-async", daemon=True)
+        self._thread.start()
+        self.classificador = self._executar(self._criar(kwargs))
+
+    async def _criar(self, kwargs):
+        # O semáforo e o cliente precisam nascer dentro do loop que vai usá-los
+        return ClassificadorAsync(**kwargs)
+
+    def _executar(self, corrotina):
+        return asyncio.run_coroutine_threadsafe(corrotina, self._loop).result()
+
+    def classificar(self, texto_pagina, exemplos=None):
+        """
+        Mesma assinatura de classificar_pagina; bloqueia a thread chamadora
+        até a resposta (com novas tentativas e reparo) chegar.
+        """
+        with medir_etapa("llm"):
+            return self._executar(self.classificador.classificar(texto_pagina, exemplos))
+
+    def fechar(self):
+        """
+        Fecha o cliente e encerra o event loop.
+
+        Returns:
+            dict: Estatísticas de requisições, novas tentativas e pausas
+        """
+        self._executar(self.classificador.fechar())
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._loop.close()
+        return self.classificador.estatisticas
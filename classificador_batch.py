@@ -0,0 +1,478 @@
+import hashlib
+import json
+import os
+import sqlite3
+import time
+
+from openai import OpenAI
+
+from main import (FORMATO_RESPOSTA_CLASSIFICACAO, MODELO_CLASSIFICACAO,
+                  PROMPT_CLASSIFICACAO_PAGINA, SAIDA_ESTRUTURADA, atualizar_status_arquivo,
+                  classificar_sem_llm, executar_escrita, extrair_texto_combinado, finalizar_execucao,
+                  formatar_exemplos_few_shot, gravar_classificacao_llm,
+                  interpretar_resposta_classificacao,
+                  preparar_execucao, registrar_resultado, reparar_classificacao)
+from persistencia import sincronizar_escritor
+
+
+# Diretório dos arquivos JSONL enviados e recebidos da Batch API
+DIRETORIO_LOTES_BATCH = "lotes_batch"
+
+# Limite de requisições por arquivo de entrada da Batch API
+MAX_REQUISICOES_BATCH = 50000
+
+# Status finais de um batch: depois deles o resultado não muda mais
+STATUS_FINAIS_BATCH = ("completed", "failed", "expired", "cancelled")
+
+
+def criar_cliente_batch(base_url=None, api_key=None):
+    """
+    Cria o cliente da API. base_url (ou OPENAI_BASE_URL no .env) permite
+    apontar para api_simulada.py em vez da OpenAI.
+    """
+    return OpenAI(base_url=base_url, api_key=api_key)
+
+
+def montar_requisicao_batch(custom_id, texto, exemplos=None, modelo=MODELO_CLASSIFICACAO):
+    """
+    Monta uma linha do JSONL da Batch API com o mesmo prompt de classificar_pagina.
+
+    Args:
+        custom_id (str): Identificador da requisição, devolvido junto com a resposta
+        texto (str): Texto do documento
+        exemplos (list): Exemplos few-shot do kNN (opcional)
+        modelo (str): Modelo de chat
+
+    Returns:
+        dict: Requisição no formato da Batch API
+    """
+    conteudo = PROMPT_CLASSIFICACAO_PAGINA.format(
+        conteudo=texto, exemplos=formatar_exemplos_few_shot(exemplos))
+    corpo = {
+        "model": modelo,
+        "messages": [{"role": "user", "content": conteudo}],
+        "temperature": 0
+    }
+    if SAIDA_ESTRUTURADA:
+        corpo["response_format"] = FORMATO_RESPOSTA_CLASSIFICACAO
+    return {
+        "custom_id": custom_id,
+        "method": "POST",
+        "url": "/v1/chat/completions",
+        "body": corpo
+    }
+
+
+def preparar_lote_batch(diretorio_base="amostragem/Parte_1/29675", diretorio_saida="amostragem/Parte_1/OUTPUT",
+                        diretorio_lotes=None, forcar=False, execucao_id=None, db_path="classificacoes.db"):
+    """
+    Extrai o texto de todos os arquivos pendentes e escreve os JSONL de requisições.
+
+    Os arquivos resolvidos sem o LLM (cache, pré-classificador, kNN) são
+    gravados na hora; os demais viram requisições com custom_id
+    "<execução>-<hash do caminho>", registradas em lote_batch_itens para que a
+    resposta possa ser ligada de volta ao arquivo. O custom_id não depende da
+    ordem dos pendentes, então retomar a execução reescreve o mesmo item; um
+    arquivo que já está num batch enviado e sem resposta não é reenviado.
+
+    Args:
+        diretorio_base (str): Caminho base para o diretório de amostragem
+        diretorio_saida (str): Diretório dos arquivos JSON de resultado
+        diretorio_lotes (str): Onde gravar os JSONL (padrão: DIRETORIO_LOTES_BATCH do .env)
+        forcar (bool): Reprocessa também os arquivos já classificados
+        execucao_id (str): Execução anterior a retomar (opcional)
+        db_path (str): Caminho para o arquivo do banco de dados
+
+    Returns:
+        tuple: (identificador da execução, lista de caminhos dos JSONL)
+    """
+    diretorio_lotes = diretorio_lotes or os.getenv(
+        "DIRETORIO_LOTES_BATCH", DIRETORIO_LOTES_BATCH)
+    os.makedirs(diretorio_lotes, exist_ok=True)
+    os.makedirs(diretorio_saida, exist_ok=True)
+
+    execucao_id, pendentes = preparar_execucao(
+        diretorio_base, forcar=forcar, execucao_id=execucao_id, db_path=db_path)
+
+    caminhos = []
+    arquivo_jsonl = None
+    requisicoes_no_arquivo = 0
+
+    conn = sqlite3.connect(db_path)
+    try:
+        for arquivo_pdf, hash_pdf, substituir in pendentes:
+            aberto = conn.execute('''
+                SELECT execucao_id, lote_id FROM lote_batch_itens
+                WHERE caminho_arquivo = ? AND status = 'enviado'
+            ''', (arquivo_pdf,)).fetchone()
+            if aberto is not None:
+                print(f"  Aguardando o batch {aberto[1]}: {os.path.basename(arquivo_pdf)}")
+                if aberto[0] != execucao_id:
+                    atualizar_status_arquivo(
+                        execucao_id, arquivo_pdf, "falhou",
+                        erro=f"aguardando o batch {aberto[1]} da execução {aberto[0]}", db_path=db_path)
+                continue
+
+            print(f"  Extraindo: {os.path.basename(arquivo_pdf)}")
+            try:
+                texto = extrair_texto_combinado(arquivo_pdf)
+                atualizar_status_arquivo(
+                    execucao_id, arquivo_pdf, "extraido", db_path=db_path)
+
+                classificacao, exemplos = classificar_sem_llm(texto, db_path)
+                if classificacao is not None:
+                    registrar_resultado(arquivo_pdf, classificacao, diretorio_saida,
+                                        hash_arquivo=hash_pdf, substituir=substituir,
+                                        db_path=db_path, texto=texto)
+                    atualizar_status_arquivo(
+                        execucao_id, arquivo_pdf, "classificado", db_path=db_path)
+                    continue
+
+                if arquivo_jsonl is None or requisicoes_no_arquivo >= MAX_REQUISICOES_BATCH:
+                    if arquivo_jsonl is not None:
+                        arquivo_jsonl.close()
+                    caminho = os.path.join(
+                        diretorio_lotes, f"{execucao_id}_{len(caminhos) + 1:03d}.jsonl")
+                    arquivo_jsonl = open(caminho, "w", encoding="utf-8")
+                    caminhos.append(caminho)
+                    requisicoes_no_arquivo = 0
+
+                custom_id = f"{execucao_id}-{hashlib.sha256(arquivo_pdf.encode('utf-8')).hexdigest()[:16]}"
+                arquivo_jsonl.write(json.dumps(
+                    montar_requisicao_batch(custom_id, texto, exemplos), ensure_ascii=False) + "\n")
+                requisicoes_no_arquivo += 1
+
+                executar_escrita('''
+                    INSERT INTO lote_batch_itens
+                    (custom_id, execucao_id, caminho_arquivo, hash_arquivo, substituir, texto, status)
+                    VALUES (?, ?, ?, ?, ?, ?, 'preparado')
+                    ON CONFLICT(custom_id) DO UPDATE SET
+                        lote_id = NULL,
+                        execucao_id = excluded.execucao_id,
+                        caminho_arquivo = excluded.caminho_arquivo,
+                        hash_arquivo = excluded.hash_arquivo,
+                        substituir = excluded.substituir,
+                        texto = excluded.texto,
+                        status = 'preparado'
+                ''', (custom_id, execucao_id, arquivo_pdf, hash_pdf, int(substituir), texto), db_path)
+            except Exception as e:
+                print(f"    Erro ao processar {arquivo_pdf}: {str(e)}")
+                atualizar_status_arquivo(
+                    execucao_id, arquivo_pdf, "falhou", erro=str(e), db_path=db_path)
+    finally:
+        if arquivo_jsonl is not None:
+            arquivo_jsonl.close()
+        conn.close()
+
+    # enviar_lote_batch atualiza os itens logo em seguida
+    sincronizar_escritor(db_path)
+    print(f"Execução {execucao_id}: {len(caminhos)} arquivo(s) JSONL preparado(s)")
+    return execucao_id, caminhos
+
+
+def enviar_lote_batch(caminho_jsonl, execucao_id, diretorio_saida, client=None, db_path="classificacoes.db"):
+    """
+    Envia um JSONL para a Batch API e registra o batch criado.
+
+    Args:
+        caminho_jsonl (str): Arquivo de requisições gerado por preparar_lote_batch
+        execucao_id (str): Execução a que as requisições pertencem
+        diretorio_saida (str): Diretório dos arquivos JSON de resultado
+        client (OpenAI): Cliente da API (padrão: criar_cliente_batch())
+        db_path (str): Caminho para o arquivo do banco de dados
+
+    Returns:
+        str: Identificador do batch
+    """
+    client = client or criar_cliente_batch()
+
+    with open(caminho_jsonl, "rb") as f:
+        arquivo = client.files.create(file=f, purpose="batch")
+    batch = client.batches.create(input_file_id=arquivo.id, endpoint="/v1/chat/completions",
+                                  completion_window="24h")
+
+    with open(caminho_jsonl, "r", encoding="utf-8") as f:
+        custom_ids = [(batch.id, json.loads(linha)["custom_id"]) for linha in f if linha.strip()]
+
+    executar_escrita('''
+        INSERT INTO lotes_batch (id, execucao_id, arquivo_entrada, diretorio_saida, status)
+        VALUES (?, ?, ?, ?, ?)
+    ''', (batch.id, execucao_id, caminho_jsonl, diretorio_saida, batch.status), db_path)
+    for parametros in custom_ids:
+        executar_escrita('''
+            UPDATE lote_batch_itens SET lote_id = ?, status = 'enviado' WHERE custom_id = ?
+        ''', parametros, db_path)
+    sincronizar_escritor(db_path)
+
+    print(f"Batch {batch.id} enviado com {len(custom_ids)} requisição(ões) ({caminho_jsonl})")
+    return batch.id
+
+
+def ingerir_resposta_batch(linha, diretorio_saida, db_path="classificacoes.db"):
+    """
+    Grava no banco e no JSON de saída uma linha do arquivo de resultados do batch.
+
+    Args:
+        linha (dict): Linha do arquivo de saída ou de erros da Batch API
+        diretorio_saida (str): Diretório dos arquivos JSON de resultado
+        db_path (str): Caminho para o arquivo do banco de dados
+
+    Returns:
+        bool: True se o arquivo foi classificado, False se a requisição falhou
+    """
+    custom_id = linha["custom_id"]
+    sincronizar_escritor(db_path)
+    conn = sqlite3.connect(db_path)
+    try:
+        item = conn.execute('''
+            SELECT execucao_id, caminho_arquivo, hash_arquivo, substituir, texto, status
+            FROM lote_batch_itens WHERE custom_id = ?
+        ''', (custom_id,)).fetchone()
+    finally:
+        conn.close()
+    if item is None:
+        print(f"    custom_id desconhecido no resultado do batch: {custom_id}")
+        return False
+    execucao_id, arquivo_pdf, hash_pdf, substituir, texto, status_atual = item
+    if status_atual != "enviado":
+        # Já ingerido numa consulta anterior que foi interrompida
+        return status_atual == "classificado"
+
+    resposta = linha.get("response") or {}
+    if linha.get("error") or resposta.get("status_code") != 200:
+        erro = linha.get("error") or resposta.get("body", {}).get("error") or "resposta sem sucesso"
+        print(f"    Erro no batch para {arquivo_pdf}: {erro}")
+        atualizar_status_arquivo(execucao_id, arquivo_pdf, "falhou",
+                                 erro=json.dumps(erro, ensure_ascii=False), db_path=db_path)
+        status_item = "falhou"
+    else:
+        corpo = resposta["body"]
+        uso = corpo.get("usage") or {}
+        classificacao = interpretar_resposta_classificacao(
+            corpo["choices"][0]["message"].get("content") or "",
+            uso.get("prompt_tokens", 0), uso.get("completion_tokens", 0))
+        # Respostas fora do esquema são reparadas na hora, fora do batch
+        classificacao = reparar_classificacao(texto, classificacao)
+        gravar_classificacao_llm(texto, classificacao, db_path)
+        classificacao["origem"] = "llm"
+
+        print(f"  Processando: {os.path.basename(arquivo_pdf)}")
+        registrar_resultado(arquivo_pdf, classificacao, diretorio_saida,
+                            hash_arquivo=hash_pdf, substituir=bool(substituir),
+                            db_path=db_path, texto=texto)
+        atualizar_status_arquivo(
+            execucao_id, arquivo_pdf, "classificado", db_path=db_path)
+        status_item = "classificado"
+
+    _atualizar_item(custom_id, status_item, db_path)
+    return status_item == "classificado"
+
+
+def _atualizar_item(custom_id, status, db_path="classificacoes.db"):
+    # O texto só era necessário até a resposta chegar
+    executar_escrita("UPDATE lote_batch_itens SET status = ?, texto = '' WHERE custom_id = ?",
+                     (status, custom_id), db_path)
+
+
+def marcar_item_falhou(custom_id, erro, db_path="classificacoes.db"):
+    """
+    Marca como falhou o item do batch e o arquivo dele na execução, para que
+    uma linha com problema não interrompa a ingestão das demais.
+
+    Args:
+        custom_id (str): Identificador da requisição
+        erro (str): Descrição do erro
+        db_path (str): Caminho para o arquivo do banco de dados
+    """
+    sincronizar_escritor(db_path)
+    conn = sqlite3.connect(db_path)
+    try:
+        item = conn.execute(
+            'SELECT execucao_id, caminho_arquivo FROM lote_batch_itens WHERE custom_id = ?',
+            (custom_id,)).fetchone()
+    finally:
+        conn.close()
+    if item is None:
+        return
+    execucao_id, arquivo_pdf = item
+    print(f"    Erro ao ingerir a resposta de {arquivo_pdf}: {erro}")
+    atualizar_status_arquivo(execucao_id, arquivo_pdf, "falhou", erro=erro, db_path=db_path)
+    _atualizar_item(custom_id, "falhou", db_path)
+
+
+def processar_resultados_batch(lote_id, client=None, db_path="classificacoes.db"):
+    """
+    Consulta um batch e, se ele tiver terminado, ingere os resultados.
+
+    Requisições sem resposta (batch expirado, cancelado ou com falha) ficam
+    como "falhou" e voltam a ser pendentes na próxima execução, assim como as
+    linhas que não puderam ser ingeridas. O status final do batch só é gravado
+    depois de todas as linhas: se a ingestão for interrompida, a próxima
+    consulta retoma de onde parou.
+
+    Args:
+        lote_id (str): Identificador do batch
+        client (OpenAI): Cliente da API (padrão: criar_cliente_batch())
+        db_path (str): Caminho para o arquivo do banco de dados
+
+    Returns:
+        str: Status atual do batch
+    """
+    client = client or criar_cliente_batch()
+    batch = client.batches.retrieve(lote_id)
+
+    sincronizar_escritor(db_path)
+    conn = sqlite3.connect(db_path)
+    try:
+        execucao_id, diretorio_saida = conn.execute(
+            'SELECT execucao_id, diretorio_saida FROM lotes_batch WHERE id = ?', (lote_id,)).fetchone()
+    finally:
+        conn.close()
+    if batch.status not in STATUS_FINAIS_BATCH:
+        executar_escrita('UPDATE lotes_batch SET status = ? WHERE id = ?', (batch.status, lote_id), db_path)
+
+    if batch.status not in STATUS_FINAIS_BATCH:
+        contagem = batch.request_counts
+        if contagem is not None:
+            print(f"Batch {lote_id}: {batch.status} "
+                  f"({contagem.completed + contagem.failed}/{contagem.total})")
+        else:
+            print(f"Batch {lote_id}: {batch.status}")
+        return batch.status
+
+    classificados = 0
+    falhas = 0
+    for arquivo_id in (batch.output_file_id, batch.error_file_id):
+        if not arquivo_id:
+            continue
+        conteudo = client.files.content(arquivo_id).text
+        for linha in conteudo.splitlines():
+            if not linha.strip():
+                continue
+            custom_id = None
+            try:
+                dados = json.loads(linha)
+                custom_id = dados["custom_id"]
+                classificado = ingerir_resposta_batch(dados, diretorio_saida, db_path)
+            except Exception as e:
+                # Resposta inválida mesmo após o reparo, erro de rede no reparo, corpo inesperado...
+                if custom_id is not None:
+                    marcar_item_falhou(custom_id, str(e), db_path)
+                else:
+                    print(f"    Linha ilegível no resultado do batch {lote_id}: {str(e)}")
+                classificado = False
+            if classificado:
+                classificados += 1
+            else:
+                falhas += 1
+
+    sincronizar_escritor(db_path)
+    conn = sqlite3.connect(db_path)
+    try:
+        sem_resposta = conn.execute('''
+            SELECT custom_id, caminho_arquivo FROM lote_batch_itens
+            WHERE lote_id = ? AND status = 'enviado'
+        ''', (lote_id,)).fetchall()
+    finally:
+        conn.close()
+
+    for custom_id, arquivo_pdf in sem_resposta:
+        atualizar_status_arquivo(execucao_id, arquivo_pdf, "falhou",
+                                 erro=f"batch {batch.status} sem resposta", db_path=db_path)
+        _atualizar_item(custom_id, "falhou", db_path)
+    executar_escrita('UPDATE lotes_batch SET status = ?, data_fim = CURRENT_TIMESTAMP WHERE id = ?',
+                     (batch.status, lote_id), db_path)
+    sincronizar_escritor(db_path)
+
+    conn = sqlite3.connect(db_path)
+    try:
+        abertos = conn.execute(
+            f'''SELECT COUNT(*) FROM lotes_batch WHERE execucao_id = ?
+                AND status NOT IN ({", ".join("?" * len(STATUS_FINAIS_BATCH))})''',
+            (execucao_id, *STATUS_FINAIS_BATCH)).fetchone()[0]
+    finally:
+        conn.close()
+
+    print(f"Batch {lote_id} {batch.status}: {classificados} classificado(s), "
+          f"{falhas + len(sem_resposta)} falha(s)")
+
+    if abertos == 0:
+        print(f"Execução {execucao_id} finalizada: {finalizar_execucao(execucao_id, db_path)}")
+    return batch.status
+
+
+def listar_lotes_abertos(db_path="classificacoes.db"):
+    """Retorna os identificadores dos batches que ainda não terminaram."""
+    sincronizar_escritor(db_path)
+    conn = sqlite3.connect(db_path)
+    try:
+        linhas = conn.execute(
+            f'''SELECT id FROM lotes_batch
+                WHERE status NOT IN ({", ".join("?" * len(STATUS_FINAIS_BATCH))})
+                ORDER BY data_envio''', STATUS_FINAIS_BATCH).fetchall()
+    finally:
+        conn.close()
+    return [lote_id for lote_id, in linhas]
+
+
+def acompanhar_lotes_batch(intervalo=60.0, uma_vez=False, client=None, db_path="classificacoes.db"):
+    """
+    Consulta os batches abertos até todos terminarem, ingerindo os resultados.
+
+    Args:
+        intervalo (float): Segundos entre as consultas
+        uma_vez (bool): Consulta uma única vez (para uso em cron)
+        client (OpenAI): Cliente da API (padrão: criar_cliente_batch())
+        db_path (str): Caminho para o arquivo do banco de dados
+    """
+    client = client or criar_cliente_batch()
+    while True:
+        abertos = listar_lotes_abertos(db_path)
+        if not abertos:
+            print("Nenhum batch em andamento.")
+            return
+        for lote_id in abertos:
+            processar_resultados_batch(lote_id, client, db_path)
+        if uma_vez:
+            return
+        time.sleep(intervalo)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    from dotenv import load_dotenv
+    load_dotenv()
+
+    from main import inicializar_banco_dados
+
+    parser = argparse.ArgumentParser(
+        description="Classificação pela Batch API da OpenAI (metade do custo, resultado em até 24h).")
+    parser.add_argument("--db", default="classificacoes.db")
+    subcomandos = parser.add_subparsers(dest="comando", required=True)
+
+    enviar = subcomandos.add_parser("enviar", help="Extrai os pendentes e envia os batches")
+    enviar.add_argument("--diretorio", default="amostragem/Parte_1/29675")
+    enviar.add_argument("--saida", default="amostragem/Parte_1/OUTPUT")
+    enviar.add_argument("--forcar", action="store_true")
+    enviar.add_argument("--execucao", default=None)
+    enviar.add_argument("--apenas-preparar", action="store_true",
+                        help="Só escreve os JSONL, sem enviar")
+
+    acompanhar = subcomandos.add_parser("acompanhar", help="Consulta os batches e ingere os resultados")
+    acompanhar.add_argument("--intervalo", type=float, default=60.0)
+    acompanhar.add_argument("--uma-vez", action="store_true")
+    args = parser.parse_args()
+
+    inicializar_banco_dados(args.db)
+    if args.comando == "enviar":
+        execucao_id, caminhos = preparar_lote_batch(
+            args.diretorio, args.saida, forcar=args.forcar, execucao_id=args.execucao, db_path=args.db)
+        if not args.apenas_preparar:
+            cliente = criar_cliente_batch()
+            for caminho in caminhos:
+                enviar_lote_batch(caminho, execucao_id, args.saida, cliente, args.db)
+        if not caminhos:
+            print(f"Execução {execucao_id} finalizada: {finalizar_execucao(execucao_id, args.db)}")
+    else:
+        acompanhar_lotes_batch(args.intervalo, args.uma_vez, db_path=args.db)
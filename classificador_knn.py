@@ -0,0 +1,357 @@
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+
+from langchain.text_splitter import RecursiveCharacterTextSplitter
+
+
+# Diretório do índice FAISS com as páginas validadas (formato do FAISS do LangChain,
+# o mesmo de faiss_index/). Cada documento tem "tipo" nos metadados. Só entram
+# páginas com o tipo confirmado por uma pessoa (coluna tipo_validado).
+INDICE_KNN = "faiss_classificacao"
+
+# "openai" (OpenAIEmbeddings) ou "local" (sentence-transformers, funciona offline)
+EMBEDDINGS_KNN = "local"
+MODELO_EMBEDDINGS_LOCAL = "sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2"
+
+# Vizinhos consultados e certeza mínima para dispensar o LLM
+K_VIZINHOS = 5
+LIMIAR_KNN = 0.85
+
+# Só o início do documento é indexado: o tipo costuma ser decidido pelo cabeçalho
+TAMANHO_TRECHO_KNN = 2000
+
+# Arquivo, dentro do diretório do índice, com a data da validação mais recente
+# já indexada: cada atualização só lê as validações feitas depois dela
+ARQUIVO_ULTIMA_VALIDACAO = "ultima_validacao.txt"
+
+
+def criar_embeddings(tipo=None):
+    """
+    Cria o modelo de embeddings configurado.
+
+    Args:
+        tipo (str): "openai" ou "local" (padrão: EMBEDDINGS_KNN do .env)
+
+    Returns:
+        Embeddings do LangChain
+    """
+    tipo = tipo or os.getenv("EMBEDDINGS_KNN", EMBEDDINGS_KNN)
+    if tipo == "openai":
+        from langchain_openai import OpenAIEmbeddings
+        return OpenAIEmbeddings()
+
+    from langchain_community.embeddings import HuggingFaceEmbeddings
+    return HuggingFaceEmbeddings(
+        model_name=os.getenv("MODELO_EMBEDDINGS_LOCAL",
+                             MODELO_EMBEDDINGS_LOCAL),
+        encode_kwargs={"normalize_embeddings": True})
+
+
+class ClassificadorKNN:
+    """
+    Classificador por vizinhos mais próximos sobre um índice FAISS de páginas
+    já validadas. Os k vizinhos votam no tipo com peso proporcional à
+    similaridade, e os mesmos vizinhos servem de exemplos few-shot quando a
+    página precisa ser escalada para o LLM.
+    """
+
+    def __init__(self, diretorio=None, embeddings=None, k=None, limiar=None):
+        """
+        Args:
+            diretorio (str): Diretório do índice (padrão: INDICE_KNN do .env)
+            embeddings: Modelo de embeddings do LangChain (padrão: criar_embeddings())
+            k (int): Número de vizinhos consultados
+            limiar (float): Certeza mínima para dispensar o LLM
+        """
+        self.diretorio = diretorio or os.getenv("INDICE_KNN", INDICE_KNN)
+        self.embeddings = embeddings or criar_embeddings()
+        self.k = k or int(os.getenv("K_VIZINHOS", K_VIZINHOS))
+        self.limiar = limiar if limiar is not None else float(
+            os.getenv("LIMIAR_KNN", LIMIAR_KNN))
+        self.divisor = RecursiveCharacterTextSplitter(
+            chunk_size=TAMANHO_TRECHO_KNN, chunk_overlap=0)
+        self.indice = None
+        # SHA-256 de cada trecho indexado -> id no docstore: o mesmo texto não
+        # entra duas vezes e uma nova validação só troca o tipo
+        self._indexados = {}
+        # data_validacao mais recente já indexada (gravada por salvar())
+        self.ultima_validacao = None
+        self._pendentes = 0
+        self._trava = threading.Lock()
+        # Vetores das consultas recentes, reaproveitados ao indexar a mesma página
+        self._vetores_recentes = OrderedDict()
+        self._carregar()
+
+    def _carregar(self):
+        from langchain_community.vectorstores import FAISS
+
+        if os.path.exists(os.path.join(self.diretorio, "index.faiss")):
+            self.indice = FAISS.load_local(
+                self.diretorio, self.embeddings, allow_dangerous_deserialization=True)
+            self._indexados = {_hash_trecho(documento.page_content): id_documento
+                               for id_documento, documento in self.indice.docstore._dict.items()}
+        caminho = os.path.join(self.diretorio, ARQUIVO_ULTIMA_VALIDACAO)
+        if self.indice is not None and os.path.exists(caminho):
+            with open(caminho, encoding="utf-8") as f:
+                self.ultima_validacao = f.read().strip() or None
+
+    def trecho(self, texto):
+        """Retorna o trecho inicial do documento usado no embedding."""
+        partes = self.divisor.split_text(texto)
+        return partes[0] if partes else ""
+
+    def _vetor(self, trecho):
+        chave = _hash_trecho(trecho)
+        with self._trava:
+            vetor = self._vetores_recentes.get(chave)
+        if vetor is None:
+            vetor = self.embeddings.embed_query(trecho)
+            with self._trava:
+                self._vetores_recentes[chave] = vetor
+                while len(self._vetores_recentes) > 256:
+                    self._vetores_recentes.popitem(last=False)
+        return vetor
+
+    def vizinhos(self, texto, k=None):
+        """
+        Busca as páginas validadas mais parecidas.
+
+        Args:
+            texto (str): Texto da página
+            k (int): Número de vizinhos (padrão: self.k)
+
+        Returns:
+            list: (Document, similaridade de 0 a 1) dos vizinhos que têm "tipo" nos metadados
+        """
+        if self.indice is None:
+            return []
+        trecho = self.trecho(texto)
+        if not trecho:
+            return []
+
+        vetor = self._vetor(trecho)
+        with self._trava:
+            resultados = self.indice.similarity_search_with_score_by_vector(
+                vetor, k=k or self.k)
+
+        vizinhos = []
+        for documento, distancia in resultados:
+            if "tipo" not in documento.metadata:
+                continue
+            # O FAISS devolve a distância L2 ao quadrado; com embeddings
+            # normalizados, 1 - d/2 é a similaridade de cosseno
+            similaridade = max(0.0, 1.0 - float(distancia) / 2.0)
+            vizinhos.append((documento, similaridade))
+        return vizinhos
+
+    def classificar(self, texto):
+        """
+        Vota o tipo da página entre os vizinhos, com peso pela similaridade.
+
+        A certeza é a fração do peso do tipo vencedor multiplicada pela
+        similaridade do vizinho mais próximo, então vizinhos distantes
+        nunca produzem certeza alta.
+
+        Args:
+            texto (str): Texto da página
+
+        Returns:
+            dict: {"tipo", "indice_certeza", "origem", "escalar", "exemplos"}
+        """
+        vizinhos = self.vizinhos(texto)
+        if not vizinhos:
+            return {"tipo": None, "indice_certeza": 0.0, "origem": "knn",
+                    "escalar": True, "exemplos": []}
+
+        pesos = {}
+        for documento, similaridade in vizinhos:
+            tipo = documento.metadata["tipo"]
+            pesos[tipo] = pesos.get(tipo, 0.0) + similaridade
+
+        tipo = max(pesos, key=pesos.get)
+        total = sum(pesos.values())
+        mais_proximo = max(similaridade for _, similaridade in vizinhos)
+        certeza = (pesos[tipo] / total) * mais_proximo if total > 0 else 0.0
+
+        return {
+            "tipo": tipo,
+            "indice_certeza": round(certeza, 4),
+            "origem": "knn",
+            "escalar": certeza < self.limiar,
+            "exemplos": [{"tipo": documento.metadata["tipo"], "texto": documento.page_content}
+                         for documento, _ in vizinhos]
+        }
+
+    def adicionar(self, texto, tipo, nome_arquivo=None, indice_certeza=None):
+        """
+        Acrescenta uma página validada ao índice (em memória; use salvar()
+        para gravar no disco). Um texto cujo trecho já está no índice com o
+        mesmo tipo é ignorado; com outro tipo, o documento é substituído.
+
+        Args:
+            texto (str): Texto da página
+            tipo (str): Tipo confirmado
+            nome_arquivo (str): Arquivo de origem (opcional)
+            indice_certeza (float): Certeza da classificação (opcional)
+
+        Returns:
+            bool: True se a página foi acrescentada ou teve o tipo trocado
+        """
+        from langchain_community.vectorstores import FAISS
+
+        trecho = self.trecho(texto)
+        if not trecho:
+            return False
+        chave = _hash_trecho(trecho)
+        with self._trava:
+            id_existente = self._indexados.get(chave)
+            if id_existente is not None and \
+                    self.indice.docstore.search(id_existente).metadata.get("tipo") == tipo:
+                return False
+        vetor = self._vetor(trecho)
+        metadados = {"tipo": tipo, "nome_arquivo": nome_arquivo,
+                     "indice_certeza": indice_certeza}
+
+        with self._trava:
+            if self._indexados.get(chave) is not None:
+                # Validado de novo com outro tipo
+                self.indice.delete([self._indexados.pop(chave)])
+            if self.indice is None:
+                self.indice = FAISS.from_embeddings(
+                    [(trecho, vetor)], self.embeddings, metadatas=[metadados], ids=[chave])
+            else:
+                self.indice.add_embeddings(
+                    [(trecho, vetor)], metadatas=[metadados], ids=[chave])
+            self._indexados[chave] = chave
+            self._pendentes += 1
+        return True
+
+    def salvar(self):
+        """Grava o índice no disco se houver páginas novas."""
+        with self._trava:
+            if self.indice is None or self._pendentes == 0:
+                return
+            self.indice.save_local(self.diretorio)
+            if self.ultima_validacao is not None:
+                with open(os.path.join(self.diretorio, ARQUIVO_ULTIMA_VALIDACAO), "w", encoding="utf-8") as f:
+                    f.write(self.ultima_validacao)
+            print(f"[kNN] {self._pendentes} página(s) adicionada(s) ao índice {self.diretorio}.")
+            self._pendentes = 0
+
+
+def _hash_trecho(trecho):
+    return hashlib.sha256(trecho.encode("utf-8")).hexdigest()
+
+
+_classificador_knn = None
+_trava_global = threading.Lock()
+_trava_indexacao = threading.Lock()
+
+
+def obter_classificador_knn():
+    """Retorna o classificador kNN do processo, carregando o índice na primeira chamada."""
+    global _classificador_knn
+    with _trava_global:
+        if _classificador_knn is None:
+            _classificador_knn = ClassificadorKNN()
+        return _classificador_knn
+
+
+def formatar_exemplos_few_shot(exemplos, limite_caracteres=600):
+    """
+    Monta o bloco de exemplos rotulados inserido no prompt do LLM.
+
+    Args:
+        exemplos (list): [{"tipo", "texto"}] dos vizinhos mais próximos
+        limite_caracteres (int): Tamanho máximo do texto de cada exemplo
+
+    Returns:
+        str: Bloco de exemplos, ou string vazia se não houver exemplos
+    """
+    if not exemplos:
+        return ""
+    partes = ["Exemplos de documentos parecidos já classificados:"]
+    for numero, exemplo in enumerate(exemplos, start=1):
+        partes.append(f"Exemplo {numero} (tipo: {exemplo['tipo']}):\n"
+                      f"{exemplo['texto'][:limite_caracteres]}")
+    return "\n\n".join(partes) + "\n\n"
+
+
+def indexar_validadas(db_path="classificacoes.db", classificador=None, salvar=True):
+    """
+    Acrescenta ao índice as classificações validadas no dashboard
+    (tipo_validado) desde a última atualização, com os textos guardados em
+    textos_documentos. Chamada no início de cada execução, de modo que uma
+    confirmação entra no índice sem reprocessar as validações anteriores.
+
+    Args:
+        db_path (str): Caminho para o arquivo do banco de dados
+        classificador (ClassificadorKNN): Índice a atualizar (padrão: obter_classificador_knn())
+        salvar (bool): Grava o índice no disco (os workers do serviço só atualizam a memória)
+
+    Returns:
+        int: Páginas acrescentadas ou com o tipo trocado
+    """
+    import sqlite3
+
+    classificador = classificador or obter_classificador_knn()
+    with _trava_indexacao:
+        conn = sqlite3.connect(db_path)
+        try:
+            # >=: validações no mesmo segundo da última já indexada são relidas
+            # (e ignoradas por adicionar se nada mudou)
+            linhas = conn.execute('''
+                SELECT c.nome_arquivo, c.tipo_validado, c.indice_certeza, t.texto, c.data_validacao
+                FROM classificacoes c
+                JOIN textos_documentos t ON t.caminho_arquivo = c.caminho_arquivo AND t.hash_arquivo IS c.hash_arquivo
+                WHERE c.tipo_validado IS NOT NULL AND c.data_validacao >= ?
+                ORDER BY c.data_validacao
+            ''', (classificador.ultima_validacao or "",)).fetchall()
+        finally:
+            conn.close()
+
+        indexadas = 0
+        for nome_arquivo, tipo, certeza, texto, data_validacao in linhas:
+            if classificador.adicionar(texto, tipo, nome_arquivo, certeza):
+                indexadas += 1
+            classificador.ultima_validacao = data_validacao
+        if salvar:
+            classificador.salvar()
+    return indexadas
+
+
+def indexar_banco(db_path="classificacoes.db"):
+    """
+    Reconstrói o índice do zero com todas as classificações validadas (para
+    trocar o modelo de embeddings ou o tamanho do trecho).
+
+    Args:
+        db_path (str): Caminho para o arquivo do banco de dados
+
+    Returns:
+        int: Páginas indexadas
+    """
+    classificador = ClassificadorKNN()
+    classificador.indice = None
+    classificador._indexados = {}
+    classificador.ultima_validacao = None
+    return indexar_validadas(db_path, classificador)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    from dotenv import load_dotenv
+    load_dotenv()
+
+    parser = argparse.ArgumentParser(
+        description="Atualiza o índice kNN com as classificações validadas no dashboard.")
+    parser.add_argument("--db", default="classificacoes.db")
+    parser.add_argument("--reconstruir", action="store_true",
+                        help="Descarta o índice atual e indexa todas as validações de novo")
+    args = parser.parse_args()
+
+    indexadas = indexar_banco(args.db) if args.reconstruir else indexar_validadas(args.db)
+    print(f"{indexadas} página(s) indexada(s).")
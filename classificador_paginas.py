@@ -0,0 +1,327 @@
+import hashlib
+import json
+import os
+
+import fitz
+
+from main import (ORCAMENTO_TOKENS_DOCUMENTO, REDUTOR_ENTRADA, VERSAO_PROMPT_PACOTE,
+                  atualizar_status_arquivo, classificar_pacote, classificar_sem_llm,
+                  concluir_telemetria, executar_escrita, extrair_texto_completo,
+                  finalizar_execucao, gravar_classificacao_llm, montar_pacotes,
+                  nome_arquivo_saida, preparar_execucao,
+                  registrar_medicao, registrar_resultado)
+from redutor_entrada import reduzir_texto
+from telemetria import PerfisLentos, finalizar_medicao, iniciar_medicao
+
+
+# Páginas com menos caracteres que isso são consideradas em branco e
+# passam a fazer parte do segmento vizinho, sem consulta ao classificador
+MIN_CARACTERES_PAGINA = 20
+
+# Diretório padrão dos PDFs divididos por segmento
+DIRETORIO_SEGMENTOS = "segmentos"
+
+
+def classificar_paginas(paginas, db_path="classificacoes.db"):
+    """
+    Classifica cada página de um documento.
+
+    As páginas passam pelos mesmos estágios de classificar_texto (cache,
+    pré-classificador, kNN); as que ainda precisam do LLM são classificadas
+    juntas por classificar_pacote, em vez de uma chamada por página.
+
+    Args:
+        paginas (list): Lista de (número da página, texto), como em extrair_texto_completo
+        db_path (str): Caminho para o arquivo do banco de dados
+
+    Returns:
+        list: {"pagina", "tipo", "indice_certeza", "tokens_entrada", "tokens_saida", "origem"}
+              por página; páginas em branco têm tipo None
+
+    Raises:
+        ValueError: Se a resposta do LLM para alguma página continuar inválida
+                    mesmo após o reparo; o arquivo fica como falhou em vez de
+                    ter páginas gravadas como desconhecido
+    """
+    resultados = []
+    para_llm = []
+    for numero, texto in paginas:
+        resultado = {"pagina": numero, "tipo": None, "indice_certeza": 0.0,
+                     "tokens_entrada": 0, "tokens_saida": 0, "origem": None}
+        resultados.append(resultado)
+        if len(texto.strip()) < MIN_CARACTERES_PAGINA:
+            continue
+
+        if REDUTOR_ENTRADA:
+            texto = reduzir_texto([texto], ORCAMENTO_TOKENS_DOCUMENTO)[0]
+        classificacao, _ = classificar_sem_llm(texto, db_path)
+        if classificacao is None:
+            para_llm.append((resultado, texto))
+        else:
+            resultado.update(classificacao)
+
+    textos = [texto for _, texto in para_llm]
+    for pacote in montar_pacotes(textos):
+        classificacoes = classificar_pacote([textos[i] for i in pacote])
+        for i, classificacao in zip(pacote, classificacoes):
+            gravar_classificacao_llm(textos[i], classificacao, db_path, VERSAO_PROMPT_PACOTE)
+            classificacao["origem"] = "llm"
+            para_llm[i][0].update(classificacao)
+
+    invalidas = [r for r in resultados if "erro" in r]
+    if invalidas:
+        raise ValueError(
+            f"resposta do modelo inválida para a(s) página(s) "
+            f"{', '.join(str(r['pagina']) for r in invalidas)}: {invalidas[0]['erro']}")
+
+    for resultado in resultados:
+        resultado.pop("raw", None)
+    return resultados
+
+
+def agrupar_segmentos(classificacoes):
+    """
+    Agrupa páginas consecutivas do mesmo tipo em subdocumentos.
+
+    Páginas em branco (tipo None) entram no segmento anterior, ou no
+    seguinte quando estão no início do arquivo.
+
+    Args:
+        classificacoes (list): Retorno de classificar_paginas
+
+    Returns:
+        list: {"tipo", "pagina_inicial", "pagina_final", "indice_certeza"} por
+              segmento; a certeza é a menor entre as páginas classificadas do segmento
+    """
+    segmentos = []
+    em_branco = []  # páginas em branco antes do primeiro segmento
+    for classificacao in classificacoes:
+        tipo = classificacao["tipo"]
+        pagina = classificacao["pagina"]
+        if tipo is None:
+            if segmentos:
+                segmentos[-1]["pagina_final"] = pagina
+            else:
+                em_branco.append(pagina)
+            continue
+
+        if segmentos and segmentos[-1]["tipo"] == tipo:
+            segmentos[-1]["pagina_final"] = pagina
+            segmentos[-1]["indice_certeza"] = min(
+                segmentos[-1]["indice_certeza"], classificacao["indice_certeza"])
+        else:
+            segmentos.append({"tipo": tipo,
+                              "pagina_inicial": em_branco[0] if em_branco and not segmentos else pagina,
+                              "pagina_final": pagina,
+                              "indice_certeza": classificacao["indice_certeza"]})
+
+    if not segmentos and em_branco:
+        segmentos.append({"tipo": "descarte", "pagina_inicial": em_branco[0],
+                          "pagina_final": em_branco[-1], "indice_certeza": 0.0})
+    return segmentos
+
+
+def resumir_segmentos(classificacoes, segmentos):
+    """
+    Monta a classificação do arquivo inteiro para a tabela classificacoes:
+    o tipo com mais páginas (descarte só vence se for o único) e a soma dos tokens.
+    """
+    paginas_por_tipo = {}
+    for segmento in segmentos:
+        paginas = segmento["pagina_final"] - segmento["pagina_inicial"] + 1
+        paginas_por_tipo[segmento["tipo"]] = paginas_por_tipo.get(segmento["tipo"], 0) + paginas
+
+    candidatos = {t: n for t, n in paginas_por_tipo.items() if t != "descarte"} or paginas_por_tipo
+    tipo = max(candidatos, key=candidatos.get) if candidatos else "desconhecido"
+    certezas = [s["indice_certeza"] for s in segmentos if s["tipo"] == tipo]
+
+    origens = {c["origem"] for c in classificacoes if c["origem"]}
+    return {
+        "tipo": tipo,
+        "indice_certeza": min(certezas) if certezas else 0.0,
+        "tokens_entrada": sum(c["tokens_entrada"] for c in classificacoes),
+        "tokens_saida": sum(c["tokens_saida"] for c in classificacoes),
+        "origem": "llm" if "llm" in origens else (origens.pop() if len(origens) == 1 else "misto")
+    }
+
+
+def dividir_pdf(arquivo_pdf, segmentos, diretorio):
+    """
+    Grava um PDF por segmento copiando as páginas originais (sem rasterizar de novo).
+
+    Args:
+        arquivo_pdf (str): PDF de origem
+        segmentos (list): Retorno de agrupar_segmentos
+        diretorio (str): Diretório de destino
+
+    Returns:
+        list: Caminho do PDF de cada segmento, na mesma ordem
+    """
+    os.makedirs(diretorio, exist_ok=True)
+    # Hash curto do caminho: PDFs de mesmo nome em pastas diferentes não se sobrescrevem
+    base = f"{os.path.splitext(nome_arquivo_saida(arquivo_pdf))[0]}_" \
+           f"{hashlib.sha256(os.path.abspath(arquivo_pdf).encode('utf-8')).hexdigest()[:8]}"
+
+    caminhos = []
+    with fitz.open(arquivo_pdf) as origem:
+        for numero, segmento in enumerate(segmentos, start=1):
+            caminho = os.path.join(
+                diretorio, f"{base}_{numero:02d}_{segmento['tipo']}_"
+                           f"p{segmento['pagina_inicial']}-{segmento['pagina_final']}.pdf")
+            with fitz.open() as destino:
+                destino.insert_pdf(origem, from_page=segmento["pagina_inicial"] - 1,
+                                   to_page=segmento["pagina_final"] - 1)
+                destino.save(caminho, garbage=3, deflate=True)
+            caminhos.append(caminho)
+    return caminhos
+
+
+def gravar_paginas_db(caminho_arquivo, nome_arquivo, classificacoes, segmentos, caminhos_segmentos=None,
+                      db_path="classificacoes.db"):
+    """
+    Substitui as páginas e segmentos gravados para o arquivo.
+
+    Args:
+        caminho_arquivo (str): Caminho do PDF (o mesmo de classificacoes.caminho_arquivo),
+                               que liga as páginas e os segmentos ao arquivo
+        nome_arquivo (str): Nome do arquivo (o mesmo de classificacoes.nome_arquivo)
+        classificacoes (list): Retorno de classificar_paginas
+        segmentos (list): Retorno de agrupar_segmentos
+        caminhos_segmentos (list): PDFs gerados por dividir_pdf (opcional)
+        db_path (str): Caminho para o arquivo do banco de dados
+    """
+    caminhos_segmentos = caminhos_segmentos or [None] * len(segmentos)
+
+    def _segmento_da_pagina(pagina):
+        for numero, segmento in enumerate(segmentos, start=1):
+            if segmento["pagina_inicial"] <= pagina <= segmento["pagina_final"]:
+                return numero
+        return None
+
+    # Pelo escritor único, como as demais gravações da execução
+    executar_escrita('DELETE FROM classificacoes_paginas WHERE caminho_arquivo = ?', (caminho_arquivo,), db_path)
+    executar_escrita('DELETE FROM segmentos_documentos WHERE caminho_arquivo = ?', (caminho_arquivo,), db_path)
+    for c in classificacoes:
+        executar_escrita('''
+            INSERT INTO classificacoes_paginas
+            (caminho_arquivo, nome_arquivo, pagina, tipo_classificacao, indice_certeza, tokens_entrada,
+             tokens_saida, origem_classificacao, segmento)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', (caminho_arquivo, nome_arquivo, c["pagina"], c["tipo"], c["indice_certeza"], c["tokens_entrada"],
+              c["tokens_saida"], c["origem"], _segmento_da_pagina(c["pagina"])), db_path)
+    for numero, (s, caminho) in enumerate(zip(segmentos, caminhos_segmentos), start=1):
+        executar_escrita('''
+            INSERT INTO segmentos_documentos
+            (caminho_arquivo, nome_arquivo, segmento, tipo_classificacao, pagina_inicial, pagina_final,
+             indice_certeza, caminho_pdf)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        ''', (caminho_arquivo, nome_arquivo, numero, s["tipo"], s["pagina_inicial"], s["pagina_final"],
+              s["indice_certeza"], caminho), db_path)
+
+
+def processar_arquivo_paginas(arquivo_pdf, diretorio_saida, diretorio_segmentos=None, hash_arquivo=None,
+                              substituir=False, execucao_id=None, db_path="classificacoes.db"):
+    """
+    Classifica um PDF página a página, grava páginas e segmentos e, se
+    diretorio_segmentos for informado, um PDF por segmento.
+
+    Com execucao_id, o arquivo passa a "extraido" na execução assim que o
+    texto é extraído, como em processar_diretorio_amostragem.
+
+    Returns:
+        dict: Resultado formatado de registrar_resultado, com a lista de segmentos
+    """
+    paginas = extrair_texto_completo(arquivo_pdf)
+    if execucao_id is not None:
+        atualizar_status_arquivo(
+            execucao_id, arquivo_pdf, "extraido", db_path=db_path)
+    classificacoes = classificar_paginas(paginas, db_path)
+    segmentos = agrupar_segmentos(classificacoes)
+
+    caminhos = dividir_pdf(arquivo_pdf, segmentos, diretorio_segmentos) \
+        if diretorio_segmentos and len(segmentos) > 1 else None
+    for segmento in segmentos:
+        print(f"    [Segmento] {segmento['tipo']}: páginas "
+              f"{segmento['pagina_inicial']}-{segmento['pagina_final']} ({segmento['indice_certeza']:.2f})")
+
+    resultado = registrar_resultado(
+        arquivo_pdf, resumir_segmentos(classificacoes, segmentos), diretorio_saida,
+        hash_arquivo=hash_arquivo, substituir=substituir, db_path=db_path,
+        texto="\n".join(texto for _, texto in paginas))
+    gravar_paginas_db(arquivo_pdf, resultado["nome_arquivo"], classificacoes, segmentos, caminhos, db_path)
+
+    # Acrescentar os segmentos ao JSON de saída
+    resultado["segmentos"] = [dict(s, caminho_pdf=c) for s, c in
+                              zip(segmentos, caminhos or [None] * len(segmentos))]
+    caminho_json = os.path.join(diretorio_saida, resultado["nome_arquivo"].replace(".pdf", ".json"))
+    with open(caminho_json, "w", encoding="utf-8") as f:
+        json.dump(resultado, f, indent=2, ensure_ascii=False)
+    return resultado
+
+
+def processar_diretorio_paginas(diretorio_base="amostragem/Parte_1/29675", diretorio_saida="amostragem/Parte_1/OUTPUT",
+                                diretorio_segmentos=None, forcar=False, execucao_id=None, db_path="classificacoes.db"):
+    """
+    Versão de processar_diretorio_amostragem com classificação por página e
+    divisão dos PDFs mistos em subdocumentos.
+
+    Args:
+        diretorio_base (str): Caminho base para o diretório de amostragem
+        diretorio_saida (str): Caminho para o diretório de saída dos resultados
+        diretorio_segmentos (str): Onde gravar os PDFs divididos (None não divide)
+        forcar (bool): Reprocessa também os arquivos já classificados
+        execucao_id (str): Execução anterior a retomar (opcional)
+        db_path (str): Caminho para o arquivo do banco de dados
+
+    Returns:
+        list: Resultados formatados, com os segmentos de cada arquivo
+    """
+    os.makedirs(diretorio_saida, exist_ok=True)
+    execucao_id, pendentes = preparar_execucao(
+        diretorio_base, forcar=forcar, execucao_id=execucao_id, db_path=db_path)
+
+    resultados = []
+    perfis = PerfisLentos()
+    for arquivo_pdf, hash_pdf, substituir in pendentes:
+        iniciar_medicao(arquivo_pdf, perfis.ativo)
+        try:
+            print(f"  Processando: {os.path.basename(arquivo_pdf)}")
+            resultados.append(processar_arquivo_paginas(
+                arquivo_pdf, diretorio_saida, diretorio_segmentos,
+                hash_arquivo=hash_pdf, substituir=substituir,
+                execucao_id=execucao_id, db_path=db_path))
+            atualizar_status_arquivo(
+                execucao_id, arquivo_pdf, "classificado", db_path=db_path)
+        except Exception as e:
+            print(f"    Erro ao processar {arquivo_pdf}: {str(e)}")
+            atualizar_status_arquivo(
+                execucao_id, arquivo_pdf, "falhou", erro=str(e), db_path=db_path)
+        registrar_medicao(execucao_id, finalizar_medicao(), perfis, db_path)
+
+    print(f"Execução {execucao_id} finalizada: {finalizar_execucao(execucao_id, db_path)}")
+    concluir_telemetria(execucao_id, perfis, db_path)
+    return resultados
+
+
+if __name__ == "__main__":
+    import argparse
+
+    from dotenv import load_dotenv
+    load_dotenv()
+
+    from main import inicializar_banco_dados
+
+    parser = argparse.ArgumentParser(
+        description="Classifica os PDFs página a página e divide os arquivos mistos.")
+    parser.add_argument("--diretorio", default="amostragem/Parte_1/29675")
+    parser.add_argument("--saida", default="amostragem/Parte_1/OUTPUT")
+    parser.add_argument("--dividir", nargs="?", const=DIRETORIO_SEGMENTOS, default=None,
+                        help=f"Grava um PDF por segmento (padrão: {DIRETORIO_SEGMENTOS}/)")
+    parser.add_argument("--forcar", action="store_true")
+    parser.add_argument("--execucao", default=None)
+    parser.add_argument("--db", default="classificacoes.db")
+    args = parser.parse_args()
+
+    inicializar_banco_dados(args.db)
+    processar_diretorio_paginas(args.diretorio, args.saida, args.dividir,
+                                forcar=args.forcar, execucao_id=args.execucao, db_path=args.db)
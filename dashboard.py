@@ -4,9 +4,28 @@ import pandas as pd
 import plotly.express as px
 import plotly.graph_objects as go
 from datetime import datetime
-import base64
+import html
+import math
 import os
 
+from estatisticas import RESOLUCAO_HISTOGRAMA, contar_faixas, estatisticas_disponiveis, ler_histograma
+from cache_extracao import calcular_hash_arquivo
+from miniaturas import CacheMiniaturas
+import persistencia
+from servidor_arquivos import HOST_SERVIDOR_ARQUIVOS, PORTA_SERVIDOR_ARQUIVOS, iniciar_servidor_arquivos
+
+CAMINHO_BANCO = "classificacoes.db"
+
+# Segundos que uma consulta fica em cache mesmo sem gravações novas no banco
+TTL_CACHE = int(os.getenv("DASHBOARD_TTL_CACHE", "60"))
+
+# Linhas por página da tabela detalhada
+TAMANHOS_PAGINA = [25, 50, 100, 200]
+
+# Endereço do servidor de PDFs visto pelo navegador (defina se o dashboard for acessado de outra máquina)
+URL_ARQUIVOS = os.getenv(
+    "DASHBOARD_URL_ARQUIVOS", f"http://{HOST_SERVIDOR_ARQUIVOS}:{PORTA_SERVIDOR_ARQUIVOS}").rstrip("/")
+
 # Configuração da página
 st.set_page_config(
     page_title="Dashboard de Classificação de Documentos",
@@ -22,39 +41,61 @@ st.markdown("---")
 def conectar_banco():
     """Conecta ao banco de dados SQLite"""
     try:
-        conn = sqlite3.connect("classificacoes.db")
+        conn = sqlite3.connect(CAMINHO_BANCO)
         return conn
     except Exception as e:
         st.error(f"Erro ao conectar ao banco de dados: {str(e)}")
         return None
 
+# Tipos que uma pessoa pode confirmar no visualizador
+TIPOS_VALIDACAO = ["voucher", "boleto", "nota_fiscal", "descarte"]
+
+def validar_classificacao(documento_id, tipo):
+    """Grava o tipo confirmado por uma pessoa; só essas linhas entram no índice kNN"""
+    conn = None
+    try:
+        # Mesma configuração (WAL, busy_timeout de 30 s) dos outros escritores:
+        # espera o escritor em lote terminar a transação em vez de falhar
+        conn = persistencia.conectar_banco(CAMINHO_BANCO)
+        conn.execute(
+            "UPDATE classificacoes SET tipo_validado = ?, data_validacao = CURRENT_TIMESTAMP WHERE id = ?",
+            (tipo, documento_id))
+        conn.commit()
+        return True
+    except Exception as e:
+        st.error(f"Erro ao validar a classificação: {str(e)}")
+        return False
+    finally:
+        if conn is not None:
+            conn.close()
+
+# Servidor de arquivos (servidor_arquivos.py): um por processo do Streamlit,
+# compartilhado entre as sessões
+@st.cache_resource
+def _iniciar_servidor_arquivos():
+    iniciar_servidor_arquivos(db_path=CAMINHO_BANCO)
+    return URL_ARQUIVOS
+
 # Função para criar link de download/visualização de PDF
-def create_pdf_link(file_path, file_name):
+def create_pdf_link(documento_id, file_path, file_name):
     """Cria um link para visualizar o PDF"""
     if os.path.exists(file_path):
-        # Ler o arquivo PDF
-        with open(file_path, "rb") as f:
-            pdf_data = f.read()
-        
-        # Converter para base64
-        b64_pdf = base64.b64encode(pdf_data).decode()
-        
-        # Criar link de download
-        href = f'<a href="data:application/pdf;base64,{b64_pdf}" download="{file_name}" target="_blank">📄 Visualizar PDF</a>'
+        # O navegador baixa o arquivo do servidor local; nada passa pelo websocket
+        url = f"{_iniciar_servidor_arquivos()}/documentos/{int(documento_id)}?download=1"
+        href = f'<a href="{url}" download="{html.escape(file_name)}" target="_blank">📄 Visualizar PDF</a>'
         return href
     else:
         return "❌ Arquivo não encontrado"
 
 # Função para exibir PDF inline
-def display_pdf(file_path):
+def display_pdf(documento_id, file_path):
     """Exibe PDF inline usando iframe"""
     if os.path.exists(file_path):
-        with open(file_path, "rb") as f:
-            pdf_data = f.read()
-        
-        b64_pdf = base64.b64encode(pdf_data).decode()
+        # O visualizador do navegador pede só os trechos que exibe (Range),
+        # então a memória não depende do tamanho do arquivo
+        url = f"{_iniciar_servidor_arquivos()}/documentos/{int(documento_id)}"
         pdf_display = f"""
-        <iframe src="data:application/pdf;base64,{b64_pdf}" 
+        <iframe src="{url}" 
                 width="100%" 
                 height="800" 
                 type="application/pdf">
@@ -64,112 +105,167 @@ def display_pdf(file_path):
     else:
         st.error("Arquivo PDF não encontrado")
 
-# Função para obter estatísticas do banco de dados
-def obter_estatisticas():
-    """Obtém estatísticas gerais do banco de dados"""
-    conn = conectar_banco()
-    if conn is None:
+# Cache de miniaturas em disco (miniaturas.py), compartilhado entre as sessões
+@st.cache_resource
+def _cache_miniaturas():
+    return CacheMiniaturas()
+
+@st.cache_data(show_spinner=False)
+def _hash_arquivo(caminho, mtime_ns, tamanho):
+    return calcular_hash_arquivo(caminho)
+
+# Função para obter a miniatura da primeira página de um documento
+def obter_miniatura(file_path, hash_arquivo=None):
+    """Retorna o caminho da miniatura, gerando-a só na primeira visualização"""
+    try:
+        if not hash_arquivo:
+            # Linhas antigas sem hash: calcular uma vez por versão do arquivo
+            info = os.stat(file_path)
+            hash_arquivo = _hash_arquivo(file_path, info.st_mtime_ns, info.st_size)
+        return _cache_miniaturas().obter_ou_gerar(file_path, 1, hash_arquivo)
+    except Exception:
         return None
-    
+
+# Marcador da última escrita no banco: mtime e tamanho do arquivo e do WAL
+# (cada commit do escritor altera o -wal; cada checkpoint, o arquivo principal)
+def marcador_escrita(db_path=CAMINHO_BANCO):
+    """Retorna um valor que muda sempre que o banco é gravado"""
+    marcador = []
+    for caminho in (db_path, db_path + "-wal"):
+        try:
+            info = os.stat(caminho)
+            marcador.append((info.st_mtime_ns, info.st_size))
+        except OSError:
+            marcador.append(None)
+    return tuple(marcador)
+
+# Consultas em cache: a chave inclui o marcador, então uma gravação nova
+# invalida o resultado antes do TTL
+@st.cache_data(ttl=TTL_CACHE, show_spinner=False)
+def _consultar_estatisticas(marcador):
+    conn = conectar_banco()
     try:
-        # Total de classificações
-        total_classificacoes = pd.read_sql_query("SELECT COUNT(*) as total FROM classificacoes", conn).iloc[0]['total']
-        
-        # Classificações por tipo
+        # Agregados mantidos por triggers (estatisticas.py): O(tipos), não O(linhas).
+        # São criados por inicializar_banco_dados; o dashboard só lê
+        if not estatisticas_disponiveis(conn):
+            return None
         classificacoes_tipo = pd.read_sql_query("""
-            SELECT tipo_classificacao, COUNT(*) as quantidade 
-            FROM classificacoes 
-            GROUP BY tipo_classificacao
+            SELECT tipo AS tipo_classificacao, quantidade, soma_certeza, tokens_entrada, tokens_saida
+            FROM estatisticas_tipo
+            WHERE quantidade > 0
+            ORDER BY tipo
         """, conn)
-        
-        # Total de tokens
-        tokens = pd.read_sql_query("""
-            SELECT SUM(tokens_entrada) as entrada, SUM(tokens_saida) as saida 
-            FROM classificacoes
-        """, conn).iloc[0]
-        
-        # Índices de certeza
-        indices_certeza = pd.read_sql_query("""
-            SELECT AVG(indice_certeza) as media, 
-                   MIN(indice_certeza) as minimo, 
-                   MAX(indice_certeza) as maximo
-            FROM classificacoes
-        """, conn).iloc[0]
-        
+        origens = pd.read_sql_query("""
+            SELECT origem, quantidade, tokens_entrada + tokens_saida AS tokens
+            FROM estatisticas_origem
+            WHERE quantidade > 0
+        """, conn).set_index('origem')
+        baldes_certeza = ler_histograma(conn)
+    finally:
         conn.close()
-        
-        return {
-            "total_classificacoes": total_classificacoes,
-            "classificacoes_tipo": classificacoes_tipo,
-            "tokens_entrada": tokens['entrada'] if tokens['entrada'] else 0,
-            "tokens_saida": tokens['saida'] if tokens['saida'] else 0,
-            "media_certeza": indices_certeza['media'] if indices_certeza['media'] else 0,
-            "min_certeza": indices_certeza['minimo'] if indices_certeza['minimo'] else 0,
-            "max_certeza": indices_certeza['maximo'] if indices_certeza['maximo'] else 0
-        }
-    except Exception as e:
-        if conn:
-            conn.close()
-        st.error(f"Erro ao obter estatísticas: {str(e)}")
-        return None
 
-# Função para obter dados detalhados
-def obter_dados_detalhados():
-    """Obtém todos os dados de classificações"""
+    total_classificacoes = int(classificacoes_tipo['quantidade'].sum())
+
+    # Pré-classificador local: taxa de escalonamento e tokens economizados
+    taxa_escalonamento = None
+    tokens_economizados = 0
+    total_llm = int(origens['quantidade'].get('llm', 0))
+    total_local = int(origens['quantidade'].get('local', 0)) + \
+        int(origens['quantidade'].get('knn', 0))
+    if total_llm + total_local > 0:
+        taxa_escalonamento = total_llm / (total_llm + total_local)
+    media_tokens_llm = origens['tokens'].get('llm', 0) / total_llm if total_llm > 0 else 0
+    tokens_economizados = int(total_local * media_tokens_llm)
+
+    faixas = contar_faixas(baldes_certeza)
+    distribuicao_certeza = pd.DataFrame(
+        sorted(faixas.items(), key=lambda item: item[1], reverse=True),
+        columns=['faixa_certeza', 'quantidade'])
+
+    return {
+        "total_classificacoes": total_classificacoes,
+        "classificacoes_tipo": classificacoes_tipo[['tipo_classificacao', 'quantidade']],
+        "tokens_entrada": int(classificacoes_tipo['tokens_entrada'].sum()),
+        "tokens_saida": int(classificacoes_tipo['tokens_saida'].sum()),
+        "media_certeza": classificacoes_tipo['soma_certeza'].sum() / total_classificacoes if total_classificacoes else 0,
+        "min_certeza": baldes_certeza[0][0] / RESOLUCAO_HISTOGRAMA if baldes_certeza else 0,
+        "max_certeza": baldes_certeza[-1][0] / RESOLUCAO_HISTOGRAMA if baldes_certeza else 0,
+        "taxa_escalonamento": taxa_escalonamento,
+        "tokens_economizados": tokens_economizados,
+        "distribuicao_certeza": distribuicao_certeza
+    }
+
+# Filtros da barra lateral traduzidos para SQL
+def _clausula_filtros(tipos, certeza_min, certeza_max):
+    condicoes = ["indice_certeza >= ?", "indice_certeza <= ?"]
+    parametros = [certeza_min, certeza_max]
+    if tipos:
+        condicoes.append(f"tipo_classificacao IN ({', '.join('?' * len(tipos))})")
+        parametros.extend(tipos)
+    else:
+        condicoes.append("0")
+    return " AND ".join(condicoes), parametros
+
+@st.cache_data(ttl=TTL_CACHE, show_spinner=False)
+def _consultar_resumo_filtrado(marcador, tipos, certeza_min, certeza_max):
+    where, parametros = _clausula_filtros(tipos, certeza_min, certeza_max)
     conn = conectar_banco()
-    if conn is None:
-        return pd.DataFrame()
-    
     try:
-        df = pd.read_sql_query("""
-            SELECT id, nome_arquivo, caminho_arquivo, tipo_classificacao, indice_certeza,
-                   tokens_entrada, tokens_saida, data_processamento
+        linha = conn.execute(f"""
+            SELECT COUNT(*), AVG(indice_certeza), SUM(tokens_entrada + tokens_saida)
             FROM classificacoes
-            ORDER BY data_processamento DESC
-        """, conn)
+            WHERE {where}
+        """, parametros).fetchone()
+    finally:
         conn.close()
-        return df
-    except Exception as e:
-        if conn:
-            conn.close()
-        st.error(f"Erro ao obter dados detalhados: {str(e)}")
-        return pd.DataFrame()
+    return {"quantidade": linha[0], "media_certeza": linha[1] or 0, "tokens": linha[2] or 0}
 
-# Função para obter distribuição por faixa de certeza
-def obter_distribuicao_certeza():
-    """Obtém distribuição por faixa de certeza"""
+@st.cache_data(ttl=TTL_CACHE, show_spinner=False)
+def _consultar_pagina(marcador, tipos, certeza_min, certeza_max, pagina, tamanho_pagina):
+    where, parametros = _clausula_filtros(tipos, certeza_min, certeza_max)
     conn = conectar_banco()
-    if conn is None:
-        return pd.DataFrame()
-    
     try:
-        df = pd.read_sql_query("""
-            SELECT 
-                CASE 
-                    WHEN indice_certeza >= 0.9 THEN 'Alta (0.9-1.0)'
-                    WHEN indice_certeza >= 0.7 THEN 'Média-Alta (0.7-0.9)'
-                    WHEN indice_certeza >= 0.5 THEN 'Média (0.5-0.7)'
-                    WHEN indice_certeza >= 0.3 THEN 'Baixa (0.3-0.5)'
-                    ELSE 'Muito Baixa (0.0-0.3)'
-                END as faixa_certeza,
-                COUNT(*) as quantidade
+        return pd.read_sql_query(f"""
+            SELECT id, nome_arquivo, caminho_arquivo, tipo_classificacao, indice_certeza,
+                   tokens_entrada, tokens_saida, data_processamento, hash_arquivo
             FROM classificacoes
-            GROUP BY 
-                CASE 
-                    WHEN indice_certeza >= 0.9 THEN 'Alta (0.9-1.0)'
-                    WHEN indice_certeza >= 0.7 THEN 'Média-Alta (0.7-0.9)'
-                    WHEN indice_certeza >= 0.5 THEN 'Média (0.5-0.7)'
-                    WHEN indice_certeza >= 0.3 THEN 'Baixa (0.3-0.5)'
-                    ELSE 'Muito Baixa (0.0-0.3)'
-                END
-            ORDER BY quantidade DESC
-        """, conn)
+            WHERE {where}
+            ORDER BY data_processamento DESC, id DESC
+            LIMIT ? OFFSET ?
+        """, conn, params=parametros + [tamanho_pagina, (pagina - 1) * tamanho_pagina])
+    finally:
         conn.close()
-        return df
+
+# Função para obter estatísticas do banco de dados
+def obter_estatisticas():
+    """Obtém estatísticas gerais do banco de dados"""
+    try:
+        estatisticas = _consultar_estatisticas(marcador_escrita())
+        if estatisticas is None:
+            st.warning("Tabelas de estatísticas ausentes: rode `python main.py` para inicializar o banco.")
+        return estatisticas
     except Exception as e:
-        if conn:
-            conn.close()
-        st.error(f"Erro ao obter distribuição de certeza: {str(e)}")
+        st.error(f"Erro ao obter estatísticas: {str(e)}")
+        return None
+
+# Função para obter o resumo dos dados filtrados
+def obter_resumo_filtrado(tipos, faixa_certeza):
+    """Conta os documentos do filtro e calcula média de certeza e tokens no SQLite"""
+    try:
+        return _consultar_resumo_filtrado(
+            marcador_escrita(), tuple(tipos), faixa_certeza[0], faixa_certeza[1])
+    except Exception as e:
+        st.error(f"Erro ao obter dados filtrados: {str(e)}")
+        return {"quantidade": 0, "media_certeza": 0, "tokens": 0}
+
+# Função para obter uma página dos dados detalhados
+def obter_dados_detalhados(tipos, faixa_certeza, pagina, tamanho_pagina):
+    """Obtém só as linhas da página pedida, já filtradas e ordenadas no SQLite"""
+    try:
+        return _consultar_pagina(marcador_escrita(), tuple(tipos), faixa_certeza[0],
+                                 faixa_certeza[1], pagina, tamanho_pagina)
+    except Exception as e:
+        st.error(f"Erro ao obter dados detalhados: {str(e)}")
         return pd.DataFrame()
 
 # Inicializar session state para controlar qual PDF está sendo visualizado
@@ -207,6 +303,22 @@ if estatisticas is not None:
             value=f"{estatisticas['media_certeza']:.2f}"
         )
     
+    # Pré-classificador local
+    if estatisticas["taxa_escalonamento"] is not None:
+        col1, col2, col3, col4 = st.columns(4)
+        
+        with col1:
+            st.metric(
+                label="Escalonamento para o LLM", 
+                value=f"{estatisticas['taxa_escalonamento'] * 100:.1f}%"
+            )
+        
+        with col2:
+            st.metric(
+                label="Tokens Economizados (estimativa)", 
+                value=f"{estatisticas['tokens_economizados']:,}"
+            )
+    
     st.markdown("---")
     
     # Gráficos
@@ -229,7 +341,7 @@ if estatisticas is not None:
     # Gráfico de distribuição por faixa de certeza
     with col2:
         st.subheader("Distribuição por Faixa de Certeza")
-        distribuicao_certeza = obter_distribuicao_certeza()
+        distribuicao_certeza = estatisticas["distribuicao_certeza"]
         if not distribuicao_certeza.empty:
             fig_certeza = px.bar(
                 distribuicao_certeza, 
@@ -248,21 +360,18 @@ if estatisticas is not None:
     # Dados detalhados
     st.subheader("Dados Detalhados de Classificações")
     
-    # Filtros
-    df_detalhado = obter_dados_detalhados()
-    
-    if not df_detalhado.empty:
+    if estatisticas["total_classificacoes"] > 0:
         # Filtros na barra lateral
         st.sidebar.header("Filtros")
-        
+
         # Filtro por tipo de documento
-        tipos_disponiveis = df_detalhado['tipo_classificacao'].unique().tolist()
+        tipos_disponiveis = estatisticas["classificacoes_tipo"]['tipo_classificacao'].tolist()
         tipos_selecionados = st.sidebar.multiselect(
-            "Tipo de Documento", 
+            "Tipo de Documento",
             options=tipos_disponiveis,
             default=tipos_disponiveis
         )
-        
+
         # Filtro por faixa de certeza
         faixa_certeza = st.sidebar.slider(
             "Faixa de Certeza",
@@ -271,100 +380,128 @@ if estatisticas is not None:
             value=(0.0, 1.0),
             step=0.1
         )
-        
-        # Aplicar filtros
-        df_filtrado = df_detalhado[
-            (df_detalhado['tipo_classificacao'].isin(tipos_selecionados)) &
-            (df_detalhado['indice_certeza'] >= faixa_certeza[0]) &
-            (df_detalhado['indice_certeza'] <= faixa_certeza[1])
-        ]
-        
+
+        # Filtros aplicados no SQLite: só a contagem e a página atual vêm para o Python
+        resumo_filtrado = obter_resumo_filtrado(tipos_selecionados, faixa_certeza)
+
+        # Paginação da tabela detalhada
+        tamanho_pagina = st.sidebar.selectbox("Linhas por página", TAMANHOS_PAGINA, index=1)
+        total_paginas = max(1, math.ceil(resumo_filtrado["quantidade"] / tamanho_pagina))
+        pagina = st.sidebar.number_input(
+            f"Página (de {total_paginas})",
+            min_value=1,
+            max_value=total_paginas,
+            value=1,
+            step=1
+        )
+        df_filtrado = obter_dados_detalhados(tipos_selecionados, faixa_certeza, int(pagina), tamanho_pagina)
+        mostrar_miniaturas = st.sidebar.checkbox("Mostrar miniaturas", value=True)
+
         # Mostrar dados filtrados com interface melhorada
         st.subheader("Dados Filtrados")
         if not df_filtrado.empty:
-            
-            # Criar interface tabular interativa
+            st.caption(
+                f"Página {int(pagina)} de {total_paginas} - "
+                f"{resumo_filtrado['quantidade']} documentos no filtro")
+
+            # Criar interface tabular interativa (só as linhas da página)
             for idx, row in df_filtrado.iterrows():
                 with st.container():
-                    col1, col2, col3, col4, col5, col6 = st.columns([3, 2, 1, 1, 1, 1])
-                    
+                    if mostrar_miniaturas:
+                        col0, col1, col2, col3, col4, col5, col6 = st.columns([1, 3, 2, 1, 1, 1, 1])
+                        with col0:
+                            # Miniatura em cache: nenhum PDF é renderizado de novo a cada rerun
+                            miniatura = obter_miniatura(row['caminho_arquivo'], row['hash_arquivo'])
+                            if miniatura:
+                                st.image(miniatura, width=80)
+                    else:
+                        col1, col2, col3, col4, col5, col6 = st.columns([3, 2, 1, 1, 1, 1])
+
                     with col1:
                         st.write(f"**{row['nome_arquivo']}**")
-                    
+
                     with col2:
                         # Badge colorido para o tipo
                         tipo_colors = {
                             'voucher': '#1f77b4',
-                            'boleto': '#ff7f0e', 
+                            'boleto': '#ff7f0e',
                             'nota_fiscal': '#2ca02c',
                             'descarte': '#d62728'
                         }
                         color = tipo_colors.get(row['tipo_classificacao'], '#7f7f7f')
                         st.markdown(f'<span style="background-color: {color}; color: white; padding: 3px 8px; border-radius: 12px; font-size: 12px;">{row["tipo_classificacao"]}</span>', unsafe_allow_html=True)
-                    
+
                     with col3:
                         st.write(f"**{row['indice_certeza']:.2f}**")
-                    
+
                     with col4:
                         st.write(f"{row['tokens_entrada']}")
-                    
+
                     with col5:
                         st.write(f"{row['tokens_saida']}")
-                    
+
                     with col6:
                         # Botão para visualizar PDF
                         if st.button("👁️ Ver", key=f"view_{row['id']}", help="Visualizar PDF"):
-                            st.session_state.pdf_selecionado = row['caminho_arquivo']
-                    
+                            st.session_state.pdf_selecionado = {"id": int(row['id']), "caminho": row['caminho_arquivo'],
+                                                                "tipo": row['tipo_classificacao']}
+
                     st.divider()
-            
+
             # Seção de visualização de PDF
             if st.session_state.pdf_selecionado:
                 st.markdown("---")
                 st.subheader("📄 Visualizador de PDF")
-                
+
                 col1, col2 = st.columns([1, 4])
                 with col1:
                     if st.button("❌ Fechar Visualizador"):
                         st.session_state.pdf_selecionado = None
                         st.rerun()
-                
+
                 with col2:
-                    st.write(f"**Arquivo:** {os.path.basename(st.session_state.pdf_selecionado)}")
-                
+                    st.write(f"**Arquivo:** {os.path.basename(st.session_state.pdf_selecionado['caminho'])}")
+
+                # Confirmação humana do tipo: alimenta o índice kNN (indexar_validadas)
+                col1, col2 = st.columns([3, 1])
+                tipo_atual = st.session_state.pdf_selecionado.get("tipo")
+                with col1:
+                    tipo_validado = st.selectbox(
+                        "Tipo correto", TIPOS_VALIDACAO,
+                        index=TIPOS_VALIDACAO.index(tipo_atual) if tipo_atual in TIPOS_VALIDACAO else 0,
+                        key=f"tipo_validado_{st.session_state.pdf_selecionado['id']}")
+                with col2:
+                    if st.button("✅ Validar"):
+                        if validar_classificacao(st.session_state.pdf_selecionado["id"], tipo_validado):
+                            st.success("Classificação validada: entra no índice kNN no início da próxima execução")
+
                 # Exibir PDF
-                display_pdf(st.session_state.pdf_selecionado)
-        
+                display_pdf(st.session_state.pdf_selecionado["id"], st.session_state.pdf_selecionado["caminho"])
+
         else:
             st.info("Nenhum dado disponível para exibir")
-        
+
         # Estatísticas dos dados filtrados
         st.subheader("Estatísticas dos Dados Filtrados")
         col1, col2, col3 = st.columns(3)
-        
+
         with col1:
             st.metric(
-                label="Documentos Filtrados", 
-                value=len(df_filtrado)
+                label="Documentos Filtrados",
+                value=resumo_filtrado["quantidade"]
             )
-        
+
         with col2:
-            if len(df_filtrado) > 0:
-                st.metric(
-                    label="Média de Certeza", 
-                    value=f"{df_filtrado['indice_certeza'].mean():.2f}"
-                )
-            else:
-                st.metric(label="Média de Certeza", value="0.00")
-        
+            st.metric(
+                label="Média de Certeza",
+                value=f"{resumo_filtrado['media_certeza']:.2f}"
+            )
+
         with col3:
-            if len(df_filtrado) > 0:
-                st.metric(
-                    label="Total de Tokens", 
-                    value=f"{df_filtrado['tokens_entrada'].sum() + df_filtrado['tokens_saida'].sum():,}"
-                )
-            else:
-                st.metric(label="Total de Tokens", value="0")
+            st.metric(
+                label="Total de Tokens",
+                value=f"{resumo_filtrado['tokens']:,}"
+            )
     else:
         st.info("Nenhum dado disponível para exibir")
 else:
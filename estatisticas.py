@@ -0,0 +1,237 @@
+# Agregados da tabela classificacoes mantidos por triggers a cada INSERT,
+# UPDATE (upsert de reprocessamento) e DELETE, para que as estatísticas e os
+# relatórios leiam O(tipos) linhas em vez de varrer a tabela inteira.
+
+
+# Baldes por unidade de certeza no histograma (0.001 de resolução)
+RESOLUCAO_HISTOGRAMA = 1000
+
+# Faixas de certeza dos relatórios: (nome, limite inferior)
+FAIXAS_CERTEZA = [
+    ("Alta (0.9-1.0)", 0.9),
+    ("Média-Alta (0.7-0.9)", 0.7),
+    ("Média (0.5-0.7)", 0.5),
+    ("Baixa (0.3-0.5)", 0.3),
+    ("Muito Baixa (0.0-0.3)", 0.0),
+]
+
+TABELAS_ESTATISTICAS = '''
+    CREATE TABLE IF NOT EXISTS estatisticas_tipo (
+        tipo TEXT PRIMARY KEY,
+        quantidade INTEGER NOT NULL DEFAULT 0,
+        soma_certeza REAL NOT NULL DEFAULT 0,
+        tokens_entrada INTEGER NOT NULL DEFAULT 0,
+        tokens_saida INTEGER NOT NULL DEFAULT 0
+    );
+    CREATE TABLE IF NOT EXISTS estatisticas_origem (
+        origem TEXT PRIMARY KEY,
+        quantidade INTEGER NOT NULL DEFAULT 0,
+        tokens_entrada INTEGER NOT NULL DEFAULT 0,
+        tokens_saida INTEGER NOT NULL DEFAULT 0
+    );
+    CREATE TABLE IF NOT EXISTS estatisticas_dia (
+        dia TEXT PRIMARY KEY,
+        quantidade INTEGER NOT NULL DEFAULT 0,
+        soma_certeza REAL NOT NULL DEFAULT 0,
+        tokens_entrada INTEGER NOT NULL DEFAULT 0,
+        tokens_saida INTEGER NOT NULL DEFAULT 0
+    );
+    CREATE TABLE IF NOT EXISTS histograma_certeza (
+        tipo TEXT NOT NULL,
+        balde INTEGER NOT NULL,
+        quantidade INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (tipo, balde)
+    );
+'''
+
+
+def _expressao_balde(linha):
+    # Truncar (não arredondar) para que 0.8999 não caia na faixa "Alta";
+    # o 1e-9 compensa 0.7 * 1000 = 699.999... em ponto flutuante
+    return (f"CAST(MIN(MAX({linha}.indice_certeza, 0.0), 1.0) * {RESOLUCAO_HISTOGRAMA} "
+            f"+ 1e-9 AS INTEGER)")
+
+
+def _somar_linha(linha, sinal):
+    """Comandos que somam (sinal 1) ou subtraem (sinal -1) uma linha dos agregados."""
+    tokens = f"{sinal} * {linha}.tokens_entrada, {sinal} * {linha}.tokens_saida"
+    return f'''
+        INSERT INTO estatisticas_tipo (tipo, quantidade, soma_certeza, tokens_entrada, tokens_saida)
+        VALUES ({linha}.tipo_classificacao, {sinal}, {sinal} * {linha}.indice_certeza, {tokens})
+        ON CONFLICT(tipo) DO UPDATE SET
+            quantidade = quantidade + excluded.quantidade,
+            soma_certeza = soma_certeza + excluded.soma_certeza,
+            tokens_entrada = tokens_entrada + excluded.tokens_entrada,
+            tokens_saida = tokens_saida + excluded.tokens_saida;
+        INSERT INTO estatisticas_origem (origem, quantidade, tokens_entrada, tokens_saida)
+        VALUES (COALESCE({linha}.origem_classificacao, 'llm'), {sinal}, {tokens})
+        ON CONFLICT(origem) DO UPDATE SET
+            quantidade = quantidade + excluded.quantidade,
+            tokens_entrada = tokens_entrada + excluded.tokens_entrada,
+            tokens_saida = tokens_saida + excluded.tokens_saida;
+        INSERT INTO estatisticas_dia (dia, quantidade, soma_certeza, tokens_entrada, tokens_saida)
+        VALUES (COALESCE(date({linha}.data_processamento), date('now')), {sinal},
+                {sinal} * {linha}.indice_certeza, {tokens})
+        ON CONFLICT(dia) DO UPDATE SET
+            quantidade = quantidade + excluded.quantidade,
+            soma_certeza = soma_certeza + excluded.soma_certeza,
+            tokens_entrada = tokens_entrada + excluded.tokens_entrada,
+            tokens_saida = tokens_saida + excluded.tokens_saida;
+        INSERT INTO histograma_certeza (tipo, balde, quantidade)
+        VALUES ({linha}.tipo_classificacao, {_expressao_balde(linha)}, {sinal})
+        ON CONFLICT(tipo, balde) DO UPDATE SET
+            quantidade = quantidade + excluded.quantidade;
+    '''
+
+
+TRIGGERS_ESTATISTICAS = f'''
+    CREATE TRIGGER IF NOT EXISTS trg_estatisticas_insercao
+    AFTER INSERT ON classificacoes
+    BEGIN
+        {_somar_linha("NEW", 1)}
+    END;
+    CREATE TRIGGER IF NOT EXISTS trg_estatisticas_atualizacao
+    AFTER UPDATE OF tipo_classificacao, indice_certeza, tokens_entrada, tokens_saida,
+                    data_processamento, origem_classificacao ON classificacoes
+    BEGIN
+        {_somar_linha("OLD", -1)}
+        {_somar_linha("NEW", 1)}
+    END;
+    CREATE TRIGGER IF NOT EXISTS trg_estatisticas_exclusao
+    AFTER DELETE ON classificacoes
+    BEGIN
+        {_somar_linha("OLD", -1)}
+    END;
+'''
+
+
+def criar_estatisticas_incrementais(conn):
+    """
+    Cria as tabelas agregadas e os triggers que as mantêm. Em um banco que já
+    tinha classificações, os agregados são preenchidos uma única vez a partir
+    delas.
+
+    Args:
+        conn (sqlite3.Connection): Conexão com o banco (a tabela classificacoes deve existir)
+    """
+    existia = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'estatisticas_tipo'").fetchone()
+    conn.executescript(TABELAS_ESTATISTICAS)
+    conn.executescript(TRIGGERS_ESTATISTICAS)
+    if not existia:
+        reconstruir_estatisticas(conn)
+
+
+def estatisticas_disponiveis(conn):
+    """
+    Indica se as tabelas agregadas já existem. Elas só são criadas por
+    inicializar_banco_dados; os leitores não devem criá-las (DDL e
+    preenchimento inicial não cabem numa consulta).
+
+    Args:
+        conn (sqlite3.Connection): Conexão com o banco
+
+    Returns:
+        bool: True se os agregados podem ser lidos
+    """
+    return conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'histograma_certeza'").fetchone() is not None
+
+
+def reconstruir_estatisticas(conn):
+    """
+    Recalcula os agregados varrendo a tabela classificacoes (só é preciso
+    quando as tabelas são criadas ou se forem alteradas fora dos triggers).
+
+    Args:
+        conn (sqlite3.Connection): Conexão com o banco
+    """
+    with conn:
+        for tabela in ("estatisticas_tipo", "estatisticas_origem", "estatisticas_dia", "histograma_certeza"):
+            conn.execute(f"DELETE FROM {tabela}")
+        conn.execute('''
+            INSERT INTO estatisticas_tipo (tipo, quantidade, soma_certeza, tokens_entrada, tokens_saida)
+            SELECT tipo_classificacao, COUNT(*), SUM(indice_certeza), SUM(tokens_entrada), SUM(tokens_saida)
+            FROM classificacoes
+            GROUP BY tipo_classificacao
+        ''')
+        conn.execute('''
+            INSERT INTO estatisticas_origem (origem, quantidade, tokens_entrada, tokens_saida)
+            SELECT COALESCE(origem_classificacao, 'llm'), COUNT(*), SUM(tokens_entrada), SUM(tokens_saida)
+            FROM classificacoes
+            GROUP BY COALESCE(origem_classificacao, 'llm')
+        ''')
+        conn.execute('''
+            INSERT INTO estatisticas_dia (dia, quantidade, soma_certeza, tokens_entrada, tokens_saida)
+            SELECT COALESCE(date(data_processamento), date('now')), COUNT(*), SUM(indice_certeza),
+                   SUM(tokens_entrada), SUM(tokens_saida)
+            FROM classificacoes
+            GROUP BY COALESCE(date(data_processamento), date('now'))
+        ''')
+        balde = _expressao_balde("classificacoes")
+        conn.execute(f'''
+            INSERT INTO histograma_certeza (tipo, balde, quantidade)
+            SELECT tipo_classificacao, {balde}, COUNT(*)
+            FROM classificacoes
+            GROUP BY tipo_classificacao, {balde}
+        ''')
+
+
+def ler_histograma(conn, tipo=None):
+    """
+    Lê o histograma de certeza (de todos os tipos ou de um só).
+
+    Args:
+        conn (sqlite3.Connection): Conexão com o banco
+        tipo (str): Tipo de documento (opcional)
+
+    Returns:
+        list: (balde, quantidade) em ordem crescente de balde, só baldes não vazios
+    """
+    sql = "SELECT balde, SUM(quantidade) FROM histograma_certeza"
+    parametros = ()
+    if tipo is not None:
+        sql += " WHERE tipo = ?"
+        parametros = (tipo,)
+    sql += " GROUP BY balde HAVING SUM(quantidade) > 0 ORDER BY balde"
+    return conn.execute(sql, parametros).fetchall()
+
+
+def quantil_histograma(baldes, q):
+    """
+    Quantil q do histograma, com a mesma convenção da mediana antiga
+    (o elemento de posição int(n * q) da lista ordenada).
+
+    Args:
+        baldes (list): (balde, quantidade) em ordem crescente
+        q (float): Quantil entre 0 e 1
+
+    Returns:
+        float: Limite inferior do balde que contém o quantil (0 se vazio)
+    """
+    total = sum(quantidade for _, quantidade in baldes)
+    if total == 0:
+        return 0
+    posicao = min(int(total * q), total - 1)
+    acumulado = 0
+    for balde, quantidade in baldes:
+        acumulado += quantidade
+        if acumulado > posicao:
+            return balde / RESOLUCAO_HISTOGRAMA
+    return baldes[-1][0] / RESOLUCAO_HISTOGRAMA
+
+
+def contar_faixas(baldes):
+    """
+    Conta as classificações por faixa de certeza a partir do histograma.
+
+    Returns:
+        dict: {faixa: quantidade}, só faixas não vazias
+    """
+    contagem = {}
+    for balde, quantidade in baldes:
+        for nome, limite in FAIXAS_CERTEZA:
+            if balde >= round(limite * RESOLUCAO_HISTOGRAMA):
+                contagem[nome] = contagem.get(nome, 0) + quantidade
+                break
+    return {nome: contagem[nome] for nome, _ in FAIXAS_CERTEZA if nome in contagem}
@@ -3,6 +3,7 @@ import os
 import json
 import pytesseract
 from pdf2image import convert_from_path
+from PIL import Image
 import fitz  # PyMuPDF
 from dotenv import load_dotenv
 # extrato
@@ -18,8 +19,27 @@ from langchain.text_splitter import RecursiveCharacterTextSplitter
 
 import fitz  # PyMuPDF
 import sqlite3
+import hashlib
+import math
+import re
+import threading
+import time
+import unicodedata
+import uuid
 from datetime import datetime
 
+from cache_extracao import CacheExtracao, calcular_hash_arquivo
+from miniaturas import CacheMiniaturas
+from motor_ocr import obter_motor_ocr
+from pre_classificador import obter_pre_classificador
+from redutor_entrada import contar_tokens, reduzir_texto
+from persistencia import conectar_banco, obter_escritor, sincronizar_escritor
+from estatisticas import (RESOLUCAO_HISTOGRAMA, contar_faixas, criar_estatisticas_incrementais,
+                          estatisticas_disponiveis, ler_histograma, quantil_histograma)
+from classificador_knn import formatar_exemplos_few_shot, indexar_validadas, obter_classificador_knn
+from telemetria import (PerfisLentos, executar_medido, finalizar_medicao, gerar_openmetrics,
+                        iniciar_medicao, medir_etapa, registrar_tentativa)
+
 
 # Carregar variáveis de ambiente
 load_dotenv()
@@ -34,6 +54,177 @@ texts_dir = "textos_paginas"
 os.makedirs(images_dir, exist_ok=True)
 os.makedirs(texts_dir, exist_ok=True)
 
+# Gravação das imagens/textos de cada página para depuração (SALVAR_DEPURACAO=1 ativa).
+# Os arquivos ficam em um subdiretório por documento, então execuções paralelas não colidem
+SALVAR_DEPURACAO = os.getenv("SALVAR_DEPURACAO", "0") == "1"
+
+# Critérios para aceitar a camada de texto do PDF sem passar pelo OCR
+MIN_CARACTERES_VETORIAL = 50
+MAX_PROPORCAO_LIXO = 0.2
+MAX_COBERTURA_IMAGEM = 0.6
+MIN_CARACTERES_COM_IMAGEM = 300
+
+# Parâmetros do OCR (também fazem parte da chave do cache de extração)
+OCR_DPI = 300
+OCR_LANG = "por"
+OCR_CONFIG = ""
+
+# Cor da rasterização para o OCR: "rgb" (padrão), "cinza" ou "binario" (preto e branco)
+OCR_COR = os.getenv("OCR_COR", "rgb")
+LIMIAR_BINARIZACAO = 160
+
+# OCR adaptativo (OCR_ADAPTATIVO=1): começa no menor DPI da lista e só rasteriza
+# de novo em DPI maior quando a confiança média das palavras fica abaixo do mínimo
+OCR_ADAPTATIVO = os.getenv("OCR_ADAPTATIVO", "0") == "1"
+# Itens vazios ou não positivos são ignorados; lista vazia volta para [OCR_DPI]
+OCR_DPIS_ADAPTATIVOS = sorted({int(d) for d in os.getenv(
+    "OCR_DPIS_ADAPTATIVOS", "150,200,300").split(",") if d.strip() and int(d) > 0}) or [OCR_DPI]
+OCR_CONFIANCA_MINIMA = float(os.getenv("OCR_CONFIANCA_MINIMA", "80"))
+# Registro (JSON Lines) do DPI escolhido, confiança e tempo de cada página no modo adaptativo
+LOG_OCR_ADAPTATIVO = os.getenv("LOG_OCR_ADAPTATIVO", "ocr_adaptativo.jsonl")
+
+# Rasterização página a página: "pymupdf" (pixmaps, padrão) ou "pdf2image"
+RASTERIZADOR = os.getenv("RASTERIZADOR", "pymupdf")
+# Orçamento de memória por página rasterizada (RGB); acima disso o DPI é reduzido. 0 desativa
+MAX_BYTES_RASTER_PAGINA = int(
+    os.getenv("MAX_BYTES_RASTER_PAGINA", str(64 * 1024 ** 2)))
+
+# Pré-classificador local antes do LLM (PRE_CLASSIFICADOR=1 ativa). Só dispensa o LLM
+# com o limiar calibrado por `python pre_classificador.py` contra os rótulos do banco
+PRE_CLASSIFICADOR = os.getenv("PRE_CLASSIFICADOR", "0") == "1"
+
+# Classificador kNN sobre o índice FAISS de páginas validadas (CLASSIFICADOR_KNN=1 ativa)
+CLASSIFICADOR_KNN = os.getenv("CLASSIFICADOR_KNN", "0") == "1"
+
+# Chamadas ao LLM do modo paralelo pelo ClassificadorAsync (CLASSIFICADOR_ASYNC=1 ativa):
+# um único cliente com limite de concorrência, pausa global em 429 e Retry-After
+CLASSIFICADOR_ASYNC = os.getenv("CLASSIFICADOR_ASYNC", "0") == "1"
+
+# Gravações de resultados por um escritor único em lote (ESCRITOR_EM_LOTE=0 grava uma a uma)
+ESCRITOR_EM_LOTE = os.getenv("ESCRITOR_EM_LOTE", "1") != "0"
+
+# Arquivo .prom regravado ao fim de cada execução com os tempos por etapa (vazio desativa)
+ARQUIVO_OPENMETRICS = os.getenv("ARQUIVO_OPENMETRICS", "")
+
+# Redução do texto enviado ao LLM a um orçamento de tokens por documento (REDUTOR_ENTRADA=1 ativa)
+REDUTOR_ENTRADA = os.getenv("REDUTOR_ENTRADA", "0") == "1"
+ORCAMENTO_TOKENS_DOCUMENTO = int(os.getenv("ORCAMENTO_TOKENS_DOCUMENTO", "1500"))
+# Registro (JSON Lines) dos tokens antes/depois da redução de cada arquivo
+LOG_REDUTOR_ENTRADA = os.getenv("LOG_REDUTOR_ENTRADA", "reducao_entrada.jsonl")
+
+# Cache em disco do OCR por página; CACHE_EXTRACAO=0 desativa
+cache_ocr = CacheExtracao(salvar_imagens=os.getenv("CACHE_EXTRACAO_IMAGENS") == "1") \
+    if os.getenv("CACHE_EXTRACAO", "1") != "0" else None
+
+# Miniaturas das páginas para o dashboard, geradas das imagens do OCR; MINIATURAS=0 desativa
+cache_miniaturas = CacheMiniaturas() if os.getenv("MINIATURAS", "1") != "0" else None
+
+
+def migrar_unicidade_caminho(conn):
+    """
+    Migração: bancos antigos têm UNIQUE em nome_arquivo, então PDFs de mesmo
+    nome em subdiretórios diferentes se sobrescreviam. A tabela é recriada com
+    UNIQUE em caminho_arquivo (o SQLite não altera restrições no lugar).
+
+    Args:
+        conn (sqlite3.Connection): Conexão com o banco
+    """
+    sql = conn.execute(
+        "SELECT sql FROM sqlite_master WHERE type = 'table' AND name = 'classificacoes'").fetchone()[0]
+    if "nome_arquivo TEXT NOT NULL UNIQUE" not in sql:
+        return
+
+    colunas = [coluna[1] for coluna in conn.execute('PRAGMA table_info(classificacoes)')]
+    print("[Banco] Migrando classificacoes: unicidade por caminho_arquivo")
+    conn.commit()
+    conn.execute("BEGIN IMMEDIATE")
+    # DROP TABLE não dispara os triggers das estatísticas; eles são recriados
+    # por criar_estatisticas_incrementais e os agregados continuam válidos
+    conn.execute(sql.replace("CREATE TABLE classificacoes", "CREATE TABLE classificacoes_migracao", 1)
+                 .replace("nome_arquivo TEXT NOT NULL UNIQUE", "nome_arquivo TEXT NOT NULL", 1)
+                 .replace("caminho_arquivo TEXT NOT NULL", "caminho_arquivo TEXT NOT NULL UNIQUE", 1))
+    lista = ", ".join(colunas)
+    conn.execute(f"INSERT INTO classificacoes_migracao ({lista}) SELECT {lista} FROM classificacoes")
+    conn.execute("DROP TABLE classificacoes")
+    conn.execute("ALTER TABLE classificacoes_migracao RENAME TO classificacoes")
+    conn.commit()
+
+
+def migrar_textos_por_caminho(conn):
+    """
+    Migração: textos_documentos era indexada pelo nome do arquivo, então PDFs
+    de mesmo nome em subdiretórios diferentes sobrescreviam o texto um do
+    outro. A tabela é recriada com chave caminho_arquivo, recuperado da linha
+    de classificacoes com o mesmo nome e hash (o nome fica como caminho das
+    linhas órfãs).
+
+    Args:
+        conn (sqlite3.Connection): Conexão com o banco
+    """
+    colunas = [coluna[1] for coluna in conn.execute('PRAGMA table_info(textos_documentos)')]
+    if "caminho_arquivo" in colunas:
+        return
+
+    print("[Banco] Migrando textos_documentos: chave por caminho_arquivo")
+    conn.commit()
+    conn.execute("BEGIN IMMEDIATE")
+    conn.execute('''
+        CREATE TABLE textos_documentos_migracao (
+            caminho_arquivo TEXT PRIMARY KEY,
+            nome_arquivo TEXT NOT NULL,
+            hash_arquivo TEXT,
+            texto TEXT NOT NULL
+        )
+    ''')
+    conn.execute('''
+        INSERT OR IGNORE INTO textos_documentos_migracao (caminho_arquivo, nome_arquivo, hash_arquivo, texto)
+        SELECT COALESCE((SELECT c.caminho_arquivo FROM classificacoes c
+                         WHERE c.nome_arquivo = t.nome_arquivo AND c.hash_arquivo IS t.hash_arquivo
+                         ORDER BY c.id LIMIT 1), t.nome_arquivo),
+               t.nome_arquivo, t.hash_arquivo, t.texto
+        FROM textos_documentos t
+    ''')
+    conn.execute("DROP TABLE textos_documentos")
+    conn.execute("ALTER TABLE textos_documentos_migracao RENAME TO textos_documentos")
+    conn.commit()
+
+
+def migrar_paginas_por_caminho(conn):
+    """
+    Migração: classificacoes_paginas e segmentos_documentos eram ligadas ao
+    arquivo pelo nome, então processar a/fatura.pdf apagava as páginas de
+    b/fatura.pdf. As tabelas são recriadas com caminho_arquivo na chave,
+    recuperado de classificacoes pelo nome (o nome fica como caminho das
+    linhas órfãs).
+
+    Args:
+        conn (sqlite3.Connection): Conexão com o banco
+    """
+    for tabela, chave in (("classificacoes_paginas", "pagina"), ("segmentos_documentos", "segmento")):
+        sql = conn.execute(
+            "SELECT sql FROM sqlite_master WHERE type = 'table' AND name = ?", (tabela,)).fetchone()[0]
+        if "caminho_arquivo" in sql:
+            continue
+
+        colunas = [coluna[1] for coluna in conn.execute(f'PRAGMA table_info({tabela})')]
+        print(f"[Banco] Migrando {tabela}: ligação ao arquivo por caminho_arquivo")
+        conn.commit()
+        conn.execute("BEGIN IMMEDIATE")
+        conn.execute(sql.replace(f"CREATE TABLE {tabela} (", f"CREATE TABLE {tabela}_migracao (\n"
+                                 "            caminho_arquivo TEXT NOT NULL,", 1)
+                     .replace(f"PRIMARY KEY (nome_arquivo, {chave})", f"PRIMARY KEY (caminho_arquivo, {chave})", 1))
+        lista = ", ".join(colunas)
+        conn.execute(f'''
+            INSERT OR IGNORE INTO {tabela}_migracao (caminho_arquivo, {lista})
+            SELECT COALESCE((SELECT c.caminho_arquivo FROM classificacoes c
+                             WHERE c.nome_arquivo = t.nome_arquivo ORDER BY c.id LIMIT 1), t.nome_arquivo),
+                   {", ".join("t." + coluna for coluna in colunas)}
+            FROM {tabela} t
+        ''')
+        conn.execute(f"DROP TABLE {tabela}")
+        conn.execute(f"ALTER TABLE {tabela}_migracao RENAME TO {tabela}")
+        conn.commit()
+
 
 def inicializar_banco_dados(db_path="classificacoes.db"):
     """
@@ -42,22 +233,30 @@ def inicializar_banco_dados(db_path="classificacoes.db"):
     Args:
         db_path (str): Caminho para o arquivo do banco de dados
     """
-    conn = sqlite3.connect(db_path)
+    # WAL fica gravado no arquivo: o dashboard lê enquanto o escritor grava
+    conn = conectar_banco(db_path)
     cursor = conn.cursor()
 
     # Criar tabela de classificações
     cursor.execute('''
         CREATE TABLE IF NOT EXISTS classificacoes (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
-            nome_arquivo TEXT NOT NULL UNIQUE,
-            caminho_arquivo TEXT NOT NULL,
+            nome_arquivo TEXT NOT NULL,
+            caminho_arquivo TEXT NOT NULL UNIQUE,
             tipo_classificacao TEXT NOT NULL,
             indice_certeza REAL NOT NULL,
             tokens_entrada INTEGER NOT NULL,
             tokens_saida INTEGER NOT NULL,
-            data_processamento TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            data_processamento TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            hash_arquivo TEXT,
+            origem_classificacao TEXT,
+            tamanho_arquivo INTEGER,
+            mtime_arquivo REAL,
+            tipo_validado TEXT,
+            data_validacao TIMESTAMP
         )
         ''')
+    migrar_unicidade_caminho(conn)
 
     # Criar índices para melhorar a performance das consultas
     cursor.execute(
@@ -67,12 +266,220 @@ def inicializar_banco_dados(db_path="classificacoes.db"):
     cursor.execute(
         'CREATE INDEX IF NOT EXISTS idx_data_processamento ON classificacoes(data_processamento)')
 
+    # Migração: bancos antigos não têm a coluna hash_arquivo
+    cursor.execute('PRAGMA table_info(classificacoes)')
+    colunas = [coluna[1] for coluna in cursor.fetchall()]
+    if "hash_arquivo" not in colunas:
+        cursor.execute(
+            'ALTER TABLE classificacoes ADD COLUMN hash_arquivo TEXT')
+    # Origem da classificação: llm, local (pré-classificador) ou cache
+    if "origem_classificacao" not in colunas:
+        cursor.execute(
+            'ALTER TABLE classificacoes ADD COLUMN origem_classificacao TEXT')
+    # Tamanho e mtime do PDF quando foi classificado: pular sem reler o arquivo
+    if "tamanho_arquivo" not in colunas:
+        cursor.execute(
+            'ALTER TABLE classificacoes ADD COLUMN tamanho_arquivo INTEGER')
+        cursor.execute(
+            'ALTER TABLE classificacoes ADD COLUMN mtime_arquivo REAL')
+    # Tipo confirmado por uma pessoa no dashboard: só essas linhas entram no índice kNN
+    if "tipo_validado" not in colunas:
+        cursor.execute(
+            'ALTER TABLE classificacoes ADD COLUMN tipo_validado TEXT')
+        cursor.execute(
+            'ALTER TABLE classificacoes ADD COLUMN data_validacao TIMESTAMP')
+    # Reaproveitamento por conteúdo (servico.py)
+    cursor.execute(
+        'CREATE INDEX IF NOT EXISTS idx_hash_arquivo ON classificacoes(hash_arquivo)')
+    # Validações novas desde a última atualização do índice kNN (indexar_validadas)
+    cursor.execute(
+        'CREATE INDEX IF NOT EXISTS idx_data_validacao ON classificacoes(data_validacao)')
+
+    # Texto extraído de cada documento (usado para treinar o pré-classificador)
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS textos_documentos (
+            caminho_arquivo TEXT PRIMARY KEY,
+            nome_arquivo TEXT NOT NULL,
+            hash_arquivo TEXT,
+            texto TEXT NOT NULL
+        )
+        ''')
+    migrar_textos_por_caminho(conn)
+
+    # Execuções em lote e status de cada arquivo, para retomar execuções interrompidas
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS execucoes (
+            id TEXT PRIMARY KEY,
+            diretorio_base TEXT NOT NULL,
+            status TEXT NOT NULL,
+            data_inicio TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            data_fim TIMESTAMP
+        )
+        ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS execucao_arquivos (
+            execucao_id TEXT NOT NULL,
+            caminho_arquivo TEXT NOT NULL,
+            status TEXT NOT NULL,
+            erro TEXT,
+            data_atualizacao TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (execucao_id, caminho_arquivo)
+        )
+        ''')
+
+    # Cache de classificações por conteúdo (hash do texto normalizado + prompt + modelo)
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS cache_classificacao (
+            chave TEXT PRIMARY KEY,
+            versao_prompt TEXT NOT NULL,
+            modelo TEXT NOT NULL,
+            tipo_classificacao TEXT NOT NULL,
+            indice_certeza REAL NOT NULL,
+            tokens_entrada INTEGER NOT NULL,
+            tokens_saida INTEGER NOT NULL,
+            data_criacao TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            ultimo_acesso REAL NOT NULL
+        )
+        ''')
+    cursor.execute(
+        'CREATE INDEX IF NOT EXISTS idx_cache_ultimo_acesso ON cache_classificacao(ultimo_acesso)')
+
+    # Contadores de acertos/falhas do cache
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS cache_classificacao_contadores (
+            nome TEXT PRIMARY KEY,
+            valor INTEGER NOT NULL DEFAULT 0
+        )
+        ''')
+    cursor.executemany(
+        'INSERT OR IGNORE INTO cache_classificacao_contadores (nome, valor) VALUES (?, 0)',
+        [("acertos",), ("falhas",)])
+
+    # Contadores de validação das respostas do LLM (falhas de formato e reparos)
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS metricas_resposta_llm (
+            nome TEXT PRIMARY KEY,
+            valor INTEGER NOT NULL DEFAULT 0
+        )
+        ''')
+    cursor.executemany(
+        'INSERT OR IGNORE INTO metricas_resposta_llm (nome, valor) VALUES (?, 0)',
+        [(nome,) for nome in METRICAS_RESPOSTA_LLM])
+
+    # Lotes enviados à Batch API da OpenAI e a requisição de cada arquivo
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS lotes_batch (
+            id TEXT PRIMARY KEY,
+            execucao_id TEXT NOT NULL,
+            arquivo_entrada TEXT NOT NULL,
+            diretorio_saida TEXT NOT NULL,
+            status TEXT NOT NULL,
+            data_envio TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            data_fim TIMESTAMP
+        )
+        ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS lote_batch_itens (
+            custom_id TEXT PRIMARY KEY,
+            lote_id TEXT,
+            execucao_id TEXT NOT NULL,
+            caminho_arquivo TEXT NOT NULL,
+            hash_arquivo TEXT,
+            substituir INTEGER NOT NULL DEFAULT 0,
+            texto TEXT NOT NULL,
+            status TEXT NOT NULL
+        )
+        ''')
+    cursor.execute(
+        'CREATE INDEX IF NOT EXISTS idx_lote_batch_itens_lote ON lote_batch_itens(lote_id)')
+    cursor.execute(
+        'CREATE INDEX IF NOT EXISTS idx_lote_batch_itens_caminho ON lote_batch_itens(caminho_arquivo, status)')
+
+    # Classificação por página e subdocumentos (páginas consecutivas do mesmo tipo)
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS classificacoes_paginas (
+            caminho_arquivo TEXT NOT NULL,
+            nome_arquivo TEXT NOT NULL,
+            pagina INTEGER NOT NULL,
+            tipo_classificacao TEXT,
+            indice_certeza REAL NOT NULL,
+            tokens_entrada INTEGER NOT NULL,
+            tokens_saida INTEGER NOT NULL,
+            origem_classificacao TEXT,
+            segmento INTEGER,
+            PRIMARY KEY (caminho_arquivo, pagina)
+        )
+        ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS segmentos_documentos (
+            caminho_arquivo TEXT NOT NULL,
+            nome_arquivo TEXT NOT NULL,
+            segmento INTEGER NOT NULL,
+            tipo_classificacao TEXT NOT NULL,
+            pagina_inicial INTEGER NOT NULL,
+            pagina_final INTEGER NOT NULL,
+            indice_certeza REAL NOT NULL,
+            caminho_pdf TEXT,
+            PRIMARY KEY (caminho_arquivo, segmento)
+        )
+        ''')
+    migrar_paginas_por_caminho(conn)
+
+    # Tempo de parede/CPU, páginas, bytes e tentativas por etapa de cada arquivo (telemetria.py)
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS tempos_etapas (
+            execucao_id TEXT NOT NULL,
+            caminho_arquivo TEXT NOT NULL,
+            etapa TEXT NOT NULL,
+            segundos REAL NOT NULL,
+            cpu_segundos REAL NOT NULL,
+            chamadas INTEGER NOT NULL,
+            paginas INTEGER NOT NULL,
+            bytes INTEGER NOT NULL,
+            tentativas INTEGER NOT NULL,
+            data_registro TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (execucao_id, caminho_arquivo, etapa)
+        )
+        ''')
+
+    # Agregados por tipo, origem, dia e histograma de certeza (mantidos por triggers)
+    conn.commit()
+    criar_estatisticas_incrementais(conn)
+
     conn.commit()
     conn.close()
+
+    # Entradas geradas com outro texto de prompt não valem mais
+    invalidar_cache_classificacao(db_path)
     print(f"Banco de dados inicializado: {db_path}")
 
 
-def inserir_classificacao_db(nome_arquivo, caminho_arquivo, classificacao, tokens_entrada, tokens_saida, db_path="classificacoes.db"):
+def executar_escrita(sql, parametros, db_path="classificacoes.db", ao_falhar=None):
+    """
+    Executa um comando de escrita: pelo escritor em lote (ESCRITOR_EM_LOTE) ou
+    com uma conexão própria e commit imediato.
+
+    Args:
+        sql (str): Comando SQL
+        parametros (tuple): Parâmetros do comando
+        db_path (str): Caminho para o arquivo do banco de dados
+        ao_falhar (callable): No modo em lote, chamado como ao_falhar(conn, erro)
+                              se o comando falhar (no modo imediato o erro é propagado)
+    """
+    if ESCRITOR_EM_LOTE:
+        obter_escritor(db_path).enfileirar(sql, parametros, ao_falhar)
+        return
+
+    conn = sqlite3.connect(db_path)
+    try:
+        conn.execute(sql, parametros)
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def inserir_classificacao_db(nome_arquivo, caminho_arquivo, classificacao, tokens_entrada, tokens_saida, db_path="classificacoes.db",
+                             hash_arquivo=None, substituir=False, origem=None):
     """
     Insere uma classificação no banco de dados.
 
@@ -83,26 +490,303 @@ def inserir_classificacao_db(nome_arquivo, caminho_arquivo, classificacao, token
         tokens_entrada (int): Número de tokens de entrada
         tokens_saida (int): Número de tokens de saída
         db_path (str): Caminho para o arquivo do banco de dados
-    """
-    conn = sqlite3.connect(db_path)
-    cursor = conn.cursor()
+        hash_arquivo (str): SHA-256 do PDF (opcional)
+        substituir (bool): Se True, atualiza a linha existente com o mesmo caminho_arquivo
+                           em vez de falhar pela restrição UNIQUE (reprocessamento forçado)
+        origem (str): Quem classificou: "llm", "local" ou "cache" (opcional)
 
-    cursor.execute('''
+    No modo em lote a gravação é assíncrona; se ela falhar, o arquivo é
+    marcado como falhou nas execuções em andamento.
+    """
+    sql = '''
         INSERT INTO classificacoes
-        (nome_arquivo, caminho_arquivo, tipo_classificacao, indice_certeza, tokens_entrada, tokens_saida)
-        VALUES (?, ?, ?, ?, ?, ?)
-    ''', (
+        (nome_arquivo, caminho_arquivo, tipo_classificacao, indice_certeza, tokens_entrada, tokens_saida, hash_arquivo,
+         origem_classificacao, tamanho_arquivo, mtime_arquivo)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    '''
+    if substituir:
+        sql += '''
+        ON CONFLICT(caminho_arquivo) DO UPDATE SET
+            nome_arquivo = excluded.nome_arquivo,
+            tipo_classificacao = excluded.tipo_classificacao,
+            indice_certeza = excluded.indice_certeza,
+            tokens_entrada = excluded.tokens_entrada,
+            tokens_saida = excluded.tokens_saida,
+            hash_arquivo = excluded.hash_arquivo,
+            origem_classificacao = excluded.origem_classificacao,
+            tamanho_arquivo = excluded.tamanho_arquivo,
+            mtime_arquivo = excluded.mtime_arquivo,
+            -- Uma validação humana vale para o conteúdo validado, não para o caminho
+            tipo_validado = CASE WHEN hash_arquivo IS excluded.hash_arquivo
+                                 THEN tipo_validado END,
+            data_validacao = CASE WHEN hash_arquivo IS excluded.hash_arquivo
+                                  THEN data_validacao END,
+            data_processamento = CURRENT_TIMESTAMP
+        '''
+    try:
+        info = os.stat(caminho_arquivo)
+        tamanho, mtime = info.st_size, info.st_mtime
+    except OSError:
+        tamanho, mtime = None, None
+
+    def _marcar_falha(conn, erro):
+        conn.execute('''
+            UPDATE execucao_arquivos
+            SET status = 'falhou', erro = ?, data_atualizacao = CURRENT_TIMESTAMP
+            WHERE caminho_arquivo = ?
+              AND execucao_id IN (SELECT id FROM execucoes WHERE status = 'em_andamento')
+        ''', (str(erro), caminho_arquivo))
+
+    executar_escrita(sql, (
         nome_arquivo,
         caminho_arquivo,
         classificacao.get("tipo", "desconhecido"),
         classificacao.get("indice_certeza", 0.0),
         tokens_entrada,
-        tokens_saida
-    ))
+        tokens_saida,
+        hash_arquivo,
+        origem,
+        tamanho,
+        mtime
+    ), db_path, ao_falhar=_marcar_falha)
+
+
+def salvar_texto_documento(caminho_arquivo, nome_arquivo, texto, hash_arquivo=None, db_path="classificacoes.db"):
+    """
+    Armazena (ou substitui) o texto extraído de um documento, usado como base
+    de treino do pré-classificador local.
+
+    Args:
+        caminho_arquivo (str): Caminho do PDF (a mesma chave de classificacoes)
+        nome_arquivo (str): Nome do arquivo classificado
+        texto (str): Texto enviado para classificação
+        hash_arquivo (str): SHA-256 do PDF (opcional)
+        db_path (str): Caminho para o arquivo do banco de dados
+    """
+    executar_escrita('''
+        INSERT OR REPLACE INTO textos_documentos (caminho_arquivo, nome_arquivo, hash_arquivo, texto)
+        VALUES (?, ?, ?, ?)
+    ''', (caminho_arquivo, nome_arquivo, hash_arquivo, texto), db_path)
+
+
+def obter_arquivos_classificados(db_path="classificacoes.db"):
+    """
+    Retorna os arquivos já classificados com o hash e a assinatura
+    (tamanho, mtime) registrados para cada um.
+
+    Args:
+        db_path (str): Caminho para o arquivo do banco de dados
+
+    Returns:
+        dict: {caminho_arquivo: (hash_arquivo, tamanho_arquivo, mtime_arquivo)};
+              hash None em linhas antigas, tamanho/mtime None antes da assinatura existir
+    """
+    sincronizar_escritor(db_path)
+    conn = sqlite3.connect(db_path)
+    cursor = conn.cursor()
+
+    cursor.execute(
+        'SELECT caminho_arquivo, hash_arquivo, tamanho_arquivo, mtime_arquivo FROM classificacoes')
+    classificados = {linha[0]: linha[1:] for linha in cursor.fetchall()}
+
+    conn.close()
+    return classificados
+
+
+def criar_execucao(diretorio_base, arquivos, db_path="classificacoes.db", execucao_id=None):
+    """
+    Registra uma execução em lote e marca seus arquivos como pendentes.
+    Se execucao_id já existir, a execução é retomada e os arquivos que ainda
+    não constavam nela são acrescentados.
+
+    Args:
+        diretorio_base (str): Diretório processado
+        arquivos (list): Caminhos dos PDFs que serão processados
+        db_path (str): Caminho para o arquivo do banco de dados
+        execucao_id (str): Identificador de uma execução anterior a retomar (opcional)
+
+    Returns:
+        str: Identificador da execução
+    """
+    execucao_id = execucao_id or datetime.now().strftime(
+        "%Y%m%d%H%M%S") + "-" + uuid.uuid4().hex[:8]
+
+    executar_escrita('''
+        INSERT INTO execucoes (id, diretorio_base, status)
+        VALUES (?, ?, 'em_andamento')
+        ON CONFLICT(id) DO UPDATE SET status = 'em_andamento', data_fim = NULL
+    ''', (execucao_id, diretorio_base), db_path)
+    for arquivo in arquivos:
+        executar_escrita('''
+            INSERT OR IGNORE INTO execucao_arquivos (execucao_id, caminho_arquivo, status)
+            VALUES (?, ?, 'pendente')
+        ''', (execucao_id, arquivo), db_path)
+    return execucao_id
+
+
+def atualizar_status_arquivo(execucao_id, caminho_arquivo, status, erro=None, db_path="classificacoes.db"):
+    """
+    Atualiza o status de um arquivo na execução
+    (pendente, extraido, classificado ou falhou).
+
+    Args:
+        execucao_id (str): Identificador da execução
+        caminho_arquivo (str): Caminho do PDF
+        status (str): Novo status
+        erro (str): Mensagem de erro, quando status for "falhou"
+        db_path (str): Caminho para o arquivo do banco de dados
+    """
+    sql = '''
+        UPDATE execucao_arquivos
+        SET status = ?, erro = ?, data_atualizacao = CURRENT_TIMESTAMP
+        WHERE execucao_id = ? AND caminho_arquivo = ?
+    '''
+    parametros = (status, erro, execucao_id, caminho_arquivo)
+    if status == "classificado":
+        # Com o escritor em lote a inserção pode ter falhado depois de enfileirada:
+        # só marcar como classificado se a linha de fato existir (a busca usa o
+        # índice da restrição UNIQUE de caminho_arquivo, ver migrar_unicidade_caminho)
+        sql += " AND EXISTS (SELECT 1 FROM classificacoes WHERE caminho_arquivo = ?)"
+        parametros += (caminho_arquivo,)
+    executar_escrita(sql, parametros, db_path)
+
+
+def finalizar_execucao(execucao_id, db_path="classificacoes.db"):
+    """
+    Marca a execução como concluída e retorna a contagem de arquivos por status.
+
+    Args:
+        execucao_id (str): Identificador da execução
+        db_path (str): Caminho para o arquivo do banco de dados
+
+    Returns:
+        dict: {status: quantidade}
+    """
+    sincronizar_escritor(db_path)
+    conn = sqlite3.connect(db_path)
+    cursor = conn.cursor()
+
+    cursor.execute('''
+        SELECT status, COUNT(*) FROM execucao_arquivos
+        WHERE execucao_id = ?
+        GROUP BY status
+    ''', (execucao_id,))
+    contagem = dict(cursor.fetchall())
 
-    conn.commit()
     conn.close()
 
+    status = "concluida_com_falhas" if contagem.get("falhou") else "concluida"
+    executar_escrita('''
+        UPDATE execucoes SET status = ?, data_fim = CURRENT_TIMESTAMP WHERE id = ?
+    ''', (status, execucao_id), db_path)
+
+    persistir_metricas_resposta(db_path)
+    sincronizar_escritor(db_path)
+    return contagem
+
+
+def registrar_medicao(execucao_id, medicao, perfis=None, db_path="classificacoes.db"):
+    """
+    Grava em tempos_etapas os contadores de cada etapa de um arquivo e
+    oferece o perfil (se houver) ao top N de arquivos mais lentos.
+
+    Args:
+        execucao_id (str): Identificador da execução
+        medicao (MedicaoArquivo): Medição do arquivo (None não grava nada)
+        perfis (PerfisLentos): Perfis dos arquivos mais lentos da execução (opcional)
+        db_path (str): Caminho para o arquivo do banco de dados
+    """
+    if medicao is None:
+        return
+    for etapa, contadores in medicao.etapas.items():
+        executar_escrita('''
+            INSERT INTO tempos_etapas
+            (execucao_id, caminho_arquivo, etapa, segundos, cpu_segundos, chamadas, paginas, bytes, tentativas)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT(execucao_id, caminho_arquivo, etapa) DO UPDATE SET
+                segundos = excluded.segundos,
+                cpu_segundos = excluded.cpu_segundos,
+                chamadas = excluded.chamadas,
+                paginas = excluded.paginas,
+                bytes = excluded.bytes,
+                tentativas = excluded.tentativas,
+                data_registro = CURRENT_TIMESTAMP
+        ''', (execucao_id, medicao.arquivo, etapa, contadores["segundos"], contadores["cpu_segundos"],
+              contadores["chamadas"], contadores["paginas"], contadores["bytes"],
+              contadores["tentativas"]), db_path)
+    if perfis is not None:
+        perfis.oferecer(medicao)
+
+
+def concluir_telemetria(execucao_id, perfis, db_path="classificacoes.db"):
+    """
+    Salva os perfis dos arquivos mais lentos da execução e, com
+    ARQUIVO_OPENMETRICS definido, regrava o arquivo de métricas.
+
+    Args:
+        execucao_id (str): Identificador da execução
+        perfis (PerfisLentos): Perfis acumulados durante a execução
+        db_path (str): Caminho para o arquivo do banco de dados
+    """
+    for segundos, arquivo, caminho in perfis.salvar(execucao_id):
+        print(f"[Perfil] {segundos:.2f}s {os.path.basename(arquivo)} -> {caminho}")
+
+    if ARQUIVO_OPENMETRICS:
+        sincronizar_escritor(db_path)
+        # Gravar e renomear: o coletor nunca lê um arquivo pela metade
+        temporario = ARQUIVO_OPENMETRICS + ".tmp"
+        with open(temporario, "w", encoding="utf-8") as f:
+            f.write(gerar_openmetrics(db_path))
+        os.replace(temporario, ARQUIVO_OPENMETRICS)
+
+
+def selecionar_arquivos_pendentes(arquivos, forcar=False, db_path="classificacoes.db"):
+    """
+    Separa os arquivos que ainda precisam ser processados, antes de qualquer OCR
+    ou chamada ao modelo. Os arquivos são identificados pelo caminho: um arquivo
+    é pulado quando já existe no banco com o mesmo hash (ou sem hash registrado);
+    se o conteúdo mudou, ele é reprocessado e a linha existente é atualizada.
+
+    Se o tamanho e o mtime ainda forem os registrados na classificação, o
+    arquivo é pulado sem ser lido; só os alterados (ou novos) são hasheados.
+
+    Args:
+        arquivos (list): Caminhos dos PDFs em ordem
+        forcar (bool): Se True, reprocessa tudo, substituindo as linhas existentes
+        db_path (str): Caminho para o arquivo do banco de dados
+
+    Returns:
+        tuple: Lista de (caminho, hash, substituir) a processar e número de arquivos pulados
+    """
+    classificados = obter_arquivos_classificados(db_path)
+
+    pendentes = []
+    pulados = 0
+    for arquivo_pdf in arquivos:
+        registro = classificados.get(arquivo_pdf)
+        if registro is None:
+            pendentes.append((arquivo_pdf, calcular_hash_arquivo(arquivo_pdf), False))
+            continue
+
+        hash_registrado, tamanho_registrado, mtime_registrado = registro
+        if not forcar:
+            if hash_registrado is None:
+                pulados += 1
+                continue
+            info = os.stat(arquivo_pdf)
+            if (tamanho_registrado, mtime_registrado) == (info.st_size, info.st_mtime):
+                pulados += 1
+                continue
+
+        hash_pdf = calcular_hash_arquivo(arquivo_pdf)
+        if not forcar and hash_pdf == hash_registrado:
+            # Mesmo conteúdo com outro mtime (cópia, touch): pular
+            pulados += 1
+            continue
+        pendentes.append((arquivo_pdf, hash_pdf, True))
+
+    return pendentes, pulados
+
 
 def gerar_estatisticas_db(db_path="classificacoes.db"):
     """
@@ -114,27 +798,29 @@ def gerar_estatisticas_db(db_path="classificacoes.db"):
     Returns:
         dict: Dicionário com as estatísticas e métricas
     """
+    sincronizar_escritor(db_path)
     conn = sqlite3.connect(db_path)
     cursor = conn.cursor()
 
-    # Total de classificações
-    cursor.execute('SELECT COUNT(*) FROM classificacoes')
-    total_classificacoes = cursor.fetchone()[0]
-
-    # Classificações por tipo
-    cursor.execute('''
-        SELECT tipo_classificacao, COUNT(*)
-        FROM classificacoes
-        GROUP BY tipo_classificacao
-    ''')
-    classificacoes_por_tipo = dict(cursor.fetchall())
-
-    # Total de tokens
-    cursor.execute(
-        'SELECT SUM(tokens_entrada), SUM(tokens_saida) FROM classificacoes')
-    tokens_entrada_total, tokens_saida_total = cursor.fetchone()
-    tokens_entrada_total = tokens_entrada_total or 0
-    tokens_saida_total = tokens_saida_total or 0
+    # Os agregados são criados por inicializar_banco_dados, não aqui
+    agregados = estatisticas_disponiveis(conn)
+    if not agregados:
+        print("Tabelas de estatísticas ausentes: rode inicializar_banco_dados para criá-las.")
+
+    # Totais por tipo, mantidos pelos triggers de estatisticas.py
+    linhas_tipo = []
+    if agregados:
+        cursor.execute('''
+            SELECT tipo, quantidade, soma_certeza, tokens_entrada, tokens_saida
+            FROM estatisticas_tipo
+            WHERE quantidade > 0
+        ''')
+        linhas_tipo = cursor.fetchall()
+    classificacoes_por_tipo = {linha[0]: linha[1] for linha in linhas_tipo}
+    total_classificacoes = sum(linha[1] for linha in linhas_tipo)
+    soma_certeza = sum(linha[2] for linha in linhas_tipo)
+    tokens_entrada_total = sum(linha[3] for linha in linhas_tipo)
+    tokens_saida_total = sum(linha[4] for linha in linhas_tipo)
 
     # Média de tokens
     if total_classificacoes > 0:
@@ -144,16 +830,14 @@ def gerar_estatisticas_db(db_path="classificacoes.db"):
         media_tokens_entrada = 0
         media_tokens_saida = 0
 
-    # Índices de certeza - média, mediana, mínimo e máximo
-    cursor.execute(
-        'SELECT indice_certeza FROM classificacoes ORDER BY indice_certeza')
-    indices_certeza = [row[0] for row in cursor.fetchall()]
-
-    if indices_certeza:
-        media_certeza = sum(indices_certeza) / len(indices_certeza)
-        mediana_certeza = indices_certeza[len(indices_certeza) // 2]
-        min_certeza = min(indices_certeza)
-        max_certeza = max(indices_certeza)
+    # Índices de certeza - média exata; mediana, mínimo e máximo pelo
+    # histograma (resolução de 1/RESOLUCAO_HISTOGRAMA)
+    baldes_certeza = ler_histograma(conn) if agregados else []
+    if baldes_certeza:
+        media_certeza = soma_certeza / total_classificacoes
+        mediana_certeza = quantil_histograma(baldes_certeza, 0.5)
+        min_certeza = baldes_certeza[0][0] / RESOLUCAO_HISTOGRAMA
+        max_certeza = baldes_certeza[-1][0] / RESOLUCAO_HISTOGRAMA
     else:
         media_certeza = 0
         mediana_certeza = 0
@@ -161,27 +845,58 @@ def gerar_estatisticas_db(db_path="classificacoes.db"):
         max_certeza = 0
 
     # Classificações por faixa de certeza
-    cursor.execute('''
-        SELECT
-            CASE
-                WHEN indice_certeza >= 0.9 THEN 'Alta (0.9-1.0)'
-                WHEN indice_certeza >= 0.7 THEN 'Média-Alta (0.7-0.9)'
-                WHEN indice_certeza >= 0.5 THEN 'Média (0.5-0.7)'
-                WHEN indice_certeza >= 0.3 THEN 'Baixa (0.3-0.5)'
-                ELSE 'Muito Baixa (0.0-0.3)'
-            END as faixa_certeza,
-            COUNT(*) as quantidade
-        FROM classificacoes
-        GROUP BY
-            CASE
-                WHEN indice_certeza >= 0.9 THEN 'Alta (0.9-1.0)'
-                WHEN indice_certeza >= 0.7 THEN 'Média-Alta (0.7-0.9)'
-                WHEN indice_certeza >= 0.5 THEN 'Média (0.5-0.7)'
-                WHEN indice_certeza >= 0.3 THEN 'Baixa (0.3-0.5)'
-                ELSE 'Muito Baixa (0.0-0.3)'
-            END
-    ''')
-    classificacoes_por_faixa_certeza = dict(cursor.fetchall())
+    classificacoes_por_faixa_certeza = contar_faixas(baldes_certeza)
+
+    # Cache de classificações
+    cache_acertos = 0
+    cache_falhas = 0
+    cache_entradas = 0
+    cursor.execute(
+        "SELECT name FROM sqlite_master WHERE type = 'table' AND name = 'cache_classificacao_contadores'")
+    if cursor.fetchone():
+        cursor.execute(
+            'SELECT nome, valor FROM cache_classificacao_contadores')
+        contadores = dict(cursor.fetchall())
+        cache_acertos = contadores.get("acertos", 0)
+        cache_falhas = contadores.get("falhas", 0)
+        cursor.execute('SELECT COUNT(*) FROM cache_classificacao')
+        cache_entradas = cursor.fetchone()[0]
+    # Origem das classificações e economia do pré-classificador local
+    linhas_origem = []
+    if agregados:
+        cursor.execute('''
+            SELECT origem, quantidade, tokens_entrada + tokens_saida
+            FROM estatisticas_origem
+            WHERE quantidade > 0
+        ''')
+        linhas_origem = cursor.fetchall()
+    classificacoes_por_origem = {linha[0]: linha[1] for linha in linhas_origem}
+    total_llm = classificacoes_por_origem.get("llm", 0)
+    total_local = classificacoes_por_origem.get(
+        "local", 0) + classificacoes_por_origem.get("knn", 0)
+    taxa_escalonamento = total_llm / \
+        (total_llm + total_local) if (total_llm + total_local) > 0 else 0
+
+    # Tokens que as classificações locais teriam custado, pela média das chamadas ao LLM
+    tokens_llm = sum(linha[2] for linha in linhas_origem if linha[0] == "llm")
+    media_tokens_llm = tokens_llm / total_llm if total_llm > 0 else 0
+    tokens_economizados_estimados = int(total_local * media_tokens_llm)
+
+    total_consultas_cache = cache_acertos + cache_falhas
+    cache_taxa_acerto = cache_acertos / \
+        total_consultas_cache if total_consultas_cache > 0 else 0
+
+    # Validação das respostas do LLM
+    metricas_resposta = dict.fromkeys(METRICAS_RESPOSTA_LLM, 0)
+    cursor.execute(
+        "SELECT name FROM sqlite_master WHERE type = 'table' AND name = 'metricas_resposta_llm'")
+    if cursor.fetchone():
+        cursor.execute('SELECT nome, valor FROM metricas_resposta_llm')
+        metricas_resposta.update(cursor.fetchall())
+    taxa_falha_formato = metricas_resposta["falhas_formato"] / \
+        metricas_resposta["respostas"] if metricas_resposta["respostas"] > 0 else 0
+    taxa_reparo = metricas_resposta["reparos"] / \
+        metricas_resposta["respostas"] if metricas_resposta["respostas"] > 0 else 0
 
     conn.close()
 
@@ -196,7 +911,17 @@ def gerar_estatisticas_db(db_path="classificacoes.db"):
         "mediana_certeza": mediana_certeza,
         "min_certeza": min_certeza,
         "max_certeza": max_certeza,
-        "classificacoes_por_faixa_certeza": classificacoes_por_faixa_certeza
+        "classificacoes_por_faixa_certeza": classificacoes_por_faixa_certeza,
+        "cache_acertos": cache_acertos,
+        "cache_falhas": cache_falhas,
+        "cache_entradas": cache_entradas,
+        "cache_taxa_acerto": cache_taxa_acerto,
+        "classificacoes_por_origem": classificacoes_por_origem,
+        "taxa_escalonamento": taxa_escalonamento,
+        "tokens_economizados_estimados": tokens_economizados_estimados,
+        "metricas_resposta": metricas_resposta,
+        "taxa_falha_formato": taxa_falha_formato,
+        "taxa_reparo": taxa_reparo
     }
 
 
@@ -210,6 +935,7 @@ def exportar_dados_csv(db_path="classificacoes.db", csv_path="classificacoes.csv
     """
     import csv
 
+    sincronizar_escritor(db_path)
     conn = sqlite3.connect(db_path)
     cursor = conn.cursor()
 
@@ -233,17 +959,19 @@ def exportar_dados_csv(db_path="classificacoes.db", csv_path="classificacoes.csv
     print(f"Dados exportados para: {csv_path}")
 
 
-def gerar_relatorio_resumido(db_path="classificacoes.db"):
+def gerar_relatorio_resumido(db_path="classificacoes.db", estatisticas=None):
     """
     Gera um relatório resumido das classificações.
 
     Args:
         db_path (str): Caminho para o arquivo do banco de dados
+        estatisticas (dict): Resultado de gerar_estatisticas_db já calculado (opcional)
 
     Returns:
         str: Relatório resumido em formato de texto
     """
-    estatisticas = gerar_estatisticas_db(db_path)
+    if estatisticas is None:
+        estatisticas = gerar_estatisticas_db(db_path)
 
     relatorio = []
     relatorio.append("RELATÓRIO RESUMIDO DE CLASSIFICAÇÕES")
@@ -262,6 +990,8 @@ def gerar_relatorio_resumido(db_path="classificacoes.db"):
         f"Índice médio de certeza: {estatisticas['media_certeza']:.2f}")
     relatorio.append(
         f"Índice mediano de certeza: {estatisticas['mediana_certeza']:.2f}")
+    relatorio.append(
+        f"Cache de classificação: {estatisticas['cache_acertos']} acertos, {estatisticas['cache_falhas']} falhas")
     relatorio.append("")
     relatorio.append("DISTRIBUIÇÃO POR TIPO DE DOCUMENTO:")
     for tipo, count in estatisticas['classificacoes_por_tipo'].items():
@@ -291,6 +1021,7 @@ def consultar_classificacoes(tipo=None, faixa_certeza_min=None, faixa_certeza_ma
     Returns:
         list: Lista de tuplas com os resultados da consulta
     """
+    sincronizar_escritor(db_path)
     conn = sqlite3.connect(db_path)
     cursor = conn.cursor()
 
@@ -319,17 +1050,19 @@ def consultar_classificacoes(tipo=None, faixa_certeza_min=None, faixa_certeza_ma
     return resultados
 
 
-def gerar_dashboard_controle(db_path="classificacoes.db"):
+def gerar_dashboard_controle(db_path="classificacoes.db", estatisticas=None):
     """
     Gera um dashboard de controle com as principais métricas do sistema.
 
     Args:
         db_path (str): Caminho para o arquivo do banco de dados
+        estatisticas (dict): Resultado de gerar_estatisticas_db já calculado (opcional)
 
     Returns:
         str: Dashboard de controle em formato de texto
     """
-    estatisticas = gerar_estatisticas_db(db_path)
+    if estatisticas is None:
+        estatisticas = gerar_estatisticas_db(db_path)
 
     dashboard = []
     dashboard.append("DASHBOARD DE CONTROLE - CLASSIFICAÇÃO DE DOCUMENTOS")
@@ -398,105 +1131,553 @@ def gerar_dashboard_controle(db_path="classificacoes.db"):
         f"Média de tokens por documento - Saída: {estatisticas['media_tokens_saida']:.2f}")
     dashboard.append(
         f"Total de tokens processados: {estatisticas['tokens_entrada_total'] + estatisticas['tokens_saida_total']:,}")
+    dashboard.append(
+        f"Cache de classificação - Acertos: {estatisticas['cache_acertos']}, Falhas: {estatisticas['cache_falhas']} "
+        f"({estatisticas['cache_taxa_acerto'] * 100:.1f}% de acerto, {estatisticas['cache_entradas']} entradas)")
+    dashboard.append(
+        f"Pré-classificador local - Taxa de escalonamento para o LLM: {estatisticas['taxa_escalonamento'] * 100:.1f}%")
+    dashboard.append(
+        f"Tokens economizados (estimativa): {estatisticas['tokens_economizados_estimados']:,}")
+    dashboard.append(
+        f"Respostas do LLM - Falhas de formato: {estatisticas['taxa_falha_formato'] * 100:.1f}%, "
+        f"Reparos: {estatisticas['taxa_reparo'] * 100:.1f}% "
+        f"({estatisticas['metricas_resposta']['reparos_sem_sucesso']} sem sucesso)")
 
     return "\n".join(dashboard)
 
 
-def extrair_texto_via_ocr(pdf_path):
-    paginas = convert_from_path(pdf_path, dpi=300)
-    textos = []
-    for num, pagina in enumerate(paginas, start=1):
-        img_path = os.path.join(images_dir, f"pagina_{num}.png")
-        pagina.save(img_path, "PNG")
-
-        texto = pytesseract.image_to_string(img_path, lang="por")
-        textos.append((num, texto))
-        with open(os.path.join(texts_dir, f"pagina_{num}.txt"), "w", encoding="utf-8") as f:
-            f.write(texto)
-        print(f"[OCR] Página {num} extraída.")
-    return textos
+def calcular_dpi_pagina(page, dpi=OCR_DPI, max_bytes=None):
+    """
+    Reduz o DPI de uma página quando a imagem RGB resultante ultrapassaria o
+    orçamento de memória por página (páginas muito grandes, como plantas ou A3).
 
+    Args:
+        page (fitz.Page): Página do documento aberto com PyMuPDF
+        dpi (int): DPI desejado
+        max_bytes (int): Orçamento em bytes (padrão: MAX_BYTES_RASTER_PAGINA; 0 desativa)
 
-def extrair_texto_vetorial(pdf_path):
-    doc = fitz.open(pdf_path)
-    textos = []
-    for num, page in enumerate(doc, start=1):
-        texto = page.get_text().strip()
-        if texto:
-            textos.append((num, texto))
-            with open(os.path.join(texts_dir, f"vetorial_pagina_{num}.txt"), "w", encoding="utf-8") as f:
-                f.write(texto)
-            print(f"[Vetorial] Página {num} extraída.")
-    return textos
+    Returns:
+        int: DPI efetivo
+    """
+    max_bytes = MAX_BYTES_RASTER_PAGINA if max_bytes is None else max_bytes
+    largura = page.rect.width / 72 * dpi
+    altura = page.rect.height / 72 * dpi
+    tamanho = largura * altura * 3
+    if max_bytes and tamanho > max_bytes:
+        return max(int(dpi * math.sqrt(max_bytes / tamanho)), 72)
+    return dpi
 
 
-def extrair_texto_completo(pdf_path):
-    ocr = dict(extrair_texto_via_ocr(pdf_path))
-    vet = dict(extrair_texto_vetorial(pdf_path))
-    todas = {**ocr, **vet}
-    return sorted(todas.items())
+def rasterizar_pagina(page, dpi=OCR_DPI, cor=None):
+    """
+    Rasteriza uma única página em uma imagem PIL.
 
+    Args:
+        page (fitz.Page): Página do documento aberto com PyMuPDF
+        dpi (int): Resolução da rasterização
+        cor (str): "rgb", "cinza" ou "binario" (padrão: OCR_COR)
 
-def classificar_documento(paginas_texto):
-    conteudo = "\n\n".join(f"Página {n}:\n{t}" for n, t in paginas_texto)
+    Returns:
+        PIL.Image.Image: Imagem da página (modo RGB, L ou 1)
+    """
+    cor = cor or OCR_COR
+
+    if RASTERIZADOR == "pdf2image":
+        num = page.number + 1
+        imagem = convert_from_path(page.parent.name, dpi=dpi, first_page=num, last_page=num,
+                                   grayscale=cor != "rgb")[0]
+    elif cor == "rgb":
+        pix = page.get_pixmap(dpi=dpi, alpha=False)
+        imagem = Image.frombytes("RGB", (pix.width, pix.height), pix.samples)
+        # Liberar o buffer do pixmap antes de devolver a cópia em PIL
+        del pix
+    else:
+        # Renderizar direto em tons de cinza: 1 byte por pixel em vez de 3
+        pix = page.get_pixmap(dpi=dpi, colorspace=fitz.csGRAY, alpha=False)
+        imagem = Image.frombytes("L", (pix.width, pix.height), pix.samples)
+        del pix
 
-    prompt_template = PromptTemplate.from_template("""
-        Você está analisando um documento dividido por páginas, onde cada página começa com 'Página X:'.
-        Classifique as páginas de acordo com o conteúdo apresentado. Os tipos de conteúdo que devem ser detectados são:
-        - Voucher:"Número de reserva", "Hóspede", "Quarto:", "check in", "arrival", "chegada", "Quarto nº"
-        - boleto: "Valor do Documento", "Juros/Multa", "Boleto", "Recibo do Pagador", "Local Pagamento", "Pagador"
-        - nota_fiscal: "NOTA FISCAL DE SERVIÇO ELETRÔNICA", "NÚMERO DA NOTA", "TOMADOR DE SERVIÇOS", "PRESTADOR DE SERVIÇOS", "CNAE"
+    if cor == "binario":
+        imagem = imagem.convert("L").point(
+            lambda p: 255 if p > LIMIAR_BINARIZACAO else 0, mode="1")
+    return imagem
 
-        Considere:
-        - 'voucher' contém a descrição do agendamento, nome do cliente, data de check-in, quarto, valor, forma de pagamento, número do voucher.
-        - 'boleto' contém código de barras, vencimento, valor, cedente ou banco, valor do documento.
-        - 'nota_fiscal' contém CNPJ, descrição de produtos/serviços, impostos, natureza da operação, o tomardor e o prestador de serviços.
-        - 'descarte' é qualquer página que não se encaixa em nenhum dos outros tipos.
 
-        Responda apenas com um JSON, nesse formato:
-        {{
-        "voucher": [1, 2],
-        "boleto": [3],
-        "nota_fiscal": [4, 5]
-        "descarte": [6, 7]
-        }}
+def rasterizar_paginas(pdf_path, paginas=None, dpi=OCR_DPI, max_bytes=None):
+    """
+    Gera as páginas rasterizadas uma de cada vez, sem materializar o PDF inteiro
+    em memória. Cada imagem deve ser descartada pelo chamador antes da próxima.
 
-        Aqui está o conteúdo do documento:
+    Args:
+        pdf_path (str): Caminho para o arquivo PDF
+        paginas (list): Números das páginas (base 1); None gera todas
+        dpi (int): DPI desejado
+        max_bytes (int): Orçamento de memória por página (ver calcular_dpi_pagina)
 
-        {conteudo}
-""")
+    Yields:
+        tuple: (número da página, imagem PIL, DPI efetivo)
+    """
+    with fitz.open(pdf_path) as doc:
+        if paginas is None:
+            paginas = range(1, doc.page_count + 1)
+        for num in paginas:
+            page = doc[num - 1]
+            dpi_pagina = calcular_dpi_pagina(page, dpi, max_bytes)
+            yield num, rasterizar_pagina(page, dpi_pagina), dpi_pagina
 
-    llm = ChatOpenAI(model="gpt-4o-mini", temperature=0)
-    chain = prompt_template | llm
-    ai_message = chain.invoke({"conteudo": conteudo})
 
-    # Extrai o texto puro do AIMessage
-    text = ai_message.content if hasattr(
-        ai_message, "content") else str(ai_message)
+def diretorio_depuracao(pdf_path, base):
+    """
+    Retorna (e cria) o subdiretório de depuração de um documento, no formato
+    <base>/<nome do PDF>_<hash do caminho>, único mesmo para PDFs homônimos.
+    """
+    nome = os.path.splitext(os.path.basename(pdf_path))[0]
+    sufixo = hashlib.sha1(os.path.abspath(
+        pdf_path).encode("utf-8")).hexdigest()[:8]
+    diretorio = os.path.join(base, f"{nome}_{sufixo}")
+    os.makedirs(diretorio, exist_ok=True)
+    return diretorio
 
-    # Limpeza de markdown/backticks
-    resposta_limpa = text.strip().lstrip("```json").rstrip("```").strip()
 
-    try:
-        return json.loads(resposta_limpa)
-    except json.JSONDecodeError:
-        print("⚠️ Falha ao parsear JSON:")
-        print(text)
-        return {"erro": "formato inválido", "raw": text}
+def salvar_depuracao_pagina(pdf_path, num, texto, origem="ocr", imagem=None):
+    """
+    Grava o texto (e a imagem, se houver) de uma página para depuração.
+    Não faz nada se SALVAR_DEPURACAO estiver desativado.
+
+    Args:
+        pdf_path (str): Caminho do PDF de origem
+        num (int): Número da página
+        texto (str): Texto extraído
+        origem (str): "ocr" ou "vetorial"
+        imagem (PIL.Image.Image): Imagem rasterizada da página (opcional)
+    """
+    if not SALVAR_DEPURACAO:
+        return
+
+    prefixo = "pagina" if origem == "ocr" else f"{origem}_pagina"
+    with open(os.path.join(diretorio_depuracao(pdf_path, texts_dir), f"{prefixo}_{num}.txt"), "w", encoding="utf-8") as f:
+        f.write(texto)
+    if imagem is not None:
+        imagem.save(os.path.join(diretorio_depuracao(
+            pdf_path, images_dir), f"pagina_{num}.png"), "PNG")
 
 
-def classificar_pagina(texto_pagina):
+def executar_tesseract(imagem, lang=OCR_LANG, config=OCR_CONFIG, saida="txt"):
     """
-    Classifica uma única página de documento com índice de certeza e coleta métricas de tokens.
+    Executa o Tesseract sobre uma imagem em memória usando o motor de OCR do
+    processo (instância aquecida do tesserocr ou, na falta dele, um processo
+    `tesseract` por página; ver motor_ocr.py).
 
     Args:
-        texto_pagina (str): Texto extraído da página do documento
+        imagem (PIL.Image.Image): Imagem da página
+        lang (str): Idioma(s) do Tesseract
+        config (str): Parâmetros adicionais do Tesseract
+        saida (str): "txt" para texto puro ou "tsv" para palavras com confiança
 
     Returns:
-        dict: Dicionário com a classificação, índice de certeza e métricas de tokens
+        str: Saída do Tesseract
+    """
+    return obter_motor_ocr(lang, config).reconhecer(imagem, saida)
+
+
+def ocr_imagem(imagem, lang=OCR_LANG, config=OCR_CONFIG):
+    """
+    Reconhece o texto de uma imagem em memória.
+
+    Args:
+        imagem (PIL.Image.Image): Imagem da página
+        lang (str): Idioma(s) do Tesseract
+        config (str): Parâmetros adicionais do Tesseract
+
+    Returns:
+        str: Texto reconhecido
+    """
+    return executar_tesseract(imagem, lang, config)
+
+
+def interpretar_tsv_tesseract(tsv):
+    """
+    Remonta o texto a partir da saída TSV do Tesseract (mesmo formato de
+    pytesseract.image_to_data) e calcula a confiança média das palavras.
+
+    Args:
+        tsv (str): Saída TSV do Tesseract
+
+    Returns:
+        tuple: (texto, confiança média de 0 a 100; 0.0 se nenhuma palavra foi reconhecida)
+    """
+    linhas = {}
+    confiancas = []
+    for registro in tsv.splitlines():
+        campos = registro.split("\t")
+        if len(campos) < 12 or campos[0] != "5":
+            continue
+        palavra = campos[11].strip()
+        if not palavra:
+            continue
+        bloco, paragrafo, linha = int(campos[2]), int(campos[3]), int(campos[4])
+        linhas.setdefault((bloco, paragrafo, linha), []).append(palavra)
+        confianca = float(campos[10])
+        if confianca >= 0:
+            confiancas.append(confianca)
+
+    partes = []
+    anterior = None
+    for (bloco, paragrafo, linha), palavras in sorted(linhas.items()):
+        # Linha em branco entre parágrafos, como na saída txt do Tesseract
+        if anterior is not None and anterior != (bloco, paragrafo):
+            partes.append("")
+        partes.append(" ".join(palavras))
+        anterior = (bloco, paragrafo)
+
+    media = sum(confiancas) / len(confiancas) if confiancas else 0.0
+    return "\n".join(partes), media
+
+
+def ocr_pagina_adaptativo(page):
+    """
+    Faz o OCR de uma página começando pelo menor DPI de OCR_DPIS_ADAPTATIVOS e
+    subindo enquanto a confiança média das palavras ficar abaixo de
+    OCR_CONFIANCA_MINIMA. O maior DPI da lista é sempre aceito.
+
+    Args:
+        page (fitz.Page): Página do documento aberto com PyMuPDF
+
+    Returns:
+        dict: texto, imagem final, DPI escolhido, confiança média e tentativas (DPI, confiança, segundos)
+    """
+    dpis = sorted(OCR_DPIS_ADAPTATIVOS) or [OCR_DPI]
+    tentativas = []
+    for indice, dpi_desejado in enumerate(dpis):
+        inicio = time.perf_counter()
+        dpi = calcular_dpi_pagina(page, dpi_desejado)
+        imagem = rasterizar_pagina(page, dpi)
+        texto, confianca = interpretar_tsv_tesseract(
+            executar_tesseract(imagem, saida="tsv"))
+        tentativas.append(
+            {"dpi": dpi, "confianca": round(confianca, 2),
+             "segundos": round(time.perf_counter() - inicio, 4)})
+
+        if confianca >= OCR_CONFIANCA_MINIMA or indice == len(dpis) - 1:
+            return {"texto": texto, "imagem": imagem, "dpi": dpi,
+                    "confianca": confianca, "tentativas": tentativas}
+        imagem.close()
+
+
+def registrar_ocr_adaptativo(pdf_path, num, resultado):
+    """
+    Acrescenta ao LOG_OCR_ADAPTATIVO uma linha JSON com o DPI escolhido,
+    a confiança e o tempo de cada tentativa, para ajuste dos limiares.
+    """
+    if not LOG_OCR_ADAPTATIVO:
+        return
+    registro = {
+        "arquivo": pdf_path,
+        "pagina": num,
+        "dpi": resultado["dpi"],
+        "confianca": round(resultado["confianca"], 2),
+        "segundos": round(sum(t["segundos"] for t in resultado["tentativas"]), 4),
+        "tentativas": resultado["tentativas"],
+        "cor": OCR_COR,
+        "data": datetime.now().isoformat(timespec="seconds")
+    }
+    # Linhas curtas em modo append podem ser gravadas por vários processos ao mesmo tempo
+    with open(LOG_OCR_ADAPTATIVO, "a", encoding="utf-8") as f:
+        f.write(json.dumps(registro, ensure_ascii=False) + "\n")
+
+
+def extrair_texto_via_ocr(pdf_path, paginas=None):
+    """
+    Extrai o texto das páginas do PDF via rasterização + Tesseract.
+
+    As páginas são rasterizadas e passadas ao OCR em janelas do tamanho do
+    número de instâncias do motor de OCR (uma página, por padrão), então o pico
+    de memória é o dessas páginas (cada uma limitada por MAX_BYTES_RASTER_PAGINA),
+    e não o do PDF inteiro. Páginas já presentes no cache de extração (mesmo
+    arquivo, DPI e configuração do Tesseract) não são rasterizadas.
+
+    Args:
+        pdf_path (str): Caminho para o arquivo PDF
+        paginas (list): Números das páginas (base 1) a processar; None processa todas
+
+    Returns:
+        list: Lista de tuplas (número da página, texto)
     """
+    hash_pdf = calcular_hash_arquivo(pdf_path) if cache_ocr or cache_miniaturas else None
+    motor = obter_motor_ocr(OCR_LANG, OCR_CONFIG)
+
+    textos = {}
+    janela = []  # (número da página, chave do cache, imagem) aguardando OCR em lote
+
+    def concluir_pagina(num, chave, texto, pagina):
+        textos[num] = texto
+        salvar_depuracao_pagina(pdf_path, num, texto, "ocr", pagina)
+        if cache_ocr:
+            cache_ocr.gravar(chave, texto, pagina)
+        if cache_miniaturas:
+            # A página já está rasterizada: a miniatura sai quase de graça
+            cache_miniaturas.gravar_imagem(hash_pdf, num, pagina)
+        print(f"[OCR] Página {num} extraída.")
+        # Liberar a imagem antes de rasterizar as próximas páginas
+        pagina.close()
+
+    def processar_janela():
+        with medir_etapa("tesseract", paginas=len(janela)):
+            resultados = motor.reconhecer_lote(
+                [imagem for _, _, imagem in janela])
+        for (num, chave, imagem), texto in zip(janela, resultados):
+            concluir_pagina(num, chave, texto, imagem)
+        janela.clear()
+
+    with fitz.open(pdf_path) as doc:
+        if paginas is None:
+            paginas = range(1, doc.page_count + 1)
+
+        for num in paginas:
+            page = doc[num - 1]
+            if OCR_ADAPTATIVO:
+                dpi = "auto-" + "-".join(str(d) for d in sorted(OCR_DPIS_ADAPTATIVOS)) + \
+                    f"-{OCR_CONFIANCA_MINIMA:g}"
+            else:
+                dpi = calcular_dpi_pagina(page)
+
+            chave = None
+            if cache_ocr:
+                parametros_dpi = dpi if OCR_COR == "rgb" else f"{dpi}-{OCR_COR}"
+                chave = CacheExtracao.chave(
+                    hash_pdf, num, parametros_dpi, OCR_LANG, OCR_CONFIG)
+                texto = cache_ocr.obter_texto(chave)
+                if texto is not None:
+                    textos[num] = texto
+                    print(f"[OCR] Página {num} reaproveitada do cache.")
+                    continue
+
+            if OCR_ADAPTATIVO:
+                with medir_etapa("ocr_adaptativo", paginas=1) as contadores:
+                    resultado = ocr_pagina_adaptativo(page)
+                    contadores["tentativas"] = len(resultado["tentativas"]) - 1
+                registrar_ocr_adaptativo(pdf_path, num, resultado)
+                print(f"[OCR] Página {num}: {resultado['dpi']} DPI, "
+                      f"confiança {resultado['confianca']:.1f} "
+                      f"({len(resultado['tentativas'])} tentativa(s)).")
+                concluir_pagina(num, chave, resultado["texto"], resultado["imagem"])
+            else:
+                if dpi != OCR_DPI:
+                    print(f"[OCR] Página {num} rasterizada a {dpi} DPI para caber no orçamento de memória.")
+                with medir_etapa("rasterizacao", paginas=1) as contadores:
+                    imagem = rasterizar_pagina(page, dpi)
+                    contadores["bytes"] = imagem.width * imagem.height * len(imagem.getbands())
+                janela.append((num, chave, imagem))
+                if len(janela) >= motor.instancias:
+                    processar_janela()
+
+        if janela:
+            processar_janela()
+
+    return sorted(textos.items())
+
+
+def extrair_texto_vetorial(pdf_path):
+    textos = []
+    with fitz.open(pdf_path) as doc, medir_etapa("vetorial", paginas=doc.page_count):
+        for num, page in enumerate(doc, start=1):
+            texto = page.get_text().strip()
+            if texto:
+                textos.append((num, texto))
+                salvar_depuracao_pagina(pdf_path, num, texto, "vetorial")
+                print(f"[Vetorial] Página {num} extraída.")
+    return textos
+
+
+def avaliar_camada_texto(page):
+    """
+    Avalia se a camada de texto de uma página do PyMuPDF é boa o suficiente
+    para dispensar o OCR.
+
+    Args:
+        page (fitz.Page): Página do documento aberto com PyMuPDF
+
+    Returns:
+        dict: Texto extraído, métricas de qualidade e a decisão ("vetorial" ou "ocr")
+    """
+    texto = page.get_text().strip()
+    visiveis = [c for c in texto if not c.isspace()]
+
+    # Glifos sem mapeamento Unicode aparecem como U+FFFD, área de uso privado ou controle
+    lixo = sum(1 for c in visiveis
+               if c == "\ufffd" or unicodedata.category(c) in ("Co", "Cn", "Cc"))
+    proporcao_lixo = lixo / len(visiveis) if visiveis else 0.0
+
+    # Fração da página coberta por imagens (páginas digitalizadas ficam perto de 1.0)
+    area_pagina = abs(page.rect) or 1.0
+    area_imagens = 0.0
+    for info in page.get_image_info():
+        area_imagens += abs(fitz.Rect(info["bbox"]) & page.rect)
+    cobertura_imagem = min(area_imagens / area_pagina, 1.0)
+
+    if len(visiveis) < MIN_CARACTERES_VETORIAL:
+        caminho = "ocr"
+    elif proporcao_lixo > MAX_PROPORCAO_LIXO:
+        caminho = "ocr"
+    elif cobertura_imagem > MAX_COBERTURA_IMAGEM and len(visiveis) < MIN_CARACTERES_COM_IMAGEM:
+        caminho = "ocr"
+    else:
+        caminho = "vetorial"
+
+    return {
+        "texto": texto,
+        "caracteres": len(visiveis),
+        "proporcao_lixo": proporcao_lixo,
+        "cobertura_imagem": cobertura_imagem,
+        "caminho": caminho
+    }
+
+
+def extrair_texto_hibrido(pdf_path):
+    """
+    Lê primeiro a camada de texto do PDF e só rasteriza/aplica OCR nas páginas
+    cuja camada vetorial foi reprovada por avaliar_camada_texto.
+
+    Args:
+        pdf_path (str): Caminho para o arquivo PDF
+
+    Returns:
+        tuple: Lista ordenada de (número da página, texto) e dicionário
+               {número da página: "vetorial" | "ocr"} com o caminho usado em cada página
+    """
+    textos = {}
+    caminhos = {}
+    paginas_ocr = []
+
+    with fitz.open(pdf_path) as doc, medir_etapa("vetorial", paginas=doc.page_count):
+        for num, page in enumerate(doc, start=1):
+            avaliacao = avaliar_camada_texto(page)
+            if avaliacao["caminho"] == "vetorial":
+                textos[num] = avaliacao["texto"]
+                caminhos[num] = "vetorial"
+                salvar_depuracao_pagina(
+                    pdf_path, num, avaliacao["texto"], "vetorial")
+                print(f"[Vetorial] Página {num} extraída.")
+            else:
+                paginas_ocr.append(num)
+                print(f"[Vetorial] Página {num} reprovada "
+                      f"(caracteres={avaliacao['caracteres']}, "
+                      f"lixo={avaliacao['proporcao_lixo']:.2f}, "
+                      f"imagem={avaliacao['cobertura_imagem']:.2f}); enviando para OCR.")
+
+    if paginas_ocr:
+        for num, texto in extrair_texto_via_ocr(pdf_path, paginas=paginas_ocr):
+            textos[num] = texto
+            caminhos[num] = "ocr"
+
+    return sorted(textos.items()), caminhos
+
+
+def extrair_texto_completo(pdf_path, modo="hibrido"):
+    """
+    Extrai o texto de todas as páginas do PDF.
+
+    Args:
+        pdf_path (str): Caminho para o arquivo PDF
+        modo (str): "hibrido" usa a camada vetorial e só faz OCR nas páginas reprovadas;
+                    "completo" faz OCR em todas as páginas e prefere o texto vetorial quando existir
+
+    Returns:
+        list: Lista ordenada de tuplas (número da página, texto)
+    """
+    if modo == "hibrido":
+        paginas, caminhos = extrair_texto_hibrido(pdf_path)
+        total_ocr = sum(1 for c in caminhos.values() if c == "ocr")
+        print(f"[Extração] {len(caminhos) - total_ocr} página(s) vetorial(is), "
+              f"{total_ocr} via OCR.")
+        return paginas
+
+    ocr = dict(extrair_texto_via_ocr(pdf_path))
+    vet = dict(extrair_texto_vetorial(pdf_path))
+    todas = {**ocr, **vet}
+    return sorted(todas.items())
+
+
+def classificar_documento(paginas_texto):
+    conteudo = "\n\n".join(f"Página {n}:\n{t}" for n, t in paginas_texto)
 
     prompt_template = PromptTemplate.from_template("""
+        Você está analisando um documento dividido por páginas, onde cada página começa com 'Página X:'.
+        Classifique as páginas de acordo com o conteúdo apresentado. Os tipos de conteúdo que devem ser detectados são:
+        - Voucher:"Número de reserva", "Hóspede", "Quarto:", "check in", "arrival", "chegada", "Quarto nº"
+        - boleto: "Valor do Documento", "Juros/Multa", "Boleto", "Recibo do Pagador", "Local Pagamento", "Pagador"
+        - nota_fiscal: "NOTA FISCAL DE SERVIÇO ELETRÔNICA", "NÚMERO DA NOTA", "TOMADOR DE SERVIÇOS", "PRESTADOR DE SERVIÇOS", "CNAE"
+
+        Considere:
+        - 'voucher' contém a descrição do agendamento, nome do cliente, data de check-in, quarto, valor, forma de pagamento, número do voucher.
+        - 'boleto' contém código de barras, vencimento, valor, cedente ou banco, valor do documento.
+        - 'nota_fiscal' contém CNPJ, descrição de produtos/serviços, impostos, natureza da operação, o tomardor e o prestador de serviços.
+        - 'descarte' é qualquer página que não se encaixa em nenhum dos outros tipos.
+
+        Responda apenas com um JSON, nesse formato:
+        {{
+        "voucher": [1, 2],
+        "boleto": [3],
+        "nota_fiscal": [4, 5]
+        "descarte": [6, 7]
+        }}
+
+        Aqui está o conteúdo do documento:
+
+        {conteudo}
+""")
+
+    llm = ChatOpenAI(model="gpt-4o-mini", temperature=0)
+    chain = prompt_template | llm
+    ai_message = chain.invoke({"conteudo": conteudo})
+
+    # Extrai o texto puro do AIMessage
+    text = ai_message.content if hasattr(
+        ai_message, "content") else str(ai_message)
+
+    try:
+        return extrair_json_resposta(text)
+    except ValueError:
+        print("⚠️ Falha ao parsear JSON:")
+        print(text)
+        return {"erro": "formato inválido", "raw": text}
+
+
+# Modelo usado na classificação (pode ser sobrescrito pelo .env)
+MODELO_CLASSIFICACAO = os.getenv("MODELO_CLASSIFICACAO", "gpt-4o-mini")
+
+# Tipos aceitos na resposta do modelo
+TIPOS_CLASSIFICACAO = ("voucher", "boleto", "nota_fiscal", "descarte")
+
+# Saída estruturada (json_schema) do provedor; SAIDA_ESTRUTURADA=0 desativa
+# para modelos que não a suportam (a resposta continua sendo validada)
+SAIDA_ESTRUTURADA = os.getenv("SAIDA_ESTRUTURADA", "1") != "0"
+
+# Esquema da resposta de classificar_pagina. O modo strict não aceita
+# minimum/maximum, então o intervalo da certeza é conferido em validar_classificacao
+ESQUEMA_CLASSIFICACAO = {
+    "type": "object",
+    "properties": {
+        "tipo": {"type": "string", "enum": list(TIPOS_CLASSIFICACAO)},
+        "indice_certeza": {"type": "number"}
+    },
+    "required": ["tipo", "indice_certeza"],
+    "additionalProperties": False
+}
+FORMATO_RESPOSTA_CLASSIFICACAO = {
+    "type": "json_schema",
+    "json_schema": {"name": "classificacao_documento", "strict": True, "schema": ESQUEMA_CLASSIFICACAO}
+}
+
+# Contadores de validação das respostas, acumulados no processo e somados
+# à tabela metricas_resposta_llm ao final de cada execução
+METRICAS_RESPOSTA_LLM = ("respostas", "falhas_formato", "reparos", "reparos_sem_sucesso")
+_metricas_resposta = dict.fromkeys(METRICAS_RESPOSTA_LLM, 0)
+_trava_metricas = threading.Lock()
+
+# Prompt de classificação de página; usa a sintaxe de str.format, então
+# PROMPT_CLASSIFICACAO_PAGINA.format(conteudo=...) produz o mesmo texto do PromptTemplate
+PROMPT_CLASSIFICACAO_PAGINA = """
         Classifique o documento de acordo com o conteúdo apresentado em uma das seguintes categorias:
         - voucher: Contém informações de reserva de hotel, como número do quarto, nome do cliente, data de check-in, valor, forma de pagamento, número do voucher.
         - boleto: Contém dados de boletos bancários: como código de barras, data do processamento, Nosso número, cedente ou banco e número do boleto, agencia e código do beneficiário, uso do banco, local de pagameto
@@ -516,74 +1697,759 @@ def classificar_pagina(texto_pagina):
           "indice_certeza": 0.95
         }}
 
-        Aqui está o conteúdo do documento:
+        {exemplos}Aqui está o conteúdo do documento:
 
         {conteudo}
-    """)
+    """
 
-    # Criar o modelo LLM com callbacks para coletar métricas
-    llm = ChatOpenAI(model="gpt-4o-mini", temperature=0)
-    chain = prompt_template | llm
+# Prompt curto usado para corrigir uma resposta que não passou na validação,
+# sem reenviar o documento inteiro
+PROMPT_REPARO_CLASSIFICACAO = """
+        A resposta abaixo deveria ser um JSON no formato {{"tipo": "...", "indice_certeza": 0.0}},
+        com tipo entre voucher, boleto, nota_fiscal e descarte e indice_certeza entre 0 e 1,
+        mas foi rejeitada ({motivo}):
 
-    # Invocar o modelo e coletar resposta
-    ai_message = chain.invoke({"conteudo": texto_pagina})
+        {resposta}
 
-    # Extrair informações de uso de tokens se disponíveis
-    tokens_entrada = 0
-    tokens_saida = 0
+        Início do documento classificado:
 
-    # Verificar se há informações de tokens na resposta
-    if hasattr(ai_message, 'response_metadata'):
-        metadata = ai_message.response_metadata
-        tokens_entrada = metadata.get(
-            'token_usage', {}).get('prompt_tokens', 0)
-        tokens_saida = metadata.get(
-            'token_usage', {}).get('completion_tokens', 0)
+        {trecho}
 
-    # Extrai o texto puro do AIMessage
+        Responda apenas com o JSON corrigido.
+    """
+
+# Caracteres do documento incluídos no prompt de reparo
+TAMANHO_TRECHO_REPARO = 1500
+
+# Compilados uma única vez e reutilizados em todas as chamadas
+prompt_classificacao_pagina = PromptTemplate.from_template(
+    PROMPT_CLASSIFICACAO_PAGINA)
+prompt_reparo_classificacao = PromptTemplate.from_template(
+    PROMPT_REPARO_CLASSIFICACAO)
+_chain_classificacao_pagina = None
+_chain_reparo_classificacao = None
+
+
+def criar_llm_classificacao(formato_resposta=None):
+    """Cria o ChatOpenAI de classificação, com saída estruturada quando SAIDA_ESTRUTURADA estiver ativa."""
+    llm = ChatOpenAI(model=MODELO_CLASSIFICACAO, temperature=0)
+    if SAIDA_ESTRUTURADA and formato_resposta is not None:
+        return llm.bind(response_format=formato_resposta)
+    return llm
+
+
+def obter_chain_classificacao_pagina():
+    """
+    Retorna a chain prompt | LLM de classificação de página, criando o
+    cliente ChatOpenAI apenas na primeira chamada.
+    """
+    global _chain_classificacao_pagina
+    if _chain_classificacao_pagina is None:
+        _chain_classificacao_pagina = prompt_classificacao_pagina | criar_llm_classificacao(
+            FORMATO_RESPOSTA_CLASSIFICACAO)
+    return _chain_classificacao_pagina
+
+
+def obter_chain_reparo_classificacao():
+    """Retorna a chain do prompt de reparo, criada na primeira chamada."""
+    global _chain_reparo_classificacao
+    if _chain_reparo_classificacao is None:
+        _chain_reparo_classificacao = prompt_reparo_classificacao | criar_llm_classificacao(
+            FORMATO_RESPOSTA_CLASSIFICACAO)
+    return _chain_reparo_classificacao
+
+
+def registrar_metrica_resposta(nome, quantidade=1):
+    """Incrementa um dos contadores de METRICAS_RESPOSTA_LLM."""
+    with _trava_metricas:
+        _metricas_resposta[nome] += quantidade
+
+
+def persistir_metricas_resposta(db_path="classificacoes.db"):
+    """Soma os contadores do processo à tabela metricas_resposta_llm e os zera."""
+    with _trava_metricas:
+        valores = [(valor, nome) for nome, valor in _metricas_resposta.items() if valor]
+        for nome in _metricas_resposta:
+            _metricas_resposta[nome] = 0
+    if not valores:
+        return
+
+    for valor, nome in valores:
+        executar_escrita(
+            'UPDATE metricas_resposta_llm SET valor = valor + ? WHERE nome = ?', (valor, nome), db_path)
+
+
+def extrair_json_resposta(text):
+    """
+    Lê o JSON de uma resposta do modelo, removendo uma cerca de markdown
+    (```json ... ```) e texto em volta do objeto, se houver.
+
+    Raises:
+        ValueError: Se não houver JSON válido na resposta
+    """
+    resposta = text.strip()
+    cerca = re.match(r"^```[a-zA-Z]*\s*(.*?)\s*```$", resposta, re.DOTALL)
+    if cerca:
+        resposta = cerca.group(1)
+    try:
+        return json.loads(resposta)
+    except json.JSONDecodeError:
+        pass
+
+    inicio = resposta.find("{")
+    fim = resposta.rfind("}")
+    if inicio < 0 or fim <= inicio:
+        raise ValueError("resposta sem objeto JSON")
+    try:
+        return json.loads(resposta[inicio:fim + 1])
+    except json.JSONDecodeError as e:
+        raise ValueError(f"JSON inválido: {e.msg}")
+
+
+def validar_classificacao(dados):
+    """
+    Confere uma classificação contra o esquema (tipo do enum e certeza entre 0 e 1).
+
+    Returns:
+        str: Motivo da rejeição, ou None se a classificação for válida
+    """
+    if not isinstance(dados, dict):
+        return "a resposta não é um objeto"
+    if dados.get("tipo") not in TIPOS_CLASSIFICACAO:
+        return f"tipo inválido: {dados.get('tipo')!r}"
+    certeza = dados.get("indice_certeza")
+    if isinstance(certeza, bool) or not isinstance(certeza, (int, float)):
+        return f"indice_certeza não numérico: {certeza!r}"
+    if not 0.0 <= certeza <= 1.0:
+        return f"indice_certeza fora de 0-1: {certeza}"
+    return None
+
+
+def interpretar_resposta_classificacao(text, tokens_entrada=0, tokens_saida=0):
+    """
+    Converte a resposta textual do modelo no dicionário de classificação,
+    validando-a contra o esquema.
+
+    Args:
+        text (str): Conteúdo retornado pelo modelo
+        tokens_entrada (int): Número de tokens de entrada da chamada
+        tokens_saida (int): Número de tokens de saída da chamada
+
+    Returns:
+        dict: Classificação com métricas de tokens, ou {"erro": motivo, "raw": text, ...}
+              se a resposta não for um JSON válido
+    """
+    registrar_metrica_resposta("respostas")
+    try:
+        dados = extrair_json_resposta(text)
+        motivo = validar_classificacao(dados)
+    except ValueError as e:
+        motivo = str(e)
+
+    if motivo is not None:
+        registrar_metrica_resposta("falhas_formato")
+        print(f"⚠️ Resposta rejeitada ({motivo}):")
+        print(text)
+        return {"erro": motivo, "raw": text, "tokens_entrada": tokens_entrada, "tokens_saida": tokens_saida}
+
+    return {"tipo": dados["tipo"], "indice_certeza": float(dados["indice_certeza"]),
+            "tokens_entrada": tokens_entrada, "tokens_saida": tokens_saida}
+
+
+def extrair_uso_tokens(ai_message):
+    """Retorna (tokens de entrada, tokens de saída) de uma resposta do ChatOpenAI."""
+    metadata = getattr(ai_message, "response_metadata", None) or {}
+    uso = metadata.get("token_usage") or {}
+    return uso.get("prompt_tokens", 0), uso.get("completion_tokens", 0)
+
+
+def reparar_classificacao(texto_pagina, resultado):
+    """
+    Refaz apenas a classificação que falhou na validação, com o prompt curto
+    de reparo. Os tokens do reparo são somados aos da primeira chamada.
+
+    Args:
+        texto_pagina (str): Texto do documento
+        resultado (dict): Classificação com "erro" devolvida por interpretar_resposta_classificacao
+
+    Returns:
+        dict: Classificação reparada, ou a original (com "erro") se o reparo também falhar
+    """
+    if "erro" not in resultado:
+        return resultado
+
+    registrar_metrica_resposta("reparos")
+    registrar_tentativa("llm")
+    ai_message = obter_chain_reparo_classificacao().invoke({
+        "motivo": resultado["erro"],
+        "resposta": (resultado.get("raw") or "")[:1000],
+        "trecho": texto_pagina[:TAMANHO_TRECHO_REPARO]
+    })
+    tokens_entrada, tokens_saida = extrair_uso_tokens(ai_message)
     text = ai_message.content if hasattr(
         ai_message, "content") else str(ai_message)
 
-    # Limpeza de markdown/backticks
-    resposta_limpa = text.strip().lstrip("```json").rstrip("```").strip()
+    reparado = interpretar_resposta_classificacao(
+        text,
+        resultado.get("tokens_entrada", 0) + tokens_entrada,
+        resultado.get("tokens_saida", 0) + tokens_saida)
+    if "erro" in reparado:
+        registrar_metrica_resposta("reparos_sem_sucesso")
+    return reparado
 
-    try:
-        resultado = json.loads(resposta_limpa)
-        # Adicionar métricas de tokens ao resultado
-        resultado["tokens_entrada"] = tokens_entrada
-        resultado["tokens_saida"] = tokens_saida
+
+def classificar_pagina(texto_pagina, exemplos=None):
+    """
+    Classifica uma única página de documento com índice de certeza e coleta métricas de tokens.
+
+    Respostas fora do esquema são reparadas uma vez com reparar_classificacao.
+
+    Args:
+        texto_pagina (str): Texto extraído da página do documento
+        exemplos (list): Exemplos few-shot [{"tipo", "texto"}] incluídos no prompt (opcional)
+
+    Returns:
+        dict: Dicionário com a classificação, índice de certeza e métricas de tokens
+    """
+    chain = obter_chain_classificacao_pagina()
+
+    with medir_etapa("llm"):
+        # Invocar o modelo e coletar resposta
+        ai_message = chain.invoke({"conteudo": texto_pagina,
+                                   "exemplos": formatar_exemplos_few_shot(exemplos)})
+        tokens_entrada, tokens_saida = extrair_uso_tokens(ai_message)
+
+        # Extrai o texto puro do AIMessage
+        text = ai_message.content if hasattr(
+            ai_message, "content") else str(ai_message)
+
+        resultado = interpretar_resposta_classificacao(text, tokens_entrada, tokens_saida)
+        return reparar_classificacao(texto_pagina, resultado)
+
+
+# Versão do prompt: muda sozinha sempre que o texto do template muda,
+# o que invalida as entradas antigas do cache de classificação
+VERSAO_PROMPT_CLASSIFICACAO = hashlib.sha256(
+    PROMPT_CLASSIFICACAO_PAGINA.encode("utf-8")).hexdigest()[:16]
+
+# Número máximo de entradas mantidas no cache (as menos usadas recentemente saem primeiro)
+MAX_ENTRADAS_CACHE_CLASSIFICACAO = int(
+    os.getenv("MAX_ENTRADAS_CACHE_CLASSIFICACAO", "100000"))
+
+
+def normalizar_texto_cache(texto):
+    """
+    Normaliza o texto para que cópias do mesmo documento gerem a mesma chave
+    (forma Unicode NFKC e espaços em branco colapsados).
+    """
+    texto = unicodedata.normalize("NFKC", texto)
+    return " ".join(texto.split())
+
+
+def chave_cache_classificacao(texto, modelo=None, versao_prompt=None):
+    """
+    Calcula a chave de cache de uma classificação.
+
+    Args:
+        texto (str): Texto enviado para classificação
+        modelo (str): Nome do modelo (padrão: MODELO_CLASSIFICACAO)
+        versao_prompt (str): Versão do prompt (padrão: VERSAO_PROMPT_CLASSIFICACAO)
+
+    Returns:
+        str: SHA-256 hexadecimal do texto normalizado, versão do prompt e modelo
+    """
+    modelo = modelo or MODELO_CLASSIFICACAO
+    versao_prompt = versao_prompt or VERSAO_PROMPT_CLASSIFICACAO
+    conteudo = "\x00".join(
+        [versao_prompt, modelo, normalizar_texto_cache(texto)])
+    return hashlib.sha256(conteudo.encode("utf-8")).hexdigest()
+
+
+def buscar_cache_classificacao(texto, db_path="classificacoes.db"):
+    """
+    Procura uma classificação já feita para o mesmo texto e modelo com a versão
+    atual do prompt de página ou, na falta dela, do prompt empacotado.
+
+    Args:
+        texto (str): Texto enviado para classificação
+        db_path (str): Caminho para o arquivo do banco de dados
+
+    Returns:
+        dict: Classificação armazenada (com "cache": True) ou None se não houver
+    """
+    chaves = (chave_cache_classificacao(texto),
+              chave_cache_classificacao(texto, versao_prompt=VERSAO_PROMPT_PACOTE))
+
+    conn = sqlite3.connect(db_path)
+    cursor = conn.cursor()
+
+    cursor.execute('''
+        SELECT tipo_classificacao, indice_certeza, tokens_entrada, tokens_saida, chave
+        FROM cache_classificacao
+        WHERE chave IN (?, ?)
+        ORDER BY versao_prompt = ? DESC
+        LIMIT 1
+    ''', (*chaves, VERSAO_PROMPT_CLASSIFICACAO))
+    linha = cursor.fetchone()
+    conn.close()
+
+    # Consulta feita pelas threads de classificação: o LRU e os contadores
+    # vão pelo escritor único em vez de um commit por consulta
+    if linha:
+        executar_escrita(
+            'UPDATE cache_classificacao SET ultimo_acesso = ? WHERE chave = ?', (time.time(), linha[4]), db_path)
+    executar_escrita('UPDATE cache_classificacao_contadores SET valor = valor + 1 WHERE nome = ?',
+                     ("acertos" if linha else "falhas",), db_path)
+
+    if not linha:
+        return None
+
+    return {
+        "tipo": linha[0],
+        "indice_certeza": linha[1],
+        "tokens_entrada": linha[2],
+        "tokens_saida": linha[3],
+        "cache": True
+    }
+
+
+def gravar_cache_classificacao(texto, classificacao, db_path="classificacoes.db", versao_prompt=None):
+    """
+    Armazena uma classificação no cache e remove as entradas menos usadas
+    recentemente quando o limite MAX_ENTRADAS_CACHE_CLASSIFICACAO é ultrapassado.
+    Respostas com erro de formato não são armazenadas.
+
+    Args:
+        texto (str): Texto enviado para classificação
+        classificacao (dict): Retorno de classificar_pagina
+        db_path (str): Caminho para o arquivo do banco de dados
+        versao_prompt (str): Versão do prompt que gerou a resposta
+                             (padrão: VERSAO_PROMPT_CLASSIFICACAO)
+    """
+    if "erro" in classificacao or "tipo" not in classificacao:
+        return
+
+    versao_prompt = versao_prompt or VERSAO_PROMPT_CLASSIFICACAO
+
+    executar_escrita('''
+        INSERT OR REPLACE INTO cache_classificacao
+        (chave, versao_prompt, modelo, tipo_classificacao, indice_certeza, tokens_entrada, tokens_saida, ultimo_acesso)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+    ''', (
+        chave_cache_classificacao(texto, versao_prompt=versao_prompt),
+        versao_prompt,
+        MODELO_CLASSIFICACAO,
+        classificacao["tipo"],
+        classificacao.get("indice_certeza", 0.0),
+        classificacao.get("tokens_entrada", 0),
+        classificacao.get("tokens_saida", 0),
+        time.time()
+    ), db_path)
+
+    # Despejo LRU
+    executar_escrita('''
+        DELETE FROM cache_classificacao
+        WHERE chave IN (
+            SELECT chave FROM cache_classificacao
+            ORDER BY ultimo_acesso DESC
+            LIMIT -1 OFFSET ?
+        )
+    ''', (MAX_ENTRADAS_CACHE_CLASSIFICACAO,), db_path)
+
+
+def invalidar_cache_classificacao(db_path="classificacoes.db", tudo=False):
+    """
+    Remove do cache as entradas geradas com versões antigas dos prompts de
+    página e empacotado.
+
+    Args:
+        db_path (str): Caminho para o arquivo do banco de dados
+        tudo (bool): Se True, esvazia o cache inteiro
+
+    Returns:
+        int: Número de entradas removidas
+    """
+    conn = sqlite3.connect(db_path)
+    cursor = conn.cursor()
+
+    if tudo:
+        cursor.execute('DELETE FROM cache_classificacao')
+    else:
+        cursor.execute('DELETE FROM cache_classificacao WHERE versao_prompt NOT IN (?, ?)',
+                       (VERSAO_PROMPT_CLASSIFICACAO, VERSAO_PROMPT_PACOTE))
+    removidas = cursor.rowcount
+
+    conn.commit()
+    conn.close()
+
+    if removidas:
+        print(f"[Cache] {removidas} classificação(ões) invalidada(s).")
+    return removidas
+
+
+def classificar_pagina_com_cache(texto_pagina, db_path="classificacoes.db"):
+    """
+    Igual a classificar_pagina, mas consulta antes o cache de classificações
+    e só chama o modelo em caso de falha no cache.
+
+    Args:
+        texto_pagina (str): Texto extraído da página do documento
+        db_path (str): Caminho para o arquivo do banco de dados
+
+    Returns:
+        dict: Dicionário com a classificação, índice de certeza e métricas de tokens
+    """
+    resultado = buscar_cache_classificacao(texto_pagina, db_path)
+    if resultado is not None:
+        print("    [Cache] Classificação reaproveitada.")
         return resultado
-    except json.JSONDecodeError:
-        print("⚠️ Falha ao parsear JSON:")
+
+    resultado = classificar_pagina(texto_pagina)
+    gravar_cache_classificacao(texto_pagina, resultado, db_path)
+    return resultado
+
+
+def classificar_sem_llm(texto_pagina, db_path="classificacoes.db"):
+    """
+    Executa os estágios de classificação que não chamam o LLM: cache de
+    classificações, pré-classificador local e kNN sobre o índice FAISS de
+    páginas validadas (se CLASSIFICADOR_KNN estiver ativo).
+
+    Args:
+        texto_pagina (str): Texto extraído do documento
+        db_path (str): Caminho para o arquivo do banco de dados
+
+    Returns:
+        tuple: (classificação, exemplos). A classificação é None quando o texto
+               precisa ir para o LLM; exemplos são os vizinhos do kNN usados como few-shot
+    """
+    resultado = buscar_cache_classificacao(texto_pagina, db_path)
+    if resultado is not None:
+        print("    [Cache] Classificação reaproveitada.")
+        resultado["origem"] = "cache"
+        return resultado, None
+
+    if PRE_CLASSIFICADOR:
+        local = obter_pre_classificador().classificar(texto_pagina)
+        if not local["escalar"]:
+            print(f"    [Local] {local['tipo']} ({local['indice_certeza']:.2f}); LLM dispensado.")
+            return {"tipo": local["tipo"], "indice_certeza": local["indice_certeza"],
+                    "tokens_entrada": 0, "tokens_saida": 0, "origem": "local"}, None
+
+    exemplos = None
+    if CLASSIFICADOR_KNN:
+        knn = obter_classificador_knn().classificar(texto_pagina)
+        if not knn["escalar"]:
+            print(f"    [kNN] {knn['tipo']} ({knn['indice_certeza']:.2f}); LLM dispensado.")
+            return {"tipo": knn["tipo"], "indice_certeza": knn["indice_certeza"],
+                    "tokens_entrada": 0, "tokens_saida": 0, "origem": "knn"}, None
+        exemplos = knn["exemplos"][:3]
+
+    return None, exemplos
+
+
+def gravar_classificacao_llm(texto_pagina, resultado, db_path="classificacoes.db", versao_prompt=None):
+    """
+    Guarda uma resposta do LLM no cache de classificações.
+
+    As respostas do LLM não entram no índice kNN, que só recebe páginas com
+    o tipo confirmado no dashboard (classificador_knn.indexar_banco): indexá-las
+    reforçaria os próprios erros do modelo.
+
+    Args:
+        texto_pagina (str): Texto enviado ao LLM
+        resultado (dict): Classificação retornada pelo LLM
+        db_path (str): Caminho para o arquivo do banco de dados
+        versao_prompt (str): Versão do prompt usado (padrão: VERSAO_PROMPT_CLASSIFICACAO;
+                             respostas empacotadas usam VERSAO_PROMPT_PACOTE)
+    """
+    gravar_cache_classificacao(texto_pagina, resultado, db_path, versao_prompt)
+
+
+def classificar_texto(texto_pagina, db_path="classificacoes.db", classificar_llm=None):
+    """
+    Classifica o texto de um documento passando pelos estágios do mais barato
+    ao mais caro: cache de classificações, pré-classificador local, kNN sobre
+    o índice FAISS de páginas validadas (se CLASSIFICADOR_KNN estiver ativo) e,
+    só se nenhum deles atingir a certeza mínima, o LLM, que recebe os vizinhos
+    do kNN como exemplos few-shot.
+
+    Args:
+        texto_pagina (str): Texto extraído do documento
+        db_path (str): Caminho para o arquivo do banco de dados
+        classificar_llm (callable): Chamada ao LLM como classificar_llm(texto, exemplos)
+                                    (padrão: classificar_pagina)
+
+    Returns:
+        dict: Classificação, índice de certeza, métricas de tokens e "origem"
+              ("cache", "local", "knn" ou "llm")
+    """
+    resultado, exemplos = classificar_sem_llm(texto_pagina, db_path)
+    if resultado is not None:
+        return resultado
+
+    resultado = (classificar_llm or classificar_pagina)(texto_pagina, exemplos)
+    gravar_classificacao_llm(texto_pagina, resultado, db_path)
+    resultado["origem"] = "llm"
+    return resultado
+
+
+# Empacotamento: vários documentos por requisição, até o orçamento de tokens de entrada
+ORCAMENTO_TOKENS_PACOTE = int(os.getenv("ORCAMENTO_TOKENS_PACOTE", "8000"))
+MAX_DOCUMENTOS_PACOTE = int(os.getenv("MAX_DOCUMENTOS_PACOTE", "20"))
+MAX_TENTATIVAS_PACOTE = 2
+
+PROMPT_CLASSIFICACAO_PACOTE = """
+        Você receberá vários documentos, cada um entre <documento id="N"> e </documento>.
+        Classifique cada documento, de forma independente, em uma das seguintes categorias:
+        - voucher: Contém informações de reserva de hotel, como número do quarto, nome do cliente, data de check-in, valor, forma de pagamento, número do voucher.
+        - boleto: Contém dados de boletos bancários: como código de barras, data do processamento, Nosso número, cedente ou banco e número do boleto, agencia e código do beneficiário, uso do banco, local de pagameto
+        - nota_fiscal: Contém informações de notas fiscais de serviço, como CNPJ, descrição de produtos/serviços, impostos.
+        - descarte: Qualquer documento que não se encaixa nas categorias acima
+
+        Para cada documento, atribua também um score de confiança entre 0 e 1, onde:
+        - 0.9-1.0: Certeza quase absoluta
+        - 0.7-0.9: Alta confiança
+        - 0.5-0.7: Confiança moderada
+        - 0.3-0.5: Baixa confiança
+        - 0.0-0.3: Muito baixa confiança
+
+        Responda apenas com um JSON com uma entrada para cada id recebido, nesse formato:
+        {{
+          "documentos": [
+            {{"id": "1", "tipo": "voucher", "indice_certeza": 0.95}},
+            {{"id": "2", "tipo": "boleto", "indice_certeza": 0.80}}
+          ]
+        }}
+
+        {documentos}
+    """
+
+# Respostas empacotadas vão para o cache com a versão do prompt empacotado
+# (tokens rateados entre os documentos do pacote): mudar esse prompt invalida
+# só essas entradas
+VERSAO_PROMPT_PACOTE = hashlib.sha256(
+    PROMPT_CLASSIFICACAO_PACOTE.encode("utf-8")).hexdigest()[:16]
+
+FORMATO_RESPOSTA_PACOTE = {
+    "type": "json_schema",
+    "json_schema": {
+        "name": "classificacao_pacote",
+        "strict": True,
+        "schema": {
+            "type": "object",
+            "properties": {
+                "documentos": {
+                    "type": "array",
+                    "items": {
+                        "type": "object",
+                        "properties": {"id": {"type": "string"}, **ESQUEMA_CLASSIFICACAO["properties"]},
+                        "required": ["id", *ESQUEMA_CLASSIFICACAO["required"]],
+                        "additionalProperties": False
+                    }
+                }
+            },
+            "required": ["documentos"],
+            "additionalProperties": False
+        }
+    }
+}
+
+prompt_classificacao_pacote = PromptTemplate.from_template(
+    PROMPT_CLASSIFICACAO_PACOTE)
+_chain_classificacao_pacote = None
+
+
+def obter_chain_classificacao_pacote():
+    """Retorna a chain prompt | LLM de classificação empacotada, criada na primeira chamada."""
+    global _chain_classificacao_pacote
+    if _chain_classificacao_pacote is None:
+        _chain_classificacao_pacote = prompt_classificacao_pacote | criar_llm_classificacao(
+            FORMATO_RESPOSTA_PACOTE)
+    return _chain_classificacao_pacote
+
+
+def distribuir_tokens(total, pesos):
+    """
+    Reparte um total inteiro de tokens proporcionalmente aos pesos, sem
+    perder nem criar tokens no arredondamento (maiores restos).
+
+    Args:
+        total (int): Tokens a repartir
+        pesos (list): Peso de cada item
+
+    Returns:
+        list: Tokens de cada item, somando exatamente `total`
+    """
+    soma = sum(pesos)
+    if not pesos:
+        return []
+    if soma <= 0:
+        pesos = [1] * len(pesos)
+        soma = len(pesos)
+    cotas = [total * peso / soma for peso in pesos]
+    partes = [int(cota) for cota in cotas]
+    restantes = total - sum(partes)
+    for i in sorted(range(len(cotas)), key=lambda i: cotas[i] - partes[i], reverse=True)[:restantes]:
+        partes[i] += 1
+    return partes
+
+
+def montar_pacotes(textos, orcamento_tokens=None, max_documentos=None):
+    """
+    Agrupa os textos em pacotes que cabem no orçamento de tokens de entrada.
+
+    Args:
+        textos (list): Textos dos documentos
+        orcamento_tokens (int): Máximo de tokens de documentos por pacote
+        max_documentos (int): Máximo de documentos por pacote
+
+    Returns:
+        list: Listas de índices dos textos; um texto maior que o orçamento vai sozinho
+    """
+    orcamento_tokens = orcamento_tokens or ORCAMENTO_TOKENS_PACOTE
+    max_documentos = max_documentos or MAX_DOCUMENTOS_PACOTE
+
+    pacotes = []
+    atual = []
+    tokens_atual = 0
+    for indice, texto in enumerate(textos):
+        tokens = contar_tokens(texto)
+        if atual and (tokens_atual + tokens > orcamento_tokens or len(atual) >= max_documentos):
+            pacotes.append(atual)
+            atual = []
+            tokens_atual = 0
+        atual.append(indice)
+        tokens_atual += tokens
+    if atual:
+        pacotes.append(atual)
+    return pacotes
+
+
+def interpretar_resposta_pacote(text, ids):
+    """
+    Extrai as classificações válidas de uma resposta empacotada.
+
+    Args:
+        text (str): Conteúdo retornado pelo modelo
+        ids (list): Ids enviados no pacote
+
+    Returns:
+        dict: {id: {"tipo", "indice_certeza"}} apenas dos itens bem formados
+    """
+    registrar_metrica_resposta("respostas", len(ids))
+    try:
+        dados = extrair_json_resposta(text)
+    except ValueError as e:
+        registrar_metrica_resposta("falhas_formato", len(ids))
+        print(f"⚠️ Resposta do pacote rejeitada ({e}):")
         print(text)
-        return {"erro": "formato inválido", "raw": text, "tokens_entrada": tokens_entrada, "tokens_saida": tokens_saida}
+        return {}
+
+    itens = dados.get("documentos", []) if isinstance(dados, dict) else dados
+    validos = {}
+    for item in itens if isinstance(itens, list) else []:
+        if not isinstance(item, dict):
+            continue
+        item_id = str(item.get("id"))
+        if item_id not in ids or validar_classificacao(item) is not None:
+            continue
+        validos[item_id] = {"tipo": item["tipo"], "indice_certeza": float(item["indice_certeza"])}
 
+    registrar_metrica_resposta("falhas_formato", len(ids) - len(validos))
+    return validos
 
-def processar_diretorio_amostragem(diretorio_base="amostragem/Parte_1/29675", diretorio_saida="amostragem/Parte_1/OUTPUT"):
+
+def classificar_pacote(textos):
     """
-    Processa todos os arquivos PDF no diretório de amostragem e salva resultados em JSON.
-    Processa todos os arquivos de uma pasta antes de passar para a próxima.
+    Classifica vários documentos com uma única chamada ao LLM.
+
+    Itens ausentes ou malformados na resposta são reenviados sozinhos em um
+    pacote menor; depois de MAX_TENTATIVAS_PACOTE, cada um vai por
+    classificar_pagina. Os tokens de cada chamada são repartidos entre os
+    documentos dela: a entrada proporcionalmente ao tamanho de cada texto
+    (o preâmbulo do prompt em partes iguais) e a saída em partes iguais.
+
+    Args:
+        textos (list): Textos dos documentos
+
+    Returns:
+        list: Classificações na mesma ordem dos textos, com tokens_entrada/tokens_saida de cada documento
+    """
+    chain = obter_chain_classificacao_pacote()
+    tokens_preambulo = contar_tokens(PROMPT_CLASSIFICACAO_PACOTE)
+    resultados = [None] * len(textos)
+    tokens = [[0, 0] for _ in textos]
+
+    faltando = list(range(len(textos)))
+    for tentativa in range(MAX_TENTATIVAS_PACOTE):
+        if not faltando:
+            break
+        ids = [str(i + 1) for i in range(len(faltando))]
+        documentos = "\n\n".join(f'<documento id="{item_id}">\n{textos[indice]}\n</documento>'
+                                 for item_id, indice in zip(ids, faltando))
+
+        if tentativa > 0:
+            registrar_metrica_resposta("reparos", len(faltando))
+        ai_message = chain.invoke({"documentos": documentos})
+        tokens_entrada, tokens_saida = extrair_uso_tokens(ai_message)
+        text = ai_message.content if hasattr(
+            ai_message, "content") else str(ai_message)
+
+        pesos = [contar_tokens(textos[indice]) + tokens_preambulo / len(faltando)
+                 for indice in faltando]
+        for indice, entrada, saida in zip(faltando,
+                                          distribuir_tokens(tokens_entrada, pesos),
+                                          distribuir_tokens(tokens_saida, [1] * len(faltando))):
+            tokens[indice][0] += entrada
+            tokens[indice][1] += saida
+
+        validos = interpretar_resposta_pacote(text, ids)
+        restantes = []
+        for item_id, indice in zip(ids, faltando):
+            if item_id in validos:
+                resultados[indice] = validos[item_id]
+            else:
+                restantes.append(indice)
+        if restantes:
+            print(f"    [Pacote] {len(restantes)} de {len(faltando)} item(ns) sem resposta válida "
+                  f"(tentativa {tentativa + 1}/{MAX_TENTATIVAS_PACOTE}).")
+        if tentativa > 0:
+            registrar_metrica_resposta("reparos_sem_sucesso", len(restantes))
+        faltando = restantes
+
+    for indice in faltando:
+        resultados[indice] = classificar_pagina(textos[indice])
+        tokens[indice][0] += resultados[indice].get("tokens_entrada", 0)
+        tokens[indice][1] += resultados[indice].get("tokens_saida", 0)
+
+    for resultado, (entrada, saida) in zip(resultados, tokens):
+        resultado["tokens_entrada"] = entrada
+        resultado["tokens_saida"] = saida
+    return resultados
+
+
+def listar_pdfs_amostragem(diretorio_base):
+    """
+    Lista os PDFs do diretório de amostragem na ordem de processamento:
+    subdiretórios em ordem alfabética e, dentro de cada um, arquivos ordenados.
 
     Args:
         diretorio_base (str): Caminho base para o diretório de amostragem
-        diretorio_saida (str): Caminho para o diretório de saída dos resultados
+
+    Returns:
+        list: Caminhos dos arquivos PDF em ordem determinística
     """
     import glob
 
-    # Criar diretório de saída se não existir
-    os.makedirs(diretorio_saida, exist_ok=True)
-
     # Obter lista ordenada de subdiretórios
     subdiretorios = sorted([d for d in os.listdir(
         diretorio_base) if os.path.isdir(os.path.join(diretorio_base, d))])
 
     print(f"Encontrados {len(subdiretorios)} subdiretórios para processar")
 
-    # Processar cada subdiretório em ordem
-    resultados = []
+    arquivos = []
     for subdiretorio in subdiretorios:
-        print(f"Processando diretório: {subdiretorio}")
-
         # Encontrar todos os arquivos PDF no subdiretório atual
         caminho_subdiretorio = os.path.join(diretorio_base, subdiretorio)
         padrao = os.path.join(caminho_subdiretorio, "*.pdf")
@@ -594,62 +2460,451 @@ def processar_diretorio_amostragem(diretorio_base="amostragem/Parte_1/29675", di
 
         print(
             f"  Encontrados {len(arquivos_pdf)} arquivos PDF no diretório {subdiretorio}")
+        arquivos.extend(arquivos_pdf)
+
+    return arquivos
+
+
+def nome_arquivo_saida(arquivo_pdf):
+    """
+    Retorna o nome do arquivo usado no banco e no JSON de saída
+    (nome do PDF sem o prefixo "page_").
+    """
+    nome_arquivo_completo = os.path.basename(arquivo_pdf)
+    if nome_arquivo_completo.startswith("page_"):
+        # Remove "page_" do início
+        return nome_arquivo_completo[5:]
+    return nome_arquivo_completo
+
+
+def extrair_texto_combinado(arquivo_pdf):
+    """
+    Extrai o texto de todas as páginas do PDF e junta em uma única string.
+
+    Com REDUTOR_ENTRADA ativo, o texto é reduzido a ORCAMENTO_TOKENS_DOCUMENTO
+    tokens (início da primeira página e trechos com mais palavras-chave) e os
+    tokens antes/depois são registrados em LOG_REDUTOR_ENTRADA.
+
+    Args:
+        arquivo_pdf (str): Caminho para o arquivo PDF
+
+    Returns:
+        str: Texto das páginas separado por quebras de linha
+    """
+    texto_pagina = extrair_texto_completo(arquivo_pdf)
+    if not REDUTOR_ENTRADA:
+        return "\n".join([texto for _, texto in texto_pagina])
+
+    texto, tokens_antes, tokens_depois = reduzir_texto(
+        [texto for _, texto in texto_pagina], ORCAMENTO_TOKENS_DOCUMENTO, MODELO_CLASSIFICACAO)
+    print(f"    [Redutor] {tokens_antes} -> {tokens_depois} tokens")
+    if LOG_REDUTOR_ENTRADA:
+        registro = {
+            "arquivo": arquivo_pdf,
+            "paginas": len(texto_pagina),
+            "tokens_antes": tokens_antes,
+            "tokens_depois": tokens_depois,
+            "orcamento": ORCAMENTO_TOKENS_DOCUMENTO,
+            "data": datetime.now().isoformat(timespec="seconds")
+        }
+        with open(LOG_REDUTOR_ENTRADA, "a", encoding="utf-8") as f:
+            f.write(json.dumps(registro, ensure_ascii=False) + "\n")
+    return texto
+
+
+def registrar_resultado(arquivo_pdf, classificacao, diretorio_saida, hash_arquivo=None, substituir=False, db_path="classificacoes.db",
+                        texto=None):
+    """
+    Monta o resultado no formato de saída, grava no banco e no JSON do arquivo.
+
+    Args:
+        arquivo_pdf (str): Caminho do PDF classificado
+        classificacao (dict): Retorno de classificar_pagina
+        diretorio_saida (str): Diretório dos arquivos JSON de resultado
+        hash_arquivo (str): SHA-256 do PDF (opcional)
+        substituir (bool): Atualiza a linha existente em vez de inserir uma nova
+        db_path (str): Caminho para o arquivo do banco de dados
+        texto (str): Texto classificado, guardado para treinar o pré-classificador (opcional)
+
+    Returns:
+        dict: Resultado formatado
+
+    Raises:
+        ValueError: Se a classificação tiver "erro" (resposta inválida mesmo após o reparo);
+                    o arquivo fica como falhou em vez de ser gravado como desconhecido
+    """
+    if "erro" in classificacao:
+        raise ValueError(f"resposta do modelo inválida: {classificacao['erro']}")
+
+    nome_arquivo = nome_arquivo_saida(arquivo_pdf)
+
+    resultado_formatado = {
+        "nome_arquivo": nome_arquivo,
+        "classificacao": {
+            "tipo": classificacao.get("tipo", "desconhecido"),
+            "indice_certeza": classificacao.get("indice_certeza", 0.0)
+        },
+        "tokens_entrada": classificacao.get("tokens_entrada", 0),
+        "tokens_saida": classificacao.get("tokens_saida", 0)
+    }
+
+    # Inserir resultado no banco de dados (com o escritor em lote, mede só o enfileiramento)
+    with medir_etapa("banco"):
+        inserir_classificacao_db(
+            nome_arquivo,
+            arquivo_pdf,
+            resultado_formatado["classificacao"],
+            resultado_formatado["tokens_entrada"],
+            resultado_formatado["tokens_saida"],
+            db_path=db_path,
+            hash_arquivo=hash_arquivo,
+            substituir=substituir,
+            origem=classificacao.get("origem")
+        )
+        if texto is not None:
+            salvar_texto_documento(arquivo_pdf, nome_arquivo, texto, hash_arquivo, db_path)
+
+    # Salvar resultado em arquivo JSON
+    nome_arquivo_json = nome_arquivo.replace(".pdf", ".json")
+    caminho_json = os.path.join(diretorio_saida, nome_arquivo_json)
+    with open(caminho_json, "w", encoding="utf-8") as f:
+        json.dump(resultado_formatado, f,
+                  indent=2, ensure_ascii=False)
+
+    print(f"    Classificação: {classificacao}")
+    print(
+        f"    Tokens - Entrada: {classificacao.get('tokens_entrada', 0)}, Saída: {classificacao.get('tokens_saida', 0)}")
+
+    return resultado_formatado
+
+
+def preparar_execucao(diretorio_base, forcar=False, execucao_id=None, db_path="classificacoes.db"):
+    """
+    Lista os PDFs do diretório, descarta os que já foram classificados e
+    registra (ou retoma) a execução com os arquivos restantes como pendentes.
+
+    Args:
+        diretorio_base (str): Caminho base para o diretório de amostragem
+        forcar (bool): Reprocessa também os arquivos já classificados
+        execucao_id (str): Execução anterior a retomar (opcional)
+        db_path (str): Caminho para o arquivo do banco de dados
+
+    Returns:
+        tuple: Identificador da execução e lista de (caminho, hash, substituir) a processar
+    """
+    # Validações feitas no dashboard desde a última execução entram no índice kNN
+    if CLASSIFICADOR_KNN:
+        indexar_validadas(db_path)
+
+    arquivos = listar_pdfs_amostragem(diretorio_base)
+    pendentes, pulados = selecionar_arquivos_pendentes(
+        arquivos, forcar=forcar, db_path=db_path)
+    execucao_id = criar_execucao(diretorio_base, [arquivo for arquivo, _, _ in pendentes],
+                                 db_path=db_path, execucao_id=execucao_id)
+
+    print(f"Execução {execucao_id}: {len(pendentes)} arquivo(s) a processar, "
+          f"{pulados} já classificado(s)")
+    return execucao_id, pendentes
 
-        # Processar cada arquivo no subdiretório
-        for arquivo_pdf in arquivos_pdf:
-            try:
-                print(f"  Processando: {os.path.basename(arquivo_pdf)}")
 
-                # Extrair texto do PDF
-                texto_pagina = extrair_texto_completo(arquivo_pdf)
-                texto_combinado = "\n".join(
-                    [texto for _, texto in texto_pagina])
+def processar_diretorio_amostragem(diretorio_base="amostragem/Parte_1/29675", diretorio_saida="amostragem/Parte_1/OUTPUT",
+                                   forcar=False, execucao_id=None, db_path="classificacoes.db"):
+    """
+    Processa todos os arquivos PDF no diretório de amostragem e salva resultados em JSON.
+    Processa todos os arquivos de uma pasta antes de passar para a próxima.
+
+    Arquivos já classificados (mesmo caminho, com tamanho e mtime iguais ou,
+    se mudaram, o mesmo hash) são pulados antes de qualquer OCR ou chamada ao
+    modelo, então uma execução interrompida pode simplesmente ser reiniciada. O andamento de cada arquivo fica em execucao_arquivos.
+
+    Args:
+        diretorio_base (str): Caminho base para o diretório de amostragem
+        diretorio_saida (str): Caminho para o diretório de saída dos resultados
+        forcar (bool): Reprocessa também os arquivos já classificados, atualizando as linhas
+        execucao_id (str): Execução anterior a retomar (opcional)
+        db_path (str): Caminho para o arquivo do banco de dados
+    """
+    # Criar diretório de saída se não existir
+    os.makedirs(diretorio_saida, exist_ok=True)
+
+    execucao_id, pendentes = preparar_execucao(
+        diretorio_base, forcar=forcar, execucao_id=execucao_id, db_path=db_path)
+
+    # Processar cada arquivo em ordem
+    resultados = []
+    perfis = PerfisLentos()
+    for arquivo_pdf, hash_pdf, substituir in pendentes:
+        iniciar_medicao(arquivo_pdf, perfis.ativo)
+        try:
+            print(f"  Processando: {os.path.basename(arquivo_pdf)}")
+
+            # Extrair texto do PDF
+            texto_combinado = extrair_texto_combinado(arquivo_pdf)
+            atualizar_status_arquivo(
+                execucao_id, arquivo_pdf, "extraido", db_path=db_path)
+
+            # Classificar a página com coleta de métricas
+            classificacao = classificar_texto(texto_combinado, db_path)
+
+            resultados.append(registrar_resultado(
+                arquivo_pdf, classificacao, diretorio_saida,
+                hash_arquivo=hash_pdf, substituir=substituir, db_path=db_path,
+                texto=texto_combinado))
+            atualizar_status_arquivo(
+                execucao_id, arquivo_pdf, "classificado", db_path=db_path)
+        except Exception as e:
+            print(f"    Erro ao processar {arquivo_pdf}: {str(e)}")
+            atualizar_status_arquivo(
+                execucao_id, arquivo_pdf, "falhou", erro=str(e), db_path=db_path)
+        registrar_medicao(execucao_id, finalizar_medicao(), perfis, db_path)
+
+    print(f"Execução {execucao_id} finalizada: {finalizar_execucao(execucao_id, db_path)}")
+    concluir_telemetria(execucao_id, perfis, db_path)
+    return resultados
+
+
+def processar_diretorio_paralelo(diretorio_base="amostragem/Parte_1/29675", diretorio_saida="amostragem/Parte_1/OUTPUT",
+                                 workers=None, workers_classificacao=4, janela=None,
+                                 forcar=False, execucao_id=None, db_path="classificacoes.db"):
+    """
+    Versão paralela de processar_diretorio_amostragem.
+
+    A extração (rasterização + OCR, limitada por CPU) roda em um pool de processos,
+    a classificação (limitada pela rede) roda em um pool de threads separado e a
+    gravação no SQLite/JSON é feita apenas pela thread principal, na mesma ordem
+    do processamento sequencial, independentemente do número de workers.
+
+    Args:
+        diretorio_base (str): Caminho base para o diretório de amostragem
+        diretorio_saida (str): Caminho para o diretório de saída dos resultados
+        workers (int): Processos de extração (padrão: número de CPUs)
+        workers_classificacao (int): Chamadas simultâneas ao modelo (com CLASSIFICADOR_ASYNC,
+                                     também o limite de concorrência do ClassificadorAsync)
+        janela (int): Máximo de arquivos em andamento à frente do último gravado
+                      (padrão: 4 x workers), limita a memória usada pelos textos pendentes
+        forcar (bool): Reprocessa também os arquivos já classificados, atualizando as linhas
+        execucao_id (str): Execução anterior a retomar (opcional)
+        db_path (str): Caminho para o arquivo do banco de dados
+
+    Returns:
+        list: Resultados formatados na ordem dos arquivos
+    """
+    from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+    os.makedirs(diretorio_saida, exist_ok=True)
 
-                # Classificar a página com coleta de métricas
-                classificacao = classificar_pagina(texto_combinado)
+    execucao_id, arquivos = preparar_execucao(
+        diretorio_base, forcar=forcar, execucao_id=execucao_id, db_path=db_path)
+    workers = workers or os.cpu_count() or 1
+    janela = janela or workers * 4
 
-                # Preparar resultado no formato especificado
-                # Extrair o nome do arquivo sem o prefixo "page_"
-                nome_arquivo_completo = os.path.basename(arquivo_pdf)
-                if nome_arquivo_completo.startswith("page_"):
-                    # Remove "page_" do início
-                    nome_arquivo = nome_arquivo_completo[5:]
+    print(f"Processando {len(arquivos)} arquivos com {workers} processo(s) de extração "
+          f"e {workers_classificacao} classificação(ões) simultânea(s)")
+
+    # Com CLASSIFICADOR_ASYNC as threads de classificação delegam a chamada ao
+    # LLM a um único ClassificadorAsync, que coordena o rate limit entre elas
+    classificador_async = None
+    classificar_llm = None
+    if CLASSIFICADOR_ASYNC:
+        from classificador_async import ClassificadorAsyncEmThread
+        classificador_async = ClassificadorAsyncEmThread(max_concorrencia=workers_classificacao)
+        classificar_llm = classificador_async.classificar
+
+    resultados = []
+    pendentes = {}  # future -> (índice do arquivo, etapa)
+    prontos = {}    # índice do arquivo -> classificação ou exceção
+    textos = {}     # índice do arquivo -> texto extraído, até a gravação
+    medicoes = {}   # índice do arquivo -> tempos da extração e da classificação
+    perfis = PerfisLentos()
+    proximo_envio = 0
+    proximo_gravar = 0
+
+    with ProcessPoolExecutor(max_workers=workers) as pool_extracao, \
+            ThreadPoolExecutor(max_workers=workers_classificacao) as pool_classificacao:
+        while proximo_gravar < len(arquivos):
+            # Manter no máximo `janela` arquivos em andamento
+            while proximo_envio < len(arquivos) and proximo_envio - proximo_gravar < janela:
+                futuro = pool_extracao.submit(
+                    executar_medido, arquivos[proximo_envio][0], perfis.ativo,
+                    extrair_texto_combinado, arquivos[proximo_envio][0])
+                pendentes[futuro] = (proximo_envio, "extracao")
+                proximo_envio += 1
+
+            concluidos, _ = wait(pendentes, return_when=FIRST_COMPLETED)
+            for futuro in concluidos:
+                indice, etapa = pendentes.pop(futuro)
+                try:
+                    valor, medicao = futuro.result()
+                except Exception as e:
+                    prontos[indice] = e
+                    continue
+
+                if indice in medicoes:
+                    medicoes[indice].mesclar(medicao)
                 else:
-                    nome_arquivo = nome_arquivo_completo
-
-                resultado_formatado = {
-                    "nome_arquivo": nome_arquivo,
-                    "classificacao": {
-                        "tipo": classificacao.get("tipo", "desconhecido"),
-                        "indice_certeza": classificacao.get("indice_certeza", 0.0)
-                    },
-                    "tokens_entrada": classificacao.get("tokens_entrada", 0),
-                    "tokens_saida": classificacao.get("tokens_saida", 0)
-                }
-                resultados.append(resultado_formatado)
-
-                # Inserir resultado no banco de dados
-                inserir_classificacao_db(
-                    nome_arquivo,
-                    arquivo_pdf,
-                    resultado_formatado["classificacao"],
-                    resultado_formatado["tokens_entrada"],
-                    resultado_formatado["tokens_saida"]
-                )
-
-                # Salvar resultado em arquivo JSON
-                nome_arquivo_json = nome_arquivo.replace(".pdf", ".json")
-                caminho_json = os.path.join(diretorio_saida, nome_arquivo_json)
-                with open(caminho_json, "w", encoding="utf-8") as f:
-                    json.dump(resultado_formatado, f,
-                              indent=2, ensure_ascii=False)
-
-                print(f"    Classificação: {classificacao}")
-                print(
-                    f"    Tokens - Entrada: {classificacao.get('tokens_entrada', 0)}, Saída: {classificacao.get('tokens_saida', 0)}")
+                    medicoes[indice] = medicao
+
+                if etapa == "extracao":
+                    atualizar_status_arquivo(
+                        execucao_id, arquivos[indice][0], "extraido", db_path=db_path)
+                    textos[indice] = valor
+                    futuro_classificacao = pool_classificacao.submit(
+                        executar_medido, arquivos[indice][0], perfis.ativo,
+                        classificar_texto, valor, db_path, classificar_llm)
+                    pendentes[futuro_classificacao] = (indice, "classificacao")
+                else:
+                    prontos[indice] = valor
+
+            # Gravar em ordem tudo o que já estiver pronto
+            while proximo_gravar in prontos:
+                arquivo_pdf, hash_pdf, substituir = arquivos[proximo_gravar]
+                valor = prontos.pop(proximo_gravar)
+                texto = textos.pop(proximo_gravar, None)
+                proximo_gravar += 1
+
+                print(f"  Processando: {os.path.basename(arquivo_pdf)}")
+                medicao = iniciar_medicao(arquivo_pdf)
+                try:
+                    if isinstance(valor, Exception):
+                        raise valor
+                    resultados.append(registrar_resultado(
+                        arquivo_pdf, valor, diretorio_saida,
+                        hash_arquivo=hash_pdf, substituir=substituir, db_path=db_path,
+                        texto=texto))
+                    atualizar_status_arquivo(
+                        execucao_id, arquivo_pdf, "classificado", db_path=db_path)
+                except Exception as e:
+                    print(f"    Erro ao processar {arquivo_pdf}: {str(e)}")
+                    atualizar_status_arquivo(
+                        execucao_id, arquivo_pdf, "falhou", erro=str(e), db_path=db_path)
+                finalizar_medicao()
+                if proximo_gravar - 1 in medicoes:
+                    medicao = medicoes.pop(proximo_gravar - 1).mesclar(medicao)
+                registrar_medicao(execucao_id, medicao, perfis, db_path)
+
+    if classificador_async is not None:
+        print(f"[LLM] Classificador assíncrono: {classificador_async.fechar()}")
+    print(f"Execução {execucao_id} finalizada: {finalizar_execucao(execucao_id, db_path)}")
+    concluir_telemetria(execucao_id, perfis, db_path)
+    return resultados
+
+
+def processar_diretorio_empacotado(diretorio_base="amostragem/Parte_1/29675", diretorio_saida="amostragem/Parte_1/OUTPUT",
+                                   orcamento_tokens=None, forcar=False, execucao_id=None, db_path="classificacoes.db"):
+    """
+    Versão de processar_diretorio_amostragem que envia vários documentos por
+    chamada ao LLM, pagando o preâmbulo do prompt uma vez por pacote.
+
+    Os documentos resolvidos sem o LLM são gravados na hora; os demais se
+    acumulam até encher o orçamento de tokens e são classificados juntos
+    por classificar_pacote.
+
+    Args:
+        diretorio_base (str): Caminho base para o diretório de amostragem
+        diretorio_saida (str): Caminho para o diretório de saída dos resultados
+        orcamento_tokens (int): Tokens de documentos por pacote (padrão: ORCAMENTO_TOKENS_PACOTE)
+        forcar (bool): Reprocessa também os arquivos já classificados, atualizando as linhas
+        execucao_id (str): Execução anterior a retomar (opcional)
+        db_path (str): Caminho para o arquivo do banco de dados
+
+    Returns:
+        list: Resultados formatados
+    """
+    os.makedirs(diretorio_saida, exist_ok=True)
+    orcamento_tokens = orcamento_tokens or ORCAMENTO_TOKENS_PACOTE
+
+    execucao_id, pendentes = preparar_execucao(
+        diretorio_base, forcar=forcar, execucao_id=execucao_id, db_path=db_path)
+
+    resultados = []
+    pacote = []  # (arquivo, hash, substituir, texto, medição) aguardando o LLM
+    tokens_pacote = 0
+    perfis = PerfisLentos()
+
+    def _enviar_pacote():
+        textos = [texto for _, _, _, texto, _ in pacote]
+        print(f"  [Pacote] Classificando {len(pacote)} documento(s) em uma chamada")
+        inicio = time.perf_counter()
+        inicio_cpu = time.thread_time()
+        erro = None
+        try:
+            classificacoes = classificar_pacote(textos)
+        except Exception as e:
+            erro = e
+
+        # A chamada é compartilhada: cada documento recebe uma fração igual do tempo
+        segundos = (time.perf_counter() - inicio) / len(pacote)
+        cpu_segundos = (time.thread_time() - inicio_cpu) / len(pacote)
+        for _, _, _, _, medicao in pacote:
+            medicao.somar("llm_pacote", segundos, cpu_segundos, 1)
+            medicao.somar("arquivo", segundos, cpu_segundos)
+
+        if erro is not None:
+            for arquivo_pdf, _, _, _, medicao in pacote:
+                print(f"    Erro ao processar {arquivo_pdf}: {str(erro)}")
+                atualizar_status_arquivo(
+                    execucao_id, arquivo_pdf, "falhou", erro=str(erro), db_path=db_path)
+                registrar_medicao(execucao_id, medicao, perfis, db_path)
+            return
+
+        for (arquivo_pdf, hash_pdf, substituir, texto, medicao), classificacao in zip(pacote, classificacoes):
+            gravacao = iniciar_medicao(arquivo_pdf)
+            try:
+                gravar_classificacao_llm(texto, classificacao, db_path, VERSAO_PROMPT_PACOTE)
+                classificacao["origem"] = "llm"
+                print(f"  Processando: {os.path.basename(arquivo_pdf)}")
+                resultados.append(registrar_resultado(
+                    arquivo_pdf, classificacao, diretorio_saida,
+                    hash_arquivo=hash_pdf, substituir=substituir, db_path=db_path,
+                    texto=texto))
+                atualizar_status_arquivo(
+                    execucao_id, arquivo_pdf, "classificado", db_path=db_path)
             except Exception as e:
                 print(f"    Erro ao processar {arquivo_pdf}: {str(e)}")
-
+                atualizar_status_arquivo(
+                    execucao_id, arquivo_pdf, "falhou", erro=str(e), db_path=db_path)
+            finalizar_medicao()
+            registrar_medicao(execucao_id, medicao.mesclar(gravacao), perfis, db_path)
+
+    for arquivo_pdf, hash_pdf, substituir in pendentes:
+        iniciar_medicao(arquivo_pdf, perfis.ativo)
+        try:
+            print(f"  Extraindo: {os.path.basename(arquivo_pdf)}")
+            texto_combinado = extrair_texto_combinado(arquivo_pdf)
+            atualizar_status_arquivo(
+                execucao_id, arquivo_pdf, "extraido", db_path=db_path)
+
+            classificacao, _ = classificar_sem_llm(texto_combinado, db_path)
+            if classificacao is not None:
+                resultados.append(registrar_resultado(
+                    arquivo_pdf, classificacao, diretorio_saida,
+                    hash_arquivo=hash_pdf, substituir=substituir, db_path=db_path,
+                    texto=texto_combinado))
+                atualizar_status_arquivo(
+                    execucao_id, arquivo_pdf, "classificado", db_path=db_path)
+                registrar_medicao(execucao_id, finalizar_medicao(), perfis, db_path)
+                continue
+        except Exception as e:
+            print(f"    Erro ao processar {arquivo_pdf}: {str(e)}")
+            atualizar_status_arquivo(
+                execucao_id, arquivo_pdf, "falhou", erro=str(e), db_path=db_path)
+            registrar_medicao(execucao_id, finalizar_medicao(), perfis, db_path)
+            continue
+
+        medicao = finalizar_medicao()
+        tokens = contar_tokens(texto_combinado)
+        if pacote and (tokens_pacote + tokens > orcamento_tokens or len(pacote) >= MAX_DOCUMENTOS_PACOTE):
+            _enviar_pacote()
+            pacote = []
+            tokens_pacote = 0
+        pacote.append((arquivo_pdf, hash_pdf, substituir, texto_combinado, medicao))
+        tokens_pacote += tokens
+
+    if pacote:
+        _enviar_pacote()
+
+    print(f"Execução {execucao_id} finalizada: {finalizar_execucao(execucao_id, db_path)}")
+    concluir_telemetria(execucao_id, perfis, db_path)
     return resultados
 
 
@@ -659,7 +2914,20 @@ if __name__ == "__main__":
 
     # Processar arquivos na pasta de amostragem
     print("Processando arquivos em amostragem/Parte 1...")
-    resultados = processar_diretorio_amostragem()
+    workers = int(os.getenv("EXTRATOR_WORKERS", "1"))
+    # EXTRATOR_FORCAR=1 reprocessa arquivos já classificados; EXTRATOR_EXECUCAO retoma uma execução
+    forcar = os.getenv("EXTRATOR_FORCAR") == "1"
+    execucao_id = os.getenv("EXTRATOR_EXECUCAO") or None
+    # EXTRATOR_EMPACOTAR=1 envia vários documentos por chamada ao LLM
+    if os.getenv("EXTRATOR_EMPACOTAR") == "1":
+        resultados = processar_diretorio_empacotado(
+            forcar=forcar, execucao_id=execucao_id)
+    elif workers > 1:
+        resultados = processar_diretorio_paralelo(
+            workers=workers, forcar=forcar, execucao_id=execucao_id)
+    else:
+        resultados = processar_diretorio_amostragem(
+            forcar=forcar, execucao_id=execucao_id)
 
     # Mostrar resumo dos resultados
     print("\nResumo das classificações:")
@@ -726,7 +2994,7 @@ if __name__ == "__main__":
     exportar_dados_csv()
 
     # Gerar e mostrar relatório resumido
-    print("\n" + gerar_relatorio_resumido())
+    print("\n" + gerar_relatorio_resumido(estatisticas=estatisticas))
 
     # Gerar e mostrar dashboard de controle
-    print("\n" + gerar_dashboard_controle())
+    print("\n" + gerar_dashboard_controle(estatisticas=estatisticas))
@@ -0,0 +1,154 @@
+import argparse
+import hashlib
+import io
+import os
+
+from cache_extracao import CacheExtracao, calcular_hash_arquivo
+
+
+# Local e orçamento de disco padrão das miniaturas (sobrescritos por
+# DIRETORIO_MINIATURAS e MAX_BYTES_MINIATURAS no .env)
+DIRETORIO_MINIATURAS = "miniaturas"
+MAX_BYTES_MINIATURAS = 256 * 1024 ** 2
+
+# Largura das miniaturas em pixels e qualidade da compressão
+LARGURA_MINIATURA = 320
+QUALIDADE_MINIATURA = 70
+
+
+def _formato_suportado():
+    """WebP quando o Pillow tiver suporte; senão JPEG."""
+    from PIL import features
+    return ("WEBP", ".webp") if features.check("webp") else ("JPEG", ".jpg")
+
+
+class CacheMiniaturas(CacheExtracao):
+    """
+    Miniaturas das páginas (WebP ou JPEG de baixa resolução) para a interface
+    de validação, identificadas pelo SHA-256 do PDF, a página e a largura.
+
+    Reaproveita a gravação atômica e a poda LRU por orçamento de disco do
+    CacheExtracao. São preenchidas durante o OCR, com a imagem que já foi
+    rasterizada, ou na primeira visualização, renderizando só a página pedida.
+    """
+
+    def __init__(self, diretorio=None, max_bytes=None, largura=LARGURA_MINIATURA,
+                 qualidade=QUALIDADE_MINIATURA):
+        """
+        Args:
+            diretorio (str): Diretório raiz das miniaturas
+            max_bytes (int): Orçamento de disco em bytes
+            largura (int): Largura das miniaturas em pixels
+            qualidade (int): Qualidade da compressão (1-100)
+        """
+        super().__init__(
+            diretorio or os.getenv("DIRETORIO_MINIATURAS", DIRETORIO_MINIATURAS),
+            max_bytes if max_bytes is not None else int(
+                os.getenv("MAX_BYTES_MINIATURAS", MAX_BYTES_MINIATURAS)))
+        self.largura = largura
+        self.qualidade = qualidade
+        self.formato, self.extensao = _formato_suportado()
+
+    def chave_miniatura(self, hash_arquivo, pagina):
+        """Monta a chave da miniatura de uma página."""
+        identificador = f"miniatura:{hash_arquivo}:{pagina}:{self.largura}"
+        return hashlib.sha256(identificador.encode("utf-8")).hexdigest()
+
+    def obter(self, hash_arquivo, pagina):
+        """
+        Returns:
+            str: Caminho da miniatura da página, ou None se ainda não existir
+        """
+        caminho = self._caminho(self.chave_miniatura(hash_arquivo, pagina), self.extensao)
+        if not self._tocar(caminho):
+            return None
+        return caminho
+
+    def gravar_imagem(self, hash_arquivo, pagina, imagem):
+        """
+        Reduz uma imagem já rasterizada e a armazena como miniatura da página.
+
+        Args:
+            hash_arquivo (str): SHA-256 do PDF
+            pagina (int): Número da página (base 1)
+            imagem (PIL.Image.Image): Imagem da página em qualquer resolução
+
+        Returns:
+            str: Caminho da miniatura
+        """
+        from PIL import Image
+
+        miniatura = imagem.convert("RGB" if imagem.mode == "RGB" else "L")
+        if miniatura.width > self.largura:
+            altura = max(1, round(miniatura.height * self.largura / miniatura.width))
+            # reducing_gap reduz primeiro por fatores inteiros: barato mesmo a 300 DPI
+            miniatura = miniatura.resize((self.largura, altura), Image.LANCZOS, reducing_gap=3.0)
+
+        buffer = io.BytesIO()
+        miniatura.save(buffer, self.formato, quality=self.qualidade)
+        caminho = self._caminho(self.chave_miniatura(hash_arquivo, pagina), self.extensao)
+        self._gravar_atomico(caminho, buffer.getvalue())
+
+        self._contabilizar(buffer.tell())
+        return caminho
+
+    def obter_ou_gerar(self, pdf_path, pagina=1, hash_arquivo=None):
+        """
+        Retorna a miniatura da página, renderizando só essa página com o
+        PyMuPDF se ela ainda não estiver no cache.
+
+        Args:
+            pdf_path (str): Caminho do PDF
+            pagina (int): Número da página (base 1)
+            hash_arquivo (str): SHA-256 do PDF, se já conhecido
+
+        Returns:
+            str: Caminho da miniatura, ou None se o PDF não existir ou não tiver a página
+        """
+        if not os.path.exists(pdf_path):
+            return None
+        hash_arquivo = hash_arquivo or calcular_hash_arquivo(pdf_path)
+        caminho = self.obter(hash_arquivo, pagina)
+        if caminho is not None:
+            return caminho
+
+        import fitz
+        from PIL import Image
+
+        with fitz.open(pdf_path) as doc:
+            if not 1 <= pagina <= doc.page_count:
+                return None
+            page = doc[pagina - 1]
+            escala = self.largura / page.rect.width if page.rect.width else 1.0
+            pix = page.get_pixmap(matrix=fitz.Matrix(escala, escala), alpha=False)
+            imagem = Image.frombytes("RGB", (pix.width, pix.height), pix.samples)
+            del pix
+        return self.gravar_imagem(hash_arquivo, pagina, imagem)
+
+
+if __name__ == "__main__":
+    from dotenv import load_dotenv
+    load_dotenv()
+
+    parser = argparse.ArgumentParser(
+        description="Gera miniaturas de PDFs ou poda o cache de miniaturas.")
+    parser.add_argument("pdfs", nargs="*", help="PDFs cujas miniaturas serão geradas")
+    parser.add_argument("--todas-paginas", action="store_true",
+                        help="Gera a miniatura de todas as páginas (padrão: só a primeira)")
+    parser.add_argument("--limite-mb", type=float, default=None,
+                        help="Poda o cache até este tamanho, em MB")
+    args = parser.parse_args()
+
+    cache = CacheMiniaturas()
+    for pdf in args.pdfs:
+        paginas = [1]
+        if args.todas_paginas:
+            import fitz
+            with fitz.open(pdf) as doc:
+                paginas = range(1, doc.page_count + 1)
+        hash_pdf = calcular_hash_arquivo(pdf)
+        for num in paginas:
+            print(f"{pdf} página {num}: {cache.obter_ou_gerar(pdf, num, hash_pdf)}")
+    if args.limite_mb is not None:
+        removidos, liberados = cache.podar(int(args.limite_mb * 1024 * 1024))
+        print(f"Miniaturas: {removidos} arquivo(s) removido(s), {liberados / 1024 ** 2:.1f} MB liberados")
@@ -0,0 +1,300 @@
+import io
+import os
+import queue
+import shlex
+import subprocess
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytesseract
+
+
+class MotorSubprocesso:
+    """
+    Motor de OCR que executa um processo `tesseract` por página, enviando a
+    imagem pelo stdin. Não depende de bibliotecas nativas e é o fallback
+    quando o tesserocr não está instalado, mas paga a inicialização do
+    Tesseract (e o carregamento do traineddata) a cada página.
+    """
+
+    nome = "subprocesso"
+
+    def __init__(self, lang="por", config="", comando=None, instancias=1):
+        """
+        Args:
+            lang (str): Idioma(s) do Tesseract
+            config (str): Parâmetros adicionais da linha de comando
+            comando (str): Executável do Tesseract (padrão: o configurado no pytesseract)
+            instancias (int): Processos simultâneos em reconhecer_lote
+        """
+        self.lang = lang
+        self.config = config
+        self.comando = comando or pytesseract.pytesseract.tesseract_cmd
+        self.instancias = instancias
+
+    def reconhecer(self, imagem, saida="txt"):
+        """
+        Reconhece o texto de uma imagem em memória.
+
+        Args:
+            imagem (PIL.Image.Image): Imagem da página
+            saida (str): "txt" para texto puro ou "tsv" para palavras com confiança
+
+        Returns:
+            str: Saída do Tesseract
+        """
+        buffer = io.BytesIO()
+        imagem.save(buffer, "PPM")
+
+        comando = [self.comando, "stdin", "stdout",
+                   "-l", self.lang, *shlex.split(self.config)]
+        if saida != "txt":
+            comando.append(saida)
+        resultado = subprocess.run(
+            comando, input=buffer.getvalue(), capture_output=True)
+        if resultado.returncode != 0:
+            raise pytesseract.TesseractError(
+                resultado.returncode, resultado.stderr.decode("utf-8", errors="replace"))
+        return resultado.stdout.decode("utf-8")
+
+    def reconhecer_lote(self, imagens, saida="txt"):
+        """
+        Reconhece várias imagens, com até `instancias` processos em paralelo.
+
+        Returns:
+            list: Saídas na mesma ordem das imagens
+        """
+        if self.instancias <= 1 or len(imagens) <= 1:
+            return [self.reconhecer(imagem, saida) for imagem in imagens]
+        with ThreadPoolExecutor(max_workers=self.instancias) as pool:
+            return list(pool.map(lambda imagem: self.reconhecer(imagem, saida), imagens))
+
+    def fechar(self):
+        pass
+
+
+class MotorTesserocr:
+    """
+    Motor de OCR que mantém instâncias do Tesseract carregadas em memória
+    através da API C (tesserocr). O traineddata é lido uma única vez por
+    instância, o que elimina o custo de inicialização por página.
+
+    Cada instância só pode ser usada por uma thread de cada vez; as instâncias
+    ficam em uma fila e reconhecer_lote distribui as páginas entre elas
+    (o tesserocr libera o GIL durante o reconhecimento).
+    """
+
+    nome = "tesserocr"
+
+    def __init__(self, lang="por", config="", instancias=1):
+        """
+        Args:
+            lang (str): Idioma(s) do Tesseract
+            config (str): Parâmetros no formato da linha de comando
+                          (--psm N, --oem N e -c variavel=valor)
+            instancias (int): Número de instâncias mantidas aquecidas
+        """
+        import tesserocr
+
+        psm, oem, variaveis = self._interpretar_config(config)
+        argumentos = {"lang": lang}
+        if psm is not None:
+            argumentos["psm"] = psm
+        if oem is not None:
+            argumentos["oem"] = oem
+
+        self.instancias = instancias
+        self._apis = queue.Queue()
+        for _ in range(instancias):
+            api = tesserocr.PyTessBaseAPI(**argumentos)
+            for variavel, valor in variaveis.items():
+                api.SetVariable(variavel, valor)
+            self._apis.put(api)
+
+    @staticmethod
+    def _interpretar_config(config):
+        """Converte a configuração de linha de comando nos parâmetros da API."""
+        psm = None
+        oem = None
+        variaveis = {}
+        partes = shlex.split(config)
+        i = 0
+        while i < len(partes):
+            parte = partes[i]
+            if parte == "--psm" and i + 1 < len(partes):
+                psm = int(partes[i + 1])
+                i += 1
+            elif parte == "--oem" and i + 1 < len(partes):
+                oem = int(partes[i + 1])
+                i += 1
+            elif parte == "-c" and i + 1 < len(partes):
+                variavel, _, valor = partes[i + 1].partition("=")
+                variaveis[variavel] = valor
+                i += 1
+            i += 1
+        return psm, oem, variaveis
+
+    def reconhecer(self, imagem, saida="txt"):
+        """
+        Reconhece o texto de uma imagem em memória.
+
+        Args:
+            imagem (PIL.Image.Image): Imagem da página
+            saida (str): "txt" para texto puro ou "tsv" para palavras com confiança
+
+        Returns:
+            str: Texto reconhecido ou TSV das palavras
+        """
+        api = self._apis.get()
+        try:
+            api.SetImage(imagem)
+            if saida == "tsv":
+                return api.GetTSVText(0)
+            return api.GetUTF8Text()
+        finally:
+            api.Clear()
+            self._apis.put(api)
+
+    def reconhecer_lote(self, imagens, saida="txt"):
+        """
+        Distribui as imagens entre as instâncias aquecidas.
+
+        Returns:
+            list: Saídas na mesma ordem das imagens
+        """
+        if self.instancias <= 1 or len(imagens) <= 1:
+            return [self.reconhecer(imagem, saida) for imagem in imagens]
+        with ThreadPoolExecutor(max_workers=self.instancias) as pool:
+            return list(pool.map(lambda imagem: self.reconhecer(imagem, saida), imagens))
+
+    def fechar(self):
+        while not self._apis.empty():
+            self._apis.get().End()
+
+
+MOTORES_OCR = {
+    MotorSubprocesso.nome: MotorSubprocesso,
+    MotorTesserocr.nome: MotorTesserocr,
+}
+
+_motores = {}
+_trava_motores = threading.Lock()
+
+
+def criar_motor_ocr(nome="auto", lang="por", config="", instancias=1):
+    """
+    Cria um motor de OCR.
+
+    Args:
+        nome (str): "tesserocr", "subprocesso" ou "auto" (tesserocr se estiver instalado)
+        lang (str): Idioma(s) do Tesseract
+        config (str): Parâmetros adicionais do Tesseract
+        instancias (int): Instâncias/processos simultâneos
+
+    Returns:
+        MotorTesserocr | MotorSubprocesso: Motor de OCR
+    """
+    if nome == "auto":
+        try:
+            return MotorTesserocr(lang, config, instancias)
+        except ImportError:
+            return MotorSubprocesso(lang, config, instancias=instancias)
+    return MOTORES_OCR[nome](lang, config, instancias=instancias)
+
+
+def obter_motor_ocr(lang="por", config="", nome=None, instancias=None):
+    """
+    Retorna o motor de OCR compartilhado do processo, criando-o na primeira
+    chamada. Cada processo do pool de extração mantém o seu próprio motor
+    aquecido entre os arquivos.
+
+    Args:
+        lang (str): Idioma(s) do Tesseract
+        config (str): Parâmetros adicionais do Tesseract
+        nome (str): Motor desejado (padrão: MOTOR_OCR do .env, ou "auto")
+        instancias (int): Instâncias aquecidas (padrão: MOTOR_OCR_INSTANCIAS do .env, ou 1)
+
+    Returns:
+        MotorTesserocr | MotorSubprocesso: Motor de OCR
+    """
+    nome = nome or os.getenv("MOTOR_OCR", "auto")
+    instancias = instancias or int(os.getenv("MOTOR_OCR_INSTANCIAS", "1"))
+    chave = (nome, lang, config, instancias)
+    with _trava_motores:
+        if chave not in _motores:
+            _motores[chave] = criar_motor_ocr(nome, lang, config, instancias)
+            print(f"[OCR] Motor {_motores[chave].nome} iniciado "
+                  f"({instancias} instância(s), lang={lang}).")
+        return _motores[chave]
+
+
+def comparar_motores(pdfs, dpi=300, lang="por", config="", instancias=1, repeticoes=1):
+    """
+    Mede páginas por segundo de cada motor disponível sobre as mesmas imagens.
+
+    Args:
+        pdfs (list): PDFs usados no benchmark (todas as páginas são rasterizadas antes da medição)
+        dpi (int): DPI da rasterização
+        lang (str): Idioma(s) do Tesseract
+        config (str): Parâmetros adicionais do Tesseract
+        instancias (int): Instâncias/processos simultâneos por motor
+        repeticoes (int): Quantas vezes o conjunto de páginas é reconhecido
+
+    Returns:
+        dict: {motor: {"paginas": n, "segundos": s, "paginas_por_segundo": p}}
+    """
+    import fitz
+    from PIL import Image
+
+    imagens = []
+    for pdf in pdfs:
+        with fitz.open(pdf) as doc:
+            for page in doc:
+                pix = page.get_pixmap(dpi=dpi, alpha=False)
+                imagens.append(Image.frombytes(
+                    "RGB", (pix.width, pix.height), pix.samples))
+
+    resultados = {}
+    for nome in MOTORES_OCR:
+        try:
+            motor = criar_motor_ocr(nome, lang, config, instancias)
+        except ImportError:
+            print(f"Motor {nome} indisponível (dependência não instalada).")
+            continue
+
+        # Aquecimento fora da medição
+        if imagens:
+            motor.reconhecer(imagens[0])
+
+        inicio = time.perf_counter()
+        for _ in range(repeticoes):
+            motor.reconhecer_lote(imagens)
+        segundos = time.perf_counter() - inicio
+        motor.fechar()
+
+        paginas = len(imagens) * repeticoes
+        resultados[nome] = {
+            "paginas": paginas,
+            "segundos": round(segundos, 3),
+            "paginas_por_segundo": round(paginas / segundos, 2) if segundos > 0 else 0.0
+        }
+    return resultados
+
+
+if __name__ == "__main__":
+    import argparse
+    import json
+
+    parser = argparse.ArgumentParser(
+        description="Compara páginas/segundo dos motores de OCR disponíveis.")
+    parser.add_argument("pdfs", nargs="+", help="PDFs usados no benchmark")
+    parser.add_argument("--dpi", type=int, default=300)
+    parser.add_argument("--lang", default="por")
+    parser.add_argument("--config", default="")
+    parser.add_argument("--instancias", type=int, default=1)
+    parser.add_argument("--repeticoes", type=int, default=1)
+    args = parser.parse_args()
+
+    print(json.dumps(comparar_motores(args.pdfs, args.dpi, args.lang, args.config,
+                                      args.instancias, args.repeticoes), indent=2))
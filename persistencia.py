@@ -0,0 +1,280 @@
+import atexit
+import queue
+import sqlite3
+import threading
+import time
+
+
+# Gravações acumuladas por transação e tempo máximo até o commit
+TAMANHO_LOTE_ESCRITA = 200
+INTERVALO_ESCRITA = 0.5
+
+# Itens na fila antes de enfileirar() bloquear (contrapressão sobre os produtores)
+MAX_FILA_ESCRITA = 10000
+
+
+def conectar_banco(db_path, timeout=30.0):
+    """
+    Abre uma conexão em modo WAL com synchronous=NORMAL: leitores (o dashboard)
+    não bloqueiam o escritor e cada commit não exige fsync do banco inteiro,
+    só do WAL nos checkpoints.
+
+    Args:
+        db_path (str): Caminho para o arquivo do banco de dados
+        timeout (float): Segundos de espera quando o banco estiver bloqueado
+
+    Returns:
+        sqlite3.Connection: Conexão configurada
+    """
+    conn = sqlite3.connect(db_path, timeout=timeout)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute(f"PRAGMA busy_timeout={int(timeout * 1000)}")
+    return conn
+
+
+class EscritorSQLite:
+    """
+    Escritor único de um banco SQLite.
+
+    As gravações são enfileiradas por qualquer thread e executadas por uma
+    única thread com uma única conexão, em transações de até tamanho_lote
+    comandos ou a cada `intervalo` segundos, o que ocorrer primeiro.
+
+    Se uma transação falha, os comandos são refeitos um a um para isolar o
+    culpado; o callback ao_falhar do comando que falhou é chamado na mesma
+    conexão (por exemplo, para marcar o arquivo como falhou).
+    """
+
+    _SINCRONIZAR = object()
+    _ENCERRAR = object()
+
+    def __init__(self, db_path, tamanho_lote=TAMANHO_LOTE_ESCRITA, intervalo=INTERVALO_ESCRITA,
+                 max_fila=MAX_FILA_ESCRITA):
+        """
+        Args:
+            db_path (str): Caminho para o arquivo do banco de dados
+            tamanho_lote (int): Comandos por transação
+            intervalo (float): Segundos máximos entre o enfileiramento e o commit
+            max_fila (int): Tamanho máximo da fila de gravações
+        """
+        self.db_path = db_path
+        self.tamanho_lote = tamanho_lote
+        self.intervalo = intervalo
+        self.estatisticas = {"comandos": 0, "transacoes": 0, "falhas": 0}
+        self._fila = queue.Queue(maxsize=max_fila)
+        self._thread = threading.Thread(
+            target=self._executar, name=f"escritor-sqlite:{db_path}", daemon=True)
+        self._thread.start()
+
+    def enfileirar(self, sql, parametros=(), ao_falhar=None):
+        """
+        Agenda um comando de escrita.
+
+        Args:
+            sql (str): Comando SQL
+            parametros (tuple): Parâmetros do comando
+            ao_falhar (callable): Chamado como ao_falhar(conn, erro) se o comando falhar
+        """
+        if not self._thread.is_alive():
+            raise RuntimeError("escritor SQLite encerrado")
+        self._fila.put((sql, parametros, ao_falhar))
+
+    def sincronizar(self):
+        """
+        Bloqueia até que tudo o que foi enfileirado antes esteja gravado.
+
+        Raises:
+            RuntimeError: Se a thread do escritor terminar antes de chegar ao
+                          ponto de sincronização (as gravações pendentes se perderam)
+        """
+        if not self._thread.is_alive():
+            return
+        evento = threading.Event()
+        self._fila.put((self._SINCRONIZAR, evento, None))
+        # Espera em intervalos curtos: se a thread morrer depois da verificação
+        # acima, o evento nunca seria sinalizado
+        while not evento.wait(timeout=self.intervalo):
+            if not self._thread.is_alive():
+                raise RuntimeError("escritor SQLite encerrado antes de gravar as pendências")
+
+    def fechar(self):
+        """Grava o que estiver pendente e encerra a thread."""
+        if not self._thread.is_alive():
+            return
+        self._fila.put((self._ENCERRAR, None, None))
+        self._thread.join()
+
+    def _executar(self):
+        conn = conectar_banco(self.db_path)
+        pendentes = []
+        inicio_lote = None
+        try:
+            while True:
+                if pendentes:
+                    espera = max(0.0, self.intervalo - (time.monotonic() - inicio_lote))
+                    try:
+                        item = self._fila.get(timeout=espera)
+                    except queue.Empty:
+                        self._gravar(conn, pendentes)
+                        pendentes = []
+                        continue
+                else:
+                    item = self._fila.get()
+
+                sql, parametros, _ = item
+                if sql is self._SINCRONIZAR or sql is self._ENCERRAR:
+                    if pendentes:
+                        self._gravar(conn, pendentes)
+                        pendentes = []
+                    if sql is self._ENCERRAR:
+                        return
+                    parametros.set()
+                    continue
+
+                if not pendentes:
+                    inicio_lote = time.monotonic()
+                pendentes.append(item)
+                if len(pendentes) >= self.tamanho_lote or \
+                        time.monotonic() - inicio_lote >= self.intervalo:
+                    self._gravar(conn, pendentes)
+                    pendentes = []
+        finally:
+            conn.close()
+
+    def _gravar(self, conn, itens):
+        try:
+            with conn:
+                for sql, parametros, _ in itens:
+                    conn.execute(sql, parametros)
+            self.estatisticas["comandos"] += len(itens)
+            self.estatisticas["transacoes"] += 1
+            return
+        except sqlite3.Error:
+            pass
+
+        # Refazer um a um para que só o comando com problema seja perdido
+        for sql, parametros, ao_falhar in itens:
+            try:
+                with conn:
+                    conn.execute(sql, parametros)
+                self.estatisticas["comandos"] += 1
+                self.estatisticas["transacoes"] += 1
+            except sqlite3.Error as e:
+                self.estatisticas["falhas"] += 1
+                print(f"[SQLite] Falha na gravação ({str(e)}): {sql.split()[0]} {parametros[:2]}")
+                if ao_falhar is not None:
+                    try:
+                        with conn:
+                            ao_falhar(conn, e)
+                    except sqlite3.Error as erro_callback:
+                        print(f"[SQLite] Falha ao registrar o erro: {str(erro_callback)}")
+
+
+_escritores = {}
+_trava_escritores = threading.Lock()
+
+
+def obter_escritor(db_path):
+    """Retorna o escritor do banco, iniciando-o na primeira chamada (e encerrando-o na saída do processo)."""
+    with _trava_escritores:
+        if db_path not in _escritores:
+            escritor = EscritorSQLite(db_path)
+            _escritores[db_path] = escritor
+            atexit.register(escritor.fechar)
+        return _escritores[db_path]
+
+
+def sincronizar_escritor(db_path):
+    """Aguarda as gravações pendentes do banco, se houver um escritor para ele."""
+    escritor = _escritores.get(db_path)
+    if escritor is not None:
+        escritor.sincronizar()
+
+
+def comparar_escrita(quantidade=2000, db_path=None):
+    """
+    Mede inserções por segundo de uma linha no formato de classificacoes:
+    uma conexão e um commit por linha (como inserir_classificacao_db fazia)
+    contra o escritor em lote em WAL.
+
+    Args:
+        quantidade (int): Linhas inseridas em cada modo
+        db_path (str): Banco usado no teste (padrão: arquivo temporário)
+
+    Returns:
+        dict: {modo: {"linhas", "segundos", "insercoes_por_segundo"}}
+    """
+    import os
+    import tempfile
+
+    diretorio = None
+    if db_path is None:
+        diretorio = tempfile.mkdtemp()
+        db_path = os.path.join(diretorio, "benchmark.db")
+
+    conn = sqlite3.connect(db_path)
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS classificacoes (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            nome_arquivo TEXT NOT NULL UNIQUE,
+            caminho_arquivo TEXT NOT NULL,
+            tipo_classificacao TEXT NOT NULL,
+            indice_certeza REAL NOT NULL,
+            tokens_entrada INTEGER NOT NULL,
+            tokens_saida INTEGER NOT NULL
+        )
+    ''')
+    conn.commit()
+    conn.close()
+
+    sql = '''
+        INSERT INTO classificacoes
+        (nome_arquivo, caminho_arquivo, tipo_classificacao, indice_certeza, tokens_entrada, tokens_saida)
+        VALUES (?, ?, ?, ?, ?, ?)
+    '''
+
+    def _linha(modo, i):
+        return (f"{modo}_{i}.pdf", f"/tmp/{modo}_{i}.pdf", "boleto", 0.9, 500, 20)
+
+    resultados = {}
+
+    # Antes: uma conexão e um commit por linha, no modo de journal padrão
+    inicio = time.perf_counter()
+    for i in range(quantidade):
+        conn = sqlite3.connect(db_path)
+        conn.execute(sql, _linha("individual", i))
+        conn.commit()
+        conn.close()
+    resultados["conexao_por_linha"] = time.perf_counter() - inicio
+
+    # Depois: escritor único em WAL com commits em lote
+    escritor = EscritorSQLite(db_path)
+    inicio = time.perf_counter()
+    for i in range(quantidade):
+        escritor.enfileirar(sql, _linha("lote", i))
+    escritor.sincronizar()
+    resultados["escritor_em_lote"] = time.perf_counter() - inicio
+    escritor.fechar()
+
+    if diretorio is not None:
+        import shutil
+        shutil.rmtree(diretorio, ignore_errors=True)
+
+    return {modo: {"linhas": quantidade, "segundos": round(segundos, 3),
+                   "insercoes_por_segundo": round(quantidade / segundos, 1) if segundos > 0 else 0.0}
+            for modo, segundos in resultados.items()}
+
+
+if __name__ == "__main__":
+    import argparse
+    import json
+
+    parser = argparse.ArgumentParser(
+        description="Compara inserções/s com conexão por linha e com o escritor em lote (WAL).")
+    parser.add_argument("--linhas", type=int, default=2000)
+    parser.add_argument("--db", default=None,
+                        help="Banco usado no teste (padrão: arquivo temporário)")
+    args = parser.parse_args()
+
+    print(json.dumps(comparar_escrita(args.linhas, args.db), indent=2))
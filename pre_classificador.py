@@ -0,0 +1,407 @@
+import math
+import os
+import pickle
+import re
+import sqlite3
+import threading
+import unicodedata
+
+
+# Palavras-chave decisivas de cada tipo (as mesmas listadas nos prompts de
+# classificação) com o peso de cada uma na pontuação
+PALAVRAS_CHAVE = {
+    "voucher": [
+        (r"numero (da|de) reserva", 3),
+        (r"voucher", 2),
+        (r"hospede", 2),
+        (r"quarto( n[o°º]|:)", 2),
+        (r"check[ -]?in", 2),
+        (r"check[ -]?out", 1),
+        (r"arrival", 1),
+        (r"chegada", 1),
+        (r"diarias?", 1),
+    ],
+    "boleto": [
+        (r"recibo do pagador", 3),
+        (r"valor do documento", 3),
+        (r"local de pagamento", 2),
+        (r"nosso numero", 2),
+        (r"juros ?/ ?multa", 2),
+        (r"uso do banco", 2),
+        (r"agencia ?/ ?codigo do beneficiario", 2),
+        (r"linha digitavel", 2),
+        (r"\d{5}\.\d{5} \d{5}\.\d{6} \d{5}\.\d{6} \d \d{14}", 3),
+        (r"boleto", 1),
+        (r"pagador", 1),
+        (r"beneficiario", 1),
+        (r"vencimento", 1),
+    ],
+    "nota_fiscal": [
+        (r"nota fiscal de servicos? eletronica", 3),
+        (r"numero da nota", 3),
+        (r"tomador de servicos?", 3),
+        (r"prestador de servicos?", 3),
+        (r"nfs-?e", 2),
+        (r"codigo de verificacao", 2),
+        (r"cnae", 2),
+        (r"iss(qn)?\b", 1),
+        (r"discriminacao dos servicos", 2),
+    ],
+}
+
+_PADROES = {tipo: [(re.compile(padrao), peso) for padrao, peso in regras]
+            for tipo, regras in PALAVRAS_CHAVE.items()}
+
+# Suavização da pontuação por palavras-chave: quanto maior, mais evidência
+# é necessária para atingir um índice de certeza alto
+SUAVIZACAO_PALAVRAS_CHAVE = 1.0
+
+# Precisão exigida, contra os rótulos do LLM no banco, para calibrar a certeza
+# mínima que dispensa o LLM. Sem limiar calibrado (ou LIMIAR_PRE_CLASSIFICADOR
+# no .env) o pré-classificador nunca dispensa o LLM
+PRECISAO_ALVO_PRE_CLASSIFICADOR = 0.98
+# Exemplos aceitos no limiar para que a precisão medida valha alguma coisa
+MINIMO_ACEITOS_CALIBRACAO = 30
+
+# Arquivo do modelo TF-IDF + regressão logística treinado com o banco
+MODELO_PRE_CLASSIFICADOR = "pre_classificador.pkl"
+
+# Tipos com menos exemplos que isso ficam fora do treino do modelo
+MINIMO_EXEMPLOS_TIPO = 2
+# Abaixo desse número de textos, termos que aparecem em um só documento
+# entram no vocabulário (com min_df=2 um banco pequeno fica sem vocabulário)
+MINIMO_TEXTOS_MIN_DF = 50
+# Fração dos exemplos separada para calibrar o limiar do modelo
+FRACAO_VALIDACAO = 0.2
+
+
+def normalizar_texto(texto):
+    """Remove acentos, converte para minúsculas e colapsa espaços em branco."""
+    texto = unicodedata.normalize("NFKD", texto)
+    texto = "".join(c for c in texto if not unicodedata.combining(c))
+    return " ".join(texto.casefold().split())
+
+
+def pontuar_palavras_chave(texto):
+    """
+    Pontua o texto para cada tipo somando os pesos das palavras-chave encontradas.
+
+    Args:
+        texto (str): Texto da página
+
+    Returns:
+        dict: {tipo: pontuação}
+    """
+    normalizado = normalizar_texto(texto)
+    return {tipo: sum(peso for padrao, peso in regras if padrao.search(normalizado))
+            for tipo, regras in _PADROES.items()}
+
+
+def classificar_por_palavras_chave(texto):
+    """
+    Classifica o texto apenas pelas palavras-chave.
+
+    A certeza é a pontuação do tipo vencedor dividida pela soma de todas as
+    pontuações mais SUAVIZACAO_PALAVRAS_CHAVE: poucas palavras-chave ou
+    palavras-chave de mais de um tipo resultam em certeza baixa.
+
+    Args:
+        texto (str): Texto da página
+
+    Returns:
+        dict: {"tipo", "indice_certeza"}; tipo None quando nenhuma palavra-chave foi encontrada
+    """
+    pontuacoes = pontuar_palavras_chave(texto)
+    total = sum(pontuacoes.values())
+    if total == 0:
+        return {"tipo": None, "indice_certeza": 0.0}
+
+    tipo = max(pontuacoes, key=pontuacoes.get)
+    return {"tipo": tipo,
+            "indice_certeza": pontuacoes[tipo] / (total + SUAVIZACAO_PALAVRAS_CHAVE)}
+
+
+class PreClassificador:
+    """
+    Classificador local que roda antes do LLM.
+
+    Usa um modelo TF-IDF + regressão logística calibrada (scikit-learn),
+    treinado com os textos já classificados no banco, e as palavras-chave
+    dos prompts. Sem modelo treinado (ou sem scikit-learn), usa apenas
+    as palavras-chave, que nunca resultam em descarte.
+
+    O LLM só é dispensado acima de um limiar calibrado contra os rótulos do
+    LLM (calibrar_limiar, no treino); sem limiar, tudo é escalado.
+    """
+
+    def __init__(self, modelo=None, limiar=None, limiar_palavras_chave=None):
+        """
+        Args:
+            modelo: Pipeline scikit-learn treinado (opcional)
+            limiar (float): Certeza mínima do modelo para dispensar o LLM (None: nunca dispensa)
+            limiar_palavras_chave (float): Certeza mínima das palavras-chave, sem modelo
+                                           (None: nunca dispensa)
+        """
+        self.modelo = modelo
+        self.limiar = limiar
+        self.limiar_palavras_chave = limiar_palavras_chave
+
+    def classificar(self, texto):
+        """
+        Classifica o texto localmente.
+
+        Args:
+            texto (str): Texto da página
+
+        Returns:
+            dict: {"tipo", "indice_certeza", "origem", "escalar"}, onde escalar indica
+                  que a certeza ficou abaixo do limiar e o LLM deve ser consultado
+        """
+        palavras_chave = classificar_por_palavras_chave(texto)
+        resultado = palavras_chave
+        limiar = self.limiar_palavras_chave
+
+        if self.modelo is not None:
+            limiar = self.limiar
+            probabilidades = self.modelo.predict_proba([normalizar_texto(texto)])[0]
+            indice = probabilidades.argmax()
+            tipo_modelo = self.modelo.classes_[indice]
+            certeza_modelo = float(probabilidades[indice])
+
+            if palavras_chave["tipo"] in (None, tipo_modelo):
+                resultado = {"tipo": tipo_modelo, "indice_certeza": certeza_modelo}
+            else:
+                # Modelo e palavras-chave discordam: reduzir a certeza para forçar o LLM
+                resultado = {"tipo": tipo_modelo,
+                             "indice_certeza": min(certeza_modelo, 1 - palavras_chave["indice_certeza"])}
+
+        resultado["indice_certeza"] = round(resultado["indice_certeza"], 4)
+        resultado["origem"] = "local"
+        resultado["escalar"] = resultado["tipo"] is None or limiar is None or \
+            resultado["indice_certeza"] < limiar
+        return resultado
+
+    def treinar(self, textos, tipos):
+        """
+        Treina o modelo TF-IDF + regressão logística com probabilidades calibradas.
+
+        Args:
+            textos (list): Textos dos documentos
+            tipos (list): Tipo de cada texto
+        """
+        from sklearn.calibration import CalibratedClassifierCV
+        from sklearn.feature_extraction.text import TfidfVectorizer
+        from sklearn.linear_model import LogisticRegression
+        from sklearn.pipeline import make_pipeline
+
+        # A calibração por validação cruzada precisa de pelo menos 2 exemplos
+        # por classe; com menos, ficam as probabilidades da regressão (o limiar
+        # que dispensa o LLM é calibrado à parte, em exemplos fora do treino)
+        menor_classe = min(tipos.count(tipo) for tipo in set(tipos))
+        dobras = min(5, menor_classe)
+        classificador = LogisticRegression(max_iter=1000)
+        if dobras >= 2:
+            classificador = CalibratedClassifierCV(classificador, cv=dobras)
+
+        self.modelo = make_pipeline(
+            TfidfVectorizer(ngram_range=(1, 2), min_df=2 if len(textos) >= MINIMO_TEXTOS_MIN_DF else 1,
+                            max_features=50000, sublinear_tf=True),
+            classificador
+        )
+        self.modelo.fit([normalizar_texto(t) for t in textos], tipos)
+
+    def salvar(self, caminho=None):
+        """Grava o modelo e os limiares calibrados."""
+        caminho = caminho or os.getenv(
+            "MODELO_PRE_CLASSIFICADOR", MODELO_PRE_CLASSIFICADOR)
+        with open(caminho, "wb") as f:
+            pickle.dump({"modelo": self.modelo, "limiar": self.limiar,
+                         "limiar_palavras_chave": self.limiar_palavras_chave}, f)
+
+    @classmethod
+    def carregar(cls, caminho=None, limiar=None):
+        """
+        Carrega o modelo salvo e seus limiares calibrados; sem arquivo ou sem
+        scikit-learn, retorna um pré-classificador apenas com palavras-chave.
+        LIMIAR_PRE_CLASSIFICADOR no .env (ou `limiar`) substitui os dois limiares.
+        """
+        caminho = caminho or os.getenv(
+            "MODELO_PRE_CLASSIFICADOR", MODELO_PRE_CLASSIFICADOR)
+        if limiar is None and os.getenv("LIMIAR_PRE_CLASSIFICADOR"):
+            limiar = float(os.getenv("LIMIAR_PRE_CLASSIFICADOR"))
+
+        salvo = {}
+        if os.path.exists(caminho):
+            try:
+                with open(caminho, "rb") as f:
+                    salvo = pickle.load(f)
+            except ImportError:
+                print("[Pré-classificador] scikit-learn não instalado; usando apenas palavras-chave.")
+        if not isinstance(salvo, dict):
+            # Formato antigo: só o modelo, sem limiar calibrado
+            salvo = {"modelo": salvo}
+
+        modelo = salvo.get("modelo")
+        limiar_palavras_chave = salvo.get("limiar_palavras_chave")
+        if modelo is not None and not hasattr(modelo, "predict_proba"):
+            modelo = None
+        if limiar is not None:
+            return cls(modelo, limiar, limiar)
+        return cls(modelo, salvo.get("limiar"), limiar_palavras_chave)
+
+
+def calibrar_limiar(certezas, acertos, precisao_alvo=PRECISAO_ALVO_PRE_CLASSIFICADOR,
+                    minimo_aceitos=MINIMO_ACEITOS_CALIBRACAO):
+    """
+    Menor certeza a partir da qual a precisão contra os rótulos do LLM
+    atinge a precisão alvo, com pelo menos minimo_aceitos exemplos aceitos.
+
+    Args:
+        certezas (list): Certeza de cada previsão (0.0 quando não houve previsão)
+        acertos (list): Se cada previsão coincidiu com o rótulo do LLM
+        precisao_alvo (float): Precisão mínima entre os exemplos aceitos
+        minimo_aceitos (int): Exemplos mínimos acima do limiar
+
+    Returns:
+        float: Limiar calibrado, ou None se nenhum limiar atingir a precisão alvo
+    """
+    pares = sorted(zip(certezas, acertos), reverse=True)
+    limiar = None
+    aceitos = 0
+    corretos = 0
+    for indice, (certeza, acerto) in enumerate(pares):
+        aceitos += 1
+        corretos += int(acerto)
+        # Só avaliar no fim de cada grupo de certezas iguais (o limiar aceita o grupo inteiro)
+        if certeza <= 0 or (indice + 1 < len(pares) and pares[indice + 1][0] == certeza):
+            continue
+        if aceitos >= minimo_aceitos and corretos / aceitos >= precisao_alvo:
+            limiar = certeza
+    return limiar
+
+
+_pre_classificador = None
+_trava = threading.Lock()
+
+
+def obter_pre_classificador():
+    """Retorna o pré-classificador do processo, carregando o modelo na primeira chamada."""
+    global _pre_classificador
+    with _trava:
+        if _pre_classificador is None:
+            _pre_classificador = PreClassificador.carregar()
+        return _pre_classificador
+
+
+def carregar_dados_treino(db_path="classificacoes.db", certeza_minima=0.9):
+    """
+    Lê do banco os textos classificados pelo LLM com alta certeza, usados
+    como rótulos de treino.
+
+    Args:
+        db_path (str): Caminho para o arquivo do banco de dados
+        certeza_minima (float): Certeza mínima da classificação para entrar no treino
+
+    Returns:
+        tuple: (textos, tipos)
+    """
+    conn = sqlite3.connect(db_path)
+    cursor = conn.cursor()
+
+    # Bancos criados antes da tabela de textos não têm de onde tirar o treino
+    cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'textos_documentos'")
+    if cursor.fetchone() is None:
+        conn.close()
+        print("Tabela textos_documentos ausente: reprocesse os documentos para gerar textos de treino")
+        return [], []
+
+    cursor.execute('''
+        SELECT t.texto, c.tipo_classificacao
+        FROM classificacoes c
+        JOIN textos_documentos t ON t.caminho_arquivo = c.caminho_arquivo AND t.hash_arquivo IS c.hash_arquivo
+        WHERE c.indice_certeza >= ?
+          AND c.tipo_classificacao IN ('voucher', 'boleto', 'nota_fiscal', 'descarte')
+          AND COALESCE(c.origem_classificacao, 'llm') NOT IN ('local', 'knn')
+    ''', (certeza_minima,))
+    linhas = cursor.fetchall()
+
+    conn.close()
+    return [texto for texto, _ in linhas], [tipo for _, tipo in linhas]
+
+
+if __name__ == "__main__":
+    import argparse
+
+    from dotenv import load_dotenv
+    load_dotenv()
+
+    parser = argparse.ArgumentParser(
+        description="Treina o pré-classificador local com as classificações do banco.")
+    parser.add_argument("--db", default="classificacoes.db")
+    parser.add_argument("--certeza-minima", type=float, default=0.9,
+                        help="Certeza mínima das classificações do LLM usadas como rótulo")
+    parser.add_argument("--saida", default=None,
+                        help="Arquivo do modelo (padrão: MODELO_PRE_CLASSIFICADOR)")
+    parser.add_argument("--precisao-alvo", type=float, default=PRECISAO_ALVO_PRE_CLASSIFICADOR,
+                        help="Precisão contra os rótulos do LLM exigida para dispensar o LLM")
+    args = parser.parse_args()
+
+    textos, tipos = carregar_dados_treino(args.db, args.certeza_minima)
+    print(f"{len(textos)} exemplo(s) de treino: "
+          f"{ {tipo: tipos.count(tipo) for tipo in sorted(set(tipos))} }")
+
+    # Palavras-chave não são treinadas: calibrar com todos os rótulos
+    previsoes = [classificar_por_palavras_chave(t) for t in textos]
+    limiar_palavras_chave = calibrar_limiar(
+        [p["indice_certeza"] for p in previsoes], [p["tipo"] == y for p, y in zip(previsoes, tipos)],
+        args.precisao_alvo)
+    print(f"Limiar das palavras-chave: {limiar_palavras_chave if limiar_palavras_chave is not None else 'nenhum'}")
+
+    final = PreClassificador(limiar_palavras_chave=limiar_palavras_chave)
+
+    # Tipos com um único exemplo não podem ser estratificados nem calibrados
+    raros = {tipo for tipo in set(tipos) if tipos.count(tipo) < MINIMO_EXEMPLOS_TIPO}
+    if raros:
+        print(f"Tipos com menos de {MINIMO_EXEMPLOS_TIPO} exemplos fora do treino do modelo: {sorted(raros)}")
+        textos, tipos = [t for t, y in zip(textos, tipos) if y not in raros], \
+                        [y for y in tipos if y not in raros]
+
+    # A divisão estratificada exige ao menos um exemplo de cada tipo no treino e na validação
+    classes = len(set(tipos))
+    tamanho_validacao = math.ceil(len(textos) * FRACAO_VALIDACAO)
+    if classes < 2 or tamanho_validacao < classes or len(textos) - tamanho_validacao < classes:
+        print("Exemplos insuficientes para treinar e validar o modelo (são necessários pelo menos "
+              "dois tipos com exemplos no treino e na validação); salvando só o limiar das palavras-chave.")
+        final.salvar(args.saida)
+        raise SystemExit(0)
+
+    from sklearn.model_selection import train_test_split
+
+    treino_x, teste_x, treino_y, teste_y = train_test_split(
+        textos, tipos, test_size=FRACAO_VALIDACAO, random_state=42, stratify=tipos)
+    avaliacao = PreClassificador()
+    try:
+        avaliacao.treinar(treino_x, treino_y)
+    except ValueError as e:
+        # Ex.: vocabulário vazio (textos sem termos depois da normalização)
+        print(f"Não foi possível treinar o modelo ({str(e)}); salvando só o limiar das palavras-chave.")
+        final.salvar(args.saida)
+        raise SystemExit(0)
+
+    # O limiar do modelo é calibrado só nos exemplos que ele não viu no treino
+    previsoes = [avaliacao.classificar(t) for t in teste_x]
+    limiar = calibrar_limiar([p["indice_certeza"] for p in previsoes],
+                             [p["tipo"] == y for p, y in zip(previsoes, teste_y)], args.precisao_alvo)
+    if limiar is None:
+        print("Validação: nenhum limiar atinge a precisão alvo; o modelo nunca dispensará o LLM")
+    else:
+        aceitos = [(p["tipo"], y) for p, y in zip(previsoes, teste_y) if p["indice_certeza"] >= limiar]
+        acertos = sum(1 for tipo, y in aceitos if tipo == y)
+        print(f"Validação: limiar {limiar:.4f}, {len(aceitos)}/{len(teste_x)} resolvidos localmente "
+              f"(escalonamento {1 - len(aceitos) / len(teste_x):.1%}), "
+              f"acurácia local {acertos / len(aceitos):.1%}")
+
+    final.limiar = limiar
+    final.treinar(textos, tipos)
+    final.salvar(args.saida)
+    print("Modelo salvo.")
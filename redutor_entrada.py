@@ -0,0 +1,169 @@
+import re
+import threading
+
+from pre_classificador import normalizar_texto, pontuar_palavras_chave
+
+
+# Tokens por documento enviados ao LLM quando a redução está ativa
+ORCAMENTO_TOKENS_DOCUMENTO = 1500
+
+# Fração do orçamento reservada para o início da primeira página,
+# onde fica o cabeçalho que costuma decidir o tipo
+PROPORCAO_TOPO = 0.4
+
+# Linhas por janela na busca pelos trechos com mais palavras-chave
+LINHAS_JANELA = 8
+
+# Separador entre trechos não contíguos do texto reduzido
+MARCADOR_CORTE = "[...]"
+
+# Linhas mais curtas que isso não são tratadas como boilerplate repetido
+MIN_CARACTERES_BOILERPLATE = 12
+
+_codificadores = {}
+_trava = threading.Lock()
+
+
+def _codificador(modelo):
+    """Retorna o codificador do tiktoken do modelo (None se o tiktoken não estiver instalado)."""
+    with _trava:
+        if modelo not in _codificadores:
+            try:
+                import tiktoken
+            except ImportError:
+                _codificadores[modelo] = None
+            else:
+                try:
+                    _codificadores[modelo] = tiktoken.encoding_for_model(modelo)
+                except KeyError:
+                    _codificadores[modelo] = tiktoken.get_encoding("o200k_base")
+        return _codificadores[modelo]
+
+
+def contar_tokens(texto, modelo="gpt-4o-mini"):
+    """
+    Conta os tokens do texto localmente com o tiktoken.
+
+    Args:
+        texto (str): Texto a contar
+        modelo (str): Modelo cujo tokenizador é usado
+
+    Returns:
+        int: Número de tokens (estimativa de ~4 caracteres por token sem o tiktoken)
+    """
+    codificador = _codificador(modelo)
+    if codificador is None:
+        return len(texto) // 4 + 1
+    return len(codificador.encode(texto, disallowed_special=()))
+
+
+def limpar_linhas(paginas):
+    """
+    Colapsa espaços, remove linhas vazias e descarta as repetições de linhas
+    longas (cabeçalhos e rodapés que se repetem em todas as páginas).
+
+    Args:
+        paginas (list): Texto de cada página
+
+    Returns:
+        list: (número da página, linha) na ordem original
+    """
+    vistas = set()
+    linhas = []
+    for numero, texto in enumerate(paginas):
+        for linha in texto.splitlines():
+            linha = re.sub(r"\s+", " ", linha).strip()
+            if not linha:
+                continue
+            if len(linha) >= MIN_CARACTERES_BOILERPLATE:
+                chave = normalizar_texto(linha)
+                if chave in vistas:
+                    continue
+                vistas.add(chave)
+            linhas.append((numero, linha))
+    return linhas
+
+
+def reduzir_texto(paginas, orcamento_tokens=ORCAMENTO_TOKENS_DOCUMENTO, modelo="gpt-4o-mini"):
+    """
+    Reduz o texto de um documento a um orçamento fixo de tokens.
+
+    Mantém o início da primeira página (até PROPORCAO_TOPO do orçamento) e,
+    com o restante, as janelas de LINHAS_JANELA linhas com maior densidade de
+    palavras-chave dos tipos, na ordem original e separadas por "[...]".
+    Cada janela paga também o marcador que pode vir antes dela, de modo que
+    o texto final, com os marcadores, não passa do orçamento.
+
+    Args:
+        paginas (list): Texto de cada página
+        orcamento_tokens (int): Máximo de tokens do texto reduzido
+        modelo (str): Modelo cujo tokenizador é usado na contagem
+
+    Returns:
+        tuple: (texto reduzido, tokens antes, tokens depois)
+    """
+    original = "\n".join(paginas)
+    tokens_antes = contar_tokens(original, modelo)
+
+    linhas = limpar_linhas(paginas)
+    texto = "\n".join(linha for _, linha in linhas)
+    if contar_tokens(texto, modelo) <= orcamento_tokens:
+        return texto, tokens_antes, contar_tokens(texto, modelo)
+
+    tokens_linhas = [contar_tokens(linha, modelo) + 1 for _, linha in linhas]
+    tokens_marcador = contar_tokens(MARCADOR_CORTE, modelo) + 1
+    escolhidas = set()
+    usados = 0
+
+    # Início da primeira página
+    limite_topo = int(orcamento_tokens * PROPORCAO_TOPO)
+    for i, (numero, _) in enumerate(linhas):
+        if numero != linhas[0][0] or usados + tokens_linhas[i] > limite_topo:
+            break
+        escolhidas.add(i)
+        usados += tokens_linhas[i]
+
+    # Janelas restantes, das mais densas em palavras-chave para as menos densas
+    janelas = []
+    for inicio in range(0, len(linhas), LINHAS_JANELA):
+        indices = [i for i in range(inicio, min(inicio + LINHAS_JANELA, len(linhas)))
+                   if i not in escolhidas]
+        if not indices:
+            continue
+        pontuacao = sum(pontuar_palavras_chave(
+            "\n".join(linhas[i][1] for i in indices)).values())
+        if pontuacao == 0:
+            continue
+        tokens = sum(tokens_linhas[i] for i in indices)
+        janelas.append((pontuacao / tokens, indices, tokens))
+
+    for _, indices, tokens in sorted(janelas, key=lambda j: j[0], reverse=True):
+        if usados + tokens + tokens_marcador > orcamento_tokens:
+            continue
+        escolhidas.update(indices)
+        usados += tokens + tokens_marcador
+
+    if not escolhidas:
+        # Nenhuma linha coube inteira (texto sem quebras): cortar o início
+        reduzido = texto[:orcamento_tokens * 4]
+        while reduzido and contar_tokens(reduzido, modelo) > orcamento_tokens:
+            reduzido = reduzido[:int(len(reduzido) * 0.9)]
+        return reduzido, tokens_antes, contar_tokens(reduzido, modelo)
+
+    partes = []
+    anterior = -1
+    for i in sorted(escolhidas):
+        if anterior >= 0 and i != anterior + 1:
+            partes.append(MARCADOR_CORTE)
+        partes.append(linhas[i][1])
+        anterior = i
+
+    # A soma por linha é uma estimativa: se o texto junto ainda passar do
+    # orçamento, descartar linhas do fim (e o marcador que ficar sobrando)
+    reduzido = "\n".join(partes)
+    while len(partes) > 1 and contar_tokens(reduzido, modelo) > orcamento_tokens:
+        partes.pop()
+        while len(partes) > 1 and partes[-1] == MARCADOR_CORTE:
+            partes.pop()
+        reduzido = "\n".join(partes)
+    return reduzido, tokens_antes, contar_tokens(reduzido, modelo)
@@ -0,0 +1,696 @@
+import json
+import multiprocessing
+import os
+import shutil
+import threading
+import time
+import uuid
+from datetime import datetime
+
+from flask import Flask, jsonify, request, url_for
+from werkzeug.utils import secure_filename
+
+from persistencia import conectar_banco
+
+
+# Serviço de extração de longa duração: recebe PDFs (upload ou caminho no
+# disco do servidor), enfileira em uma fila persistente no SQLite e processos
+# workers já aquecidos (main.py, langchain e o cliente do modelo importados uma
+# única vez) executam extração -> classificação -> gravação de cada trabalho.
+#
+# O processo HTTP não importa main.py: só lê e grava a fila. Trabalhos em
+# andamento de um worker que morre voltam para a fila; os que falham
+# MAX_TENTATIVAS_TRABALHO vezes ficam como falhou.
+
+HOST_SERVICO = os.getenv("SERVICO_HOST", "127.0.0.1")
+PORTA_SERVICO = int(os.getenv("SERVICO_PORTA", "8503"))
+
+# Fila separada do banco de classificações: a reserva de trabalhos não disputa
+# o lock de escrita com o escritor em lote
+FILA_SERVICO_DB = os.getenv("FILA_SERVICO_DB", "fila_servico.db")
+DIRETORIO_UPLOADS = os.getenv("SERVICO_DIRETORIO_UPLOADS", "uploads")
+DIRETORIO_SAIDA_SERVICO = os.getenv("SERVICO_DIRETORIO_SAIDA", "saida_servico")
+# Se definido, só caminhos dentro deste diretório podem ser enfileirados por caminho
+RAIZ_CAMINHOS_SERVICO = os.getenv("SERVICO_RAIZ_CAMINHOS", "")
+
+# Processos workers e trabalhos simultâneos em cada um
+WORKERS_SERVICO = int(os.getenv("SERVICO_WORKERS", "2"))
+CONCORRENCIA_POR_WORKER = int(os.getenv("SERVICO_CONCORRENCIA_WORKER", "2"))
+
+# Contrapressão: trabalhos pendentes aceitos antes de responder 503
+MAX_FILA_SERVICO = int(os.getenv("SERVICO_MAX_FILA", "200"))
+SEGUNDOS_RETRY_AFTER = int(os.getenv("SERVICO_RETRY_AFTER", "10"))
+MAX_UPLOAD_MB = float(os.getenv("SERVICO_MAX_UPLOAD_MB", "200"))
+
+MAX_TENTATIVAS_TRABALHO = 3
+# Espera de um worker ocioso entre consultas à fila, em segundos
+INTERVALO_CONSULTA_FILA = 0.5
+# Espera máxima entre novas tentativas quando a fila dá erro (banco bloqueado, etc.)
+MAX_ESPERA_ERRO_FILA = 30.0
+# Intervalo da verificação dos workers pelo supervisor, em segundos
+INTERVALO_SUPERVISAO = 2.0
+
+
+class FilaCheia(Exception):
+    """A fila não comporta os trabalhos enviados."""
+
+    def __init__(self, pendentes, limite):
+        super().__init__(f"fila cheia: {pendentes} trabalho(s) pendente(s), limite {limite}")
+        self.pendentes = pendentes
+        self.limite = limite
+
+
+class FilaTrabalhos:
+    """
+    Fila de trabalhos persistente em SQLite (modo WAL).
+
+    Cada operação abre a própria conexão, então a mesma instância pode ser
+    usada por várias threads e cada processo cria a sua. A reserva usa
+    BEGIN IMMEDIATE: dois workers nunca pegam o mesmo trabalho.
+    """
+
+    def __init__(self, db_path=FILA_SERVICO_DB):
+        """
+        Args:
+            db_path (str): Caminho do banco da fila
+        """
+        self.db_path = db_path
+        conn = conectar_banco(db_path)
+        try:
+            conn.executescript('''
+                CREATE TABLE IF NOT EXISTS trabalhos (
+                    id TEXT PRIMARY KEY,
+                    caminho_arquivo TEXT NOT NULL,
+                    nome_original TEXT,
+                    upload INTEGER NOT NULL DEFAULT 0,
+                    forcar INTEGER NOT NULL DEFAULT 0,
+                    status TEXT NOT NULL,
+                    tentativas INTEGER NOT NULL DEFAULT 0,
+                    worker TEXT,
+                    resultado TEXT,
+                    erro TEXT,
+                    data_criacao TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    data_inicio TIMESTAMP,
+                    data_fim TIMESTAMP
+                );
+                CREATE INDEX IF NOT EXISTS idx_trabalhos_status ON trabalhos(status);
+            ''')
+        finally:
+            conn.close()
+
+    def _conectar(self):
+        conn = conectar_banco(self.db_path)
+        conn.row_factory = _linha_dict
+        # Transações explícitas (BEGIN IMMEDIATE) em vez das implícitas do módulo sqlite3
+        conn.isolation_level = None
+        return conn
+
+    def enfileirar(self, arquivos, max_pendentes=MAX_FILA_SERVICO):
+        """
+        Enfileira um ou mais PDFs, todos ou nenhum.
+
+        Args:
+            arquivos (list): (id, caminho, nome_original, upload, forcar) de cada trabalho
+            max_pendentes (int): Máximo de trabalhos pendentes na fila depois da inclusão
+
+        Raises:
+            FilaCheia: Se os trabalhos não couberem na fila
+        """
+        conn = self._conectar()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            pendentes = conn.execute(
+                "SELECT COUNT(*) AS n FROM trabalhos WHERE status = 'pendente'").fetchone()["n"]
+            if pendentes + len(arquivos) > max_pendentes:
+                conn.execute("ROLLBACK")
+                raise FilaCheia(pendentes, max_pendentes)
+            conn.executemany('''
+                INSERT INTO trabalhos (id, caminho_arquivo, nome_original, upload, forcar, status)
+                VALUES (?, ?, ?, ?, ?, 'pendente')
+            ''', [(id_, caminho, nome, int(upload), int(forcar))
+                  for id_, caminho, nome, upload, forcar in arquivos])
+            conn.execute("COMMIT")
+        finally:
+            conn.close()
+
+    def reservar(self, worker):
+        """
+        Marca o trabalho pendente mais antigo como em processamento.
+
+        Args:
+            worker (str): Identificador de quem reservou ("worker-1/2")
+
+        Returns:
+            dict: Linha do trabalho, ou None se a fila estiver vazia
+        """
+        conn = self._conectar()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            # Um arquivo nunca é processado por dois trabalhos ao mesmo tempo: o
+            # segundo espera o primeiro terminar (e então reaproveita o resultado)
+            trabalho = conn.execute('''
+                SELECT * FROM trabalhos
+                WHERE status = 'pendente' AND caminho_arquivo NOT IN (
+                    SELECT caminho_arquivo FROM trabalhos WHERE status = 'processando')
+                ORDER BY rowid LIMIT 1
+            ''').fetchone()
+            if trabalho is not None:
+                conn.execute('''
+                    UPDATE trabalhos
+                    SET status = 'processando', worker = ?, tentativas = tentativas + 1,
+                        data_inicio = CURRENT_TIMESTAMP
+                    WHERE id = ?
+                ''', (worker, trabalho["id"]))
+                trabalho.update(status="processando", worker=worker, tentativas=trabalho["tentativas"] + 1)
+            conn.execute("COMMIT")
+            return trabalho
+        finally:
+            conn.close()
+
+    def concluir(self, trabalho_id, resultado):
+        """Registra o resultado de um trabalho processado."""
+        self._finalizar(trabalho_id, "concluido", resultado=json.dumps(resultado, ensure_ascii=False))
+
+    def falhar(self, trabalho_id, erro):
+        """Registra a falha de um trabalho."""
+        self._finalizar(trabalho_id, "falhou", erro=str(erro))
+
+    def _finalizar(self, trabalho_id, status, resultado=None, erro=None):
+        conn = self._conectar()
+        try:
+            conn.execute('''
+                UPDATE trabalhos
+                SET status = ?, resultado = ?, erro = ?, data_fim = CURRENT_TIMESTAMP
+                WHERE id = ?
+            ''', (status, resultado, erro, trabalho_id))
+        finally:
+            conn.close()
+
+    def devolver_em_andamento(self, worker=None, max_tentativas=MAX_TENTATIVAS_TRABALHO):
+        """
+        Devolve à fila os trabalhos em processamento de um worker que parou
+        (ou de todos, na inicialização do serviço). Os que já esgotaram as
+        tentativas ficam como falhou.
+
+        Args:
+            worker (str): Nome do processo worker (None: todos)
+            max_tentativas (int): Tentativas antes de desistir do trabalho
+
+        Returns:
+            int: Trabalhos devolvidos ou marcados como falhou
+        """
+        filtro, parametros = "", ()
+        if worker is not None:
+            filtro, parametros = " AND worker LIKE ?", (worker + "/%",)
+        conn = self._conectar()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            falhados = conn.execute(f'''
+                UPDATE trabalhos
+                SET status = 'falhou', erro = 'worker interrompido durante o processamento',
+                    data_fim = CURRENT_TIMESTAMP
+                WHERE status = 'processando' AND tentativas >= ?{filtro}
+            ''', (max_tentativas,) + parametros).rowcount
+            devolvidos = conn.execute(f'''
+                UPDATE trabalhos SET status = 'pendente', worker = NULL, data_inicio = NULL
+                WHERE status = 'processando'{filtro}
+            ''', parametros).rowcount
+            conn.execute("COMMIT")
+            return falhados + devolvidos
+        finally:
+            conn.close()
+
+    def obter(self, trabalho_id):
+        """
+        Returns:
+            dict: Linha do trabalho com o resultado já decodificado, ou None se não existir
+        """
+        conn = self._conectar()
+        try:
+            trabalho = conn.execute("SELECT * FROM trabalhos WHERE id = ?", (trabalho_id,)).fetchone()
+        finally:
+            conn.close()
+        if trabalho is not None and trabalho["resultado"] is not None:
+            trabalho["resultado"] = json.loads(trabalho["resultado"])
+        return trabalho
+
+    def contar(self):
+        """
+        Returns:
+            dict: {status: quantidade}
+        """
+        conn = self._conectar()
+        try:
+            linhas = conn.execute(
+                "SELECT status, COUNT(*) AS n FROM trabalhos GROUP BY status").fetchall()
+        finally:
+            conn.close()
+        return {linha["status"]: linha["n"] for linha in linhas}
+
+
+def _linha_dict(cursor, linha):
+    return {coluna[0]: valor for coluna, valor in zip(cursor.description, linha)}
+
+
+# --- Workers ---------------------------------------------------------------
+
+def processar_trabalho(trabalho, execucao_id, trava_extracao, db_path, diretorio_saida):
+    """
+    Executa extração -> classificação -> gravação de um trabalho com as
+    funções de main.py (o worker já o importou).
+
+    Um PDF cujo conteúdo (hash) já foi classificado, neste caminho ou em
+    outro, não é reprocessado, a menos que o trabalho tenha sido enviado com
+    forcar; o resultado existente é devolvido com "reaproveitado": true.
+    Linhas sem hash ou com outro hash nunca são reaproveitadas. O JSON de
+    saída fica em diretorio_saida/<id do trabalho>, então uploads de mesmo
+    nome não se sobrescrevem.
+
+    Args:
+        trabalho (dict): Linha da fila
+        execucao_id (str): Execução do worker, onde ficam o status e os tempos dos arquivos
+        trava_extracao (threading.Lock): Serializa a extração dentro do processo
+        db_path (str): Caminho para o arquivo do banco de dados
+        diretorio_saida (str): Diretório dos JSONs de resultado
+
+    Returns:
+        dict: Resultado no formato de registrar_resultado, com "origem" e "reaproveitado"
+    """
+    import main
+
+    arquivo_pdf = trabalho["caminho_arquivo"]
+    if not os.path.isfile(arquivo_pdf):
+        raise FileNotFoundError(f"arquivo não encontrado: {arquivo_pdf}")
+    hash_pdf = main.calcular_hash_arquivo(arquivo_pdf)
+
+    if not trabalho["forcar"]:
+        existente = _obter_classificacao(db_path, hash_arquivo=hash_pdf)
+        if existente is not None:
+            return _formatar_classificacao(existente, reaproveitado=True)
+    substituir = _obter_classificacao(db_path, caminho_arquivo=arquivo_pdf) is not None
+    diretorio_trabalho = os.path.join(diretorio_saida, trabalho["id"])
+    os.makedirs(diretorio_trabalho, exist_ok=True)
+
+    main.criar_execucao(f"servico:{execucao_id}", [arquivo_pdf], db_path=db_path, execucao_id=execucao_id)
+    main.iniciar_medicao(arquivo_pdf)
+    # Validações feitas no dashboard enquanto o serviço está no ar
+    if main.CLASSIFICADOR_KNN:
+        main.indexar_validadas(db_path, salvar=False)
+    try:
+        # O PyMuPDF não é seguro entre threads: a extração (limitada por CPU) é
+        # serializada no processo e a classificação (limitada pela rede) não
+        with trava_extracao:
+            texto = main.extrair_texto_combinado(arquivo_pdf)
+        main.atualizar_status_arquivo(execucao_id, arquivo_pdf, "extraido", db_path=db_path)
+
+        classificacao = main.classificar_texto(texto, db_path)
+        main.registrar_resultado(
+            arquivo_pdf, classificacao, diretorio_trabalho, hash_arquivo=hash_pdf,
+            substituir=substituir, db_path=db_path, texto=texto)
+        main.atualizar_status_arquivo(execucao_id, arquivo_pdf, "classificado", db_path=db_path)
+    except Exception as e:
+        main.atualizar_status_arquivo(execucao_id, arquivo_pdf, "falhou", erro=str(e), db_path=db_path)
+        raise
+    finally:
+        main.registrar_medicao(execucao_id, main.finalizar_medicao(), db_path=db_path)
+
+    # Com o escritor em lote a gravação é assíncrona: o trabalho só é
+    # concluído depois que a linha de fato estiver no banco. A linha é buscada
+    # pelo caminho, que nenhum outro trabalho processa ao mesmo tempo (reservar)
+    main.sincronizar_escritor(db_path)
+    gravado = _obter_classificacao(db_path, caminho_arquivo=arquivo_pdf)
+    if gravado is None or gravado["hash_arquivo"] != hash_pdf:
+        raise RuntimeError("a gravação da classificação no banco falhou")
+    return _formatar_classificacao(gravado, reaproveitado=False)
+
+
+def _remover_upload(trabalho, db_path):
+    """
+    Apaga uploads/<id> de um trabalho terminado cujo PDF não ficou registrado
+    em classificacoes (reaproveitado ou que falhou). Os classificados ficam:
+    o visualizador do dashboard, as miniaturas e um reprocessamento com
+    forcar abrem o arquivo pelo caminho gravado. Caminhos enviados por JSON
+    nunca são apagados.
+    """
+    if not trabalho["upload"]:
+        return
+    if _obter_classificacao(db_path, caminho_arquivo=trabalho["caminho_arquivo"]) is not None:
+        return
+    diretorio = os.path.dirname(trabalho["caminho_arquivo"])
+    if os.path.realpath(os.path.dirname(diretorio)) == os.path.realpath(DIRETORIO_UPLOADS):
+        shutil.rmtree(diretorio, ignore_errors=True)
+
+
+def _obter_classificacao(db_path, caminho_arquivo=None, hash_arquivo=None):
+    """Linha de classificacoes do caminho ou, por hash, a mais recente com esse conteúdo."""
+    if caminho_arquivo is not None:
+        filtro, parametros = "caminho_arquivo = ?", (caminho_arquivo,)
+    else:
+        filtro, parametros = "hash_arquivo = ?", (hash_arquivo,)
+    conn = conectar_banco(db_path)
+    conn.row_factory = _linha_dict
+    try:
+        return conn.execute(f'''
+            SELECT nome_arquivo, tipo_classificacao, indice_certeza, tokens_entrada, tokens_saida,
+                   hash_arquivo, origem_classificacao
+            FROM classificacoes WHERE {filtro}
+            ORDER BY data_processamento DESC LIMIT 1
+        ''', parametros).fetchone()
+    finally:
+        conn.close()
+
+
+def _formatar_classificacao(linha, reaproveitado):
+    return {
+        "nome_arquivo": linha["nome_arquivo"],
+        "classificacao": {
+            "tipo": linha["tipo_classificacao"],
+            "indice_certeza": linha["indice_certeza"]
+        },
+        "tokens_entrada": linha["tokens_entrada"],
+        "tokens_saida": linha["tokens_saida"],
+        "origem": linha["origem_classificacao"] or "llm",
+        "hash_arquivo": linha["hash_arquivo"],
+        "reaproveitado": reaproveitado
+    }
+
+
+def executar_worker(nome, fila_db, db_path, diretorio_saida, concorrencia, parar, trava_inicializacao):
+    """
+    Corpo de um processo worker: importa main.py e cria os clientes do
+    modelo uma única vez e processa até `concorrencia` trabalhos por vez
+    até `parar` ser sinalizado.
+
+    Args:
+        nome (str): Nome do worker ("worker-1")
+        fila_db (str): Banco da fila
+        db_path (str): Banco de classificações
+        diretorio_saida (str): Diretório dos JSONs de resultado
+        concorrencia (int): Trabalhos simultâneos neste processo
+        parar (multiprocessing.Event): Sinal de encerramento
+        trava_inicializacao (multiprocessing.Lock): Evita que os workers criem o esquema ao mesmo tempo
+    """
+    from dotenv import load_dotenv
+    load_dotenv()
+
+    import main
+
+    with trava_inicializacao:
+        main.inicializar_banco_dados(db_path)
+    # Aquecer: clientes do modelo e índices carregados antes do primeiro trabalho
+    main.obter_chain_classificacao_pagina()
+    if main.CLASSIFICADOR_KNN:
+        main.indexar_validadas(db_path, salvar=False)
+    os.makedirs(diretorio_saida, exist_ok=True)
+
+    execucao_id = f"{datetime.now():%Y%m%d%H%M%S}-{nome}"
+    main.criar_execucao(f"servico:{execucao_id}", [], db_path=db_path, execucao_id=execucao_id)
+    fila = FilaTrabalhos(fila_db)
+    trava_extracao = threading.Lock()
+    print(f"[{nome}] Pronto (pid {os.getpid()}, {concorrencia} trabalho(s) simultâneo(s))")
+
+    def _repetir(identificador, operacao, *args):
+        # Um erro da fila (ex.: database is locked) não pode matar a thread:
+        # tentar de novo com espera crescente até dar certo ou o worker parar
+        espera = INTERVALO_CONSULTA_FILA
+        while True:
+            try:
+                return operacao(*args)
+            except Exception as e:
+                print(f"[{identificador}] Erro na fila ({str(e)}); nova tentativa em {espera:.1f}s")
+                if parar.wait(espera):
+                    raise
+                espera = min(espera * 2, MAX_ESPERA_ERRO_FILA)
+
+    def _consumir(indice):
+        identificador = f"{nome}/{indice}"
+        while not parar.is_set():
+            try:
+                trabalho = _repetir(identificador, fila.reservar, identificador)
+                if trabalho is None:
+                    parar.wait(INTERVALO_CONSULTA_FILA)
+                    continue
+                print(f"[{identificador}] Processando {trabalho['id']}: {os.path.basename(trabalho['caminho_arquivo'])}")
+                try:
+                    resultado = processar_trabalho(trabalho, execucao_id, trava_extracao, db_path, diretorio_saida)
+                except Exception as e:
+                    print(f"[{identificador}] Erro no trabalho {trabalho['id']}: {str(e)}")
+                    _repetir(identificador, fila.falhar, trabalho["id"], e)
+                else:
+                    _repetir(identificador, fila.concluir, trabalho["id"], resultado)
+                _repetir(identificador, _remover_upload, trabalho, db_path)
+            except Exception as e:
+                # Só chega aqui com o worker parando: o trabalho em andamento
+                # volta à fila em devolver_em_andamento
+                print(f"[{identificador}] Encerrando com erro na fila: {str(e)}")
+
+    threads = [threading.Thread(target=_consumir, args=(indice,), name=f"{nome}/{indice}")
+               for indice in range(1, concorrencia + 1)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    print(f"[{nome}] Encerrado: {main.finalizar_execucao(execucao_id, db_path)}")
+
+
+class SupervisorWorkers:
+    """
+    Mantém os processos workers no ar: inicia, reinicia os que morrerem
+    (devolvendo os trabalhos deles à fila) e encerra no fim do serviço.
+    """
+
+    def __init__(self, fila, db_path="classificacoes.db", diretorio_saida=DIRETORIO_SAIDA_SERVICO,
+                 workers=WORKERS_SERVICO, concorrencia=CONCORRENCIA_POR_WORKER):
+        """
+        Args:
+            fila (FilaTrabalhos): Fila do serviço
+            db_path (str): Banco de classificações
+            diretorio_saida (str): Diretório dos JSONs de resultado
+            workers (int): Processos workers
+            concorrencia (int): Trabalhos simultâneos por worker
+        """
+        self.fila = fila
+        self.db_path = db_path
+        self.diretorio_saida = diretorio_saida
+        self.concorrencia = concorrencia
+        self.nomes = [f"worker-{indice}" for indice in range(1, workers + 1)]
+        self.processos = {}
+        self.reinicios = 0
+        # spawn: os workers não herdam as threads do servidor HTTP
+        self._contexto = multiprocessing.get_context("spawn")
+        self._parar = self._contexto.Event()
+        self._trava_inicializacao = self._contexto.Lock()
+        self._thread = None
+
+    def _iniciar(self, nome):
+        processo = self._contexto.Process(
+            target=executar_worker, name=nome,
+            args=(nome, self.fila.db_path, self.db_path, self.diretorio_saida, self.concorrencia,
+                  self._parar, self._trava_inicializacao))
+        processo.start()
+        self.processos[nome] = processo
+
+    def iniciar(self):
+        """Devolve à fila o que ficou em andamento numa execução anterior e inicia os workers."""
+        devolvidos = self.fila.devolver_em_andamento()
+        if devolvidos:
+            print(f"[Serviço] {devolvidos} trabalho(s) interrompido(s) devolvido(s) à fila")
+        for nome in self.nomes:
+            self._iniciar(nome)
+        self._thread = threading.Thread(target=self._supervisionar, name="supervisor-workers", daemon=True)
+        self._thread.start()
+
+    def _supervisionar(self):
+        while not self._parar.wait(INTERVALO_SUPERVISAO):
+            for nome, processo in list(self.processos.items()):
+                if processo.is_alive():
+                    continue
+                devolvidos = self.fila.devolver_em_andamento(nome)
+                print(f"[Serviço] {nome} parou (código {processo.exitcode}); "
+                      f"{devolvidos} trabalho(s) devolvido(s) à fila, reiniciando")
+                self.reinicios += 1
+                self._iniciar(nome)
+
+    def encerrar(self, timeout=60.0):
+        """Pede aos workers que terminem os trabalhos em andamento e espera até `timeout` segundos."""
+        self._parar.set()
+        limite = time.monotonic() + timeout
+        for processo in self.processos.values():
+            processo.join(max(0.0, limite - time.monotonic()))
+            if processo.is_alive():
+                processo.terminate()
+                processo.join()
+        self.fila.devolver_em_andamento()
+
+    def situacao(self):
+        """
+        Returns:
+            list: {"nome", "pid", "vivo"} de cada worker
+        """
+        return [{"nome": nome, "pid": processo.pid, "vivo": processo.is_alive()}
+                for nome, processo in self.processos.items()]
+
+
+# --- API HTTP --------------------------------------------------------------
+
+app = Flask(__name__)
+app.config["MAX_CONTENT_LENGTH"] = int(MAX_UPLOAD_MB * 1024 * 1024)
+app.config["FILA"] = None
+app.config["SUPERVISOR"] = None
+
+
+def _resposta_fila_cheia(erro):
+    resposta = jsonify({"erro": str(erro), "pendentes": erro.pendentes, "limite": erro.limite})
+    resposta.status_code = 503
+    resposta.headers["Retry-After"] = str(SEGUNDOS_RETRY_AFTER)
+    return resposta
+
+
+def _caminho_permitido(caminho):
+    if not RAIZ_CAMINHOS_SERVICO:
+        return True
+    raiz = os.path.realpath(RAIZ_CAMINHOS_SERVICO)
+    return os.path.commonpath([raiz, os.path.realpath(caminho)]) == raiz
+
+
+def _descrever_trabalho(trabalho):
+    descricao = {
+        "id": trabalho["id"],
+        "status": trabalho["status"],
+        "arquivo": trabalho["nome_original"] or os.path.basename(trabalho["caminho_arquivo"]),
+        "tentativas": trabalho["tentativas"],
+        "data_criacao": trabalho["data_criacao"],
+        "data_inicio": trabalho["data_inicio"],
+        "data_fim": trabalho["data_fim"],
+        "resultado_url": url_for("resultado_trabalho", trabalho_id=trabalho["id"]),
+    }
+    if trabalho["erro"]:
+        descricao["erro"] = trabalho["erro"]
+    return descricao
+
+
+@app.post("/trabalhos")
+def criar_trabalhos():
+    """
+    Enfileira PDFs enviados como multipart (campo "arquivo", repetível) ou
+    caminhos no disco do servidor em JSON ({"caminhos": [...]}).
+    ?forcar=1 (ou "forcar": true no JSON) reprocessa arquivos já classificados.
+    Responde 202 com os trabalhos criados ou 503 com Retry-After se a fila estiver cheia.
+    """
+    fila = app.config["FILA"]
+    enviados = request.files.getlist("arquivo")
+    dados = request.get_json(silent=True) or {}
+    caminhos = dados.get("caminhos") or []
+    forcar = request.args.get("forcar") == "1" or bool(dados.get("forcar"))
+    if not enviados and not caminhos:
+        return jsonify({"erro": "envie arquivos no campo 'arquivo' ou {'caminhos': [...]}"}), 400
+
+    # Recusar antes de gravar os uploads em disco
+    pendentes = fila.contar().get("pendente", 0)
+    if pendentes + len(enviados) + len(caminhos) > MAX_FILA_SERVICO:
+        return _resposta_fila_cheia(FilaCheia(pendentes, MAX_FILA_SERVICO))
+
+    arquivos = []
+    for caminho in caminhos:
+        if not str(caminho).lower().endswith(".pdf") or not os.path.isfile(caminho):
+            return jsonify({"erro": f"PDF não encontrado: {caminho}"}), 400
+        if not _caminho_permitido(caminho):
+            return jsonify({"erro": f"caminho fora de {RAIZ_CAMINHOS_SERVICO}: {caminho}"}), 403
+        arquivos.append((uuid.uuid4().hex, os.path.abspath(caminho), os.path.basename(caminho), False, forcar))
+
+    diretorios_upload = []
+    for enviado in enviados:
+        nome = secure_filename(enviado.filename or "")
+        if not nome.lower().endswith(".pdf"):
+            _remover_uploads(diretorios_upload)
+            return jsonify({"erro": f"só são aceitos PDFs: {enviado.filename}"}), 400
+        trabalho_id = uuid.uuid4().hex
+        # Um diretório por trabalho preserva o nome original (usado como nome_arquivo no banco)
+        diretorio = os.path.join(DIRETORIO_UPLOADS, trabalho_id)
+        os.makedirs(diretorio, exist_ok=True)
+        diretorios_upload.append(diretorio)
+        caminho = os.path.abspath(os.path.join(diretorio, nome))
+        enviado.save(caminho)
+        arquivos.append((trabalho_id, caminho, enviado.filename, True, forcar))
+
+    try:
+        fila.enfileirar(arquivos)
+    except FilaCheia as e:
+        _remover_uploads(diretorios_upload)
+        return _resposta_fila_cheia(e)
+
+    trabalhos = [_descrever_trabalho(fila.obter(trabalho_id)) for trabalho_id, *_ in arquivos]
+    for trabalho in trabalhos:
+        trabalho["status_url"] = url_for("status_trabalho", trabalho_id=trabalho["id"])
+    return jsonify({"trabalhos": trabalhos}), 202
+
+
+def _remover_uploads(diretorios):
+    for diretorio in diretorios:
+        shutil.rmtree(diretorio, ignore_errors=True)
+
+
+@app.get("/trabalhos/<trabalho_id>")
+def status_trabalho(trabalho_id):
+    trabalho = app.config["FILA"].obter(trabalho_id)
+    if trabalho is None:
+        return jsonify({"erro": "trabalho não encontrado"}), 404
+    return jsonify(_descrever_trabalho(trabalho))
+
+
+@app.get("/trabalhos/<trabalho_id>/resultado")
+def resultado_trabalho(trabalho_id):
+    """200 com o resultado, 202 enquanto pendente/processando, 422 se falhou."""
+    trabalho = app.config["FILA"].obter(trabalho_id)
+    if trabalho is None:
+        return jsonify({"erro": "trabalho não encontrado"}), 404
+    if trabalho["status"] == "concluido":
+        return jsonify(trabalho["resultado"])
+    if trabalho["status"] == "falhou":
+        return jsonify({"status": "falhou", "erro": trabalho["erro"]}), 422
+    resposta = jsonify({"status": trabalho["status"]})
+    resposta.status_code = 202
+    resposta.headers["Retry-After"] = "1"
+    return resposta
+
+
+@app.get("/fila")
+def situacao_fila():
+    supervisor = app.config["SUPERVISOR"]
+    return jsonify({
+        "trabalhos": app.config["FILA"].contar(),
+        "max_fila": MAX_FILA_SERVICO,
+        "concorrencia_por_worker": supervisor.concorrencia if supervisor else None,
+        "workers": supervisor.situacao() if supervisor else [],
+        "reinicios_workers": supervisor.reinicios if supervisor else 0,
+    })
+
+
+if __name__ == "__main__":
+    import argparse
+
+    from dotenv import load_dotenv
+    load_dotenv()
+
+    parser = argparse.ArgumentParser(
+        description="Serviço HTTP de extração com fila persistente e workers aquecidos.")
+    parser.add_argument("--host", default=HOST_SERVICO)
+    parser.add_argument("--porta", type=int, default=PORTA_SERVICO)
+    parser.add_argument("--db", default="classificacoes.db")
+    parser.add_argument("--fila", default=FILA_SERVICO_DB)
+    parser.add_argument("--saida", default=DIRETORIO_SAIDA_SERVICO)
+    parser.add_argument("--workers", type=int, default=WORKERS_SERVICO)
+    parser.add_argument("--concorrencia", type=int, default=CONCORRENCIA_POR_WORKER,
+                        help="Trabalhos simultâneos por worker")
+    args = parser.parse_args()
+
+    app.config["FILA"] = FilaTrabalhos(args.fila)
+    supervisor = SupervisorWorkers(app.config["FILA"], args.db, args.saida, args.workers, args.concorrencia)
+    app.config["SUPERVISOR"] = supervisor
+    supervisor.iniciar()
+    try:
+        app.run(host=args.host, port=args.porta, threaded=True)
+    finally:
+        print("[Serviço] Encerrando workers...")
+        supervisor.encerrar()
@@ -0,0 +1,90 @@
+import os
+import sqlite3
+import threading
+
+from flask import Flask, abort, request, send_file
+from werkzeug.serving import make_server
+
+
+# Servidor local que entrega os PDFs classificados ao dashboard direto do
+# disco, com suporte a Range (o visualizador do navegador baixa só as partes
+# que exibe) em vez de embutir o arquivo inteiro em base64 na página.
+# Só serve arquivos registrados na tabela classificacoes, pelo id da linha.
+
+HOST_SERVIDOR_ARQUIVOS = os.getenv("DASHBOARD_HOST_ARQUIVOS", "127.0.0.1")
+PORTA_SERVIDOR_ARQUIVOS = int(os.getenv("DASHBOARD_PORTA_ARQUIVOS", "8502"))
+
+app = Flask(__name__)
+app.config["DB_PATH"] = "classificacoes.db"
+
+
+def caminho_documento(documento_id, db_path="classificacoes.db"):
+    """
+    Retorna o caminho do PDF de uma classificação.
+
+    Args:
+        documento_id (int): id da linha em classificacoes
+        db_path (str): Caminho para o arquivo do banco de dados
+
+    Returns:
+        str: Caminho do arquivo, ou None se o id não existir
+    """
+    conn = sqlite3.connect(db_path)
+    try:
+        linha = conn.execute(
+            'SELECT caminho_arquivo FROM classificacoes WHERE id = ?', (documento_id,)).fetchone()
+    finally:
+        conn.close()
+    return linha[0] if linha else None
+
+
+@app.get("/documentos/<int:documento_id>")
+def servir_documento(documento_id):
+    caminho = caminho_documento(documento_id, app.config["DB_PATH"])
+    if caminho is None or not os.path.isfile(caminho):
+        abort(404)
+    # conditional=True responde a Range/If-None-Match lendo o arquivo em blocos
+    return send_file(os.path.abspath(caminho), mimetype="application/pdf", conditional=True,
+                     as_attachment=request.args.get("download") == "1",
+                     download_name=os.path.basename(caminho))
+
+
+def iniciar_servidor_arquivos(host=HOST_SERVIDOR_ARQUIVOS, porta=PORTA_SERVIDOR_ARQUIVOS,
+                              db_path="classificacoes.db"):
+    """
+    Inicia o servidor em uma thread daemon.
+
+    Se a porta já estiver em uso (por exemplo, por outro processo do
+    dashboard), assume que o servidor já está no ar.
+
+    Args:
+        host (str): Interface de escuta
+        porta (int): Porta de escuta
+        db_path (str): Banco usado para resolver os ids
+
+    Returns:
+        bool: True se o servidor foi iniciado por esta chamada
+    """
+    app.config["DB_PATH"] = db_path
+    try:
+        servidor = make_server(host, porta, app, threaded=True)
+    except OSError as e:
+        print(f"[Arquivos] Porta {porta} em uso, usando o servidor existente: {str(e)}")
+        return False
+    threading.Thread(target=servidor.serve_forever, name="servidor-arquivos", daemon=True).start()
+    print(f"[Arquivos] Servindo PDFs em http://{host}:{porta}/documentos/<id>")
+    return True
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        description="Serve os PDFs classificados (com suporte a Range) para o dashboard.")
+    parser.add_argument("--host", default=HOST_SERVIDOR_ARQUIVOS)
+    parser.add_argument("--porta", type=int, default=PORTA_SERVIDOR_ARQUIVOS)
+    parser.add_argument("--db", default="classificacoes.db")
+    args = parser.parse_args()
+
+    app.config["DB_PATH"] = args.db
+    app.run(host=args.host, port=args.porta, threaded=True)
@@ -0,0 +1,367 @@
+import cProfile
+import heapq
+import itertools
+import os
+import pstats
+import sqlite3
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+
+
+# Tempo de parede e de CPU por etapa do pipeline (vetorial, rasterização,
+# Tesseract, LLM, banco), acumulados por arquivo e gravados em tempos_etapas.
+# As funções instrumentadas chamam medir_etapa; sem uma medição ativa na
+# thread (iniciar_medicao), a chamada não custa nada além do with.
+
+# Arquivos mais lentos de cada execução com perfil do cProfile salvo (0 desativa)
+PERFIL_ARQUIVOS_LENTOS = int(os.getenv("PERFIL_ARQUIVOS_LENTOS", "0"))
+DIRETORIO_PERFIS = os.getenv("DIRETORIO_PERFIS", "perfis")
+
+# Limites (segundos) do histograma de tempo por arquivo no OpenMetrics
+LIMITES_HISTOGRAMA_ARQUIVO = [0.5, 1, 2, 5, 10, 30, 60, 120, 300]
+
+_local = threading.local()
+
+
+class MedicaoArquivo:
+    """
+    Contadores de um arquivo por etapa: segundos (parede), cpu_segundos
+    (CPU da thread), chamadas, páginas, bytes e tentativas.
+
+    A etapa "arquivo" é o total entre iniciar_medicao e finalizar_medicao.
+    Medições feitas em processos ou threads diferentes (extração e
+    classificação no modo paralelo) são somadas com mesclar.
+    """
+
+    CAMPOS = ("segundos", "cpu_segundos", "chamadas", "paginas", "bytes", "tentativas")
+
+    def __init__(self, arquivo):
+        self.arquivo = arquivo
+        self.etapas = {}
+        self.perfis = []  # arquivos .prof parciais desta medição
+
+    def somar(self, etapa, segundos=0.0, cpu_segundos=0.0, chamadas=0, paginas=0, num_bytes=0,
+              tentativas=0):
+        contadores = self.etapas.setdefault(etapa, dict.fromkeys(self.CAMPOS, 0))
+        contadores["segundos"] += segundos
+        contadores["cpu_segundos"] += cpu_segundos
+        contadores["chamadas"] += chamadas
+        contadores["paginas"] += paginas
+        contadores["bytes"] += num_bytes
+        contadores["tentativas"] += tentativas
+
+    def mesclar(self, outra):
+        """
+        Soma as etapas e os perfis de outra medição do mesmo arquivo. Na etapa
+        "arquivo" os tempos das partes são somados, mas o arquivo (chamadas e
+        bytes) é contado uma vez só.
+        """
+        for etapa, contadores in outra.etapas.items():
+            if etapa == "arquivo" and etapa in self.etapas:
+                self.somar(etapa, contadores["segundos"], contadores["cpu_segundos"])
+                continue
+            self.somar(etapa, contadores["segundos"], contadores["cpu_segundos"],
+                       contadores["chamadas"], contadores["paginas"], contadores["bytes"],
+                       contadores["tentativas"])
+        self.perfis.extend(outra.perfis)
+        return self
+
+    @property
+    def segundos_total(self):
+        return self.etapas.get("arquivo", {}).get("segundos", 0.0)
+
+
+def iniciar_medicao(arquivo, perfilar=False):
+    """
+    Ativa uma medição para o arquivo na thread atual.
+
+    Args:
+        arquivo (str): Caminho do arquivo medido
+        perfilar (bool): Também executa o cProfile até finalizar_medicao
+
+    Returns:
+        MedicaoArquivo: A medição ativa
+    """
+    medicao = MedicaoArquivo(arquivo)
+    try:
+        tamanho = os.path.getsize(arquivo)
+    except OSError:
+        tamanho = 0
+    _local.medicao = medicao
+    _local.inicio = (time.perf_counter(), time.thread_time(), tamanho)
+    _local.perfil = None
+    if perfilar:
+        perfil = cProfile.Profile()
+        try:
+            perfil.enable()
+            _local.perfil = perfil
+        except ValueError:
+            # Python 3.12+: só um profiler ativo por processo (outra thread já perfila)
+            pass
+    return medicao
+
+
+def finalizar_medicao():
+    """
+    Encerra a medição da thread atual, registrando a etapa "arquivo" e, se
+    houver, o perfil parcial em DIRETORIO_PERFIS/.partes.
+
+    Returns:
+        MedicaoArquivo: A medição encerrada (None se não havia medição ativa)
+    """
+    medicao = getattr(_local, "medicao", None)
+    if medicao is None:
+        return None
+    inicio, inicio_cpu, tamanho = _local.inicio
+    medicao.somar("arquivo", time.perf_counter() - inicio, time.thread_time() - inicio_cpu,
+                  1, 0, tamanho)
+
+    perfil = _local.perfil
+    if perfil is not None:
+        perfil.disable()
+        diretorio = os.path.join(DIRETORIO_PERFIS, ".partes")
+        os.makedirs(diretorio, exist_ok=True)
+        fd, caminho = tempfile.mkstemp(dir=diretorio, suffix=".prof")
+        os.close(fd)
+        perfil.dump_stats(caminho)
+        medicao.perfis.append(caminho)
+
+    _local.medicao = None
+    _local.perfil = None
+    return medicao
+
+
+@contextmanager
+def medir_etapa(etapa, paginas=0, num_bytes=0):
+    """
+    Mede o bloco como uma chamada da etapa na medição ativa da thread.
+
+    O dicionário devolvido pode ser atualizado dentro do bloco com as
+    páginas, bytes e tentativas descobertos durante a etapa.
+
+    Args:
+        etapa (str): Nome da etapa
+        paginas (int): Páginas processadas
+        num_bytes (int): Bytes processados
+    """
+    contadores = {"paginas": paginas, "bytes": num_bytes, "tentativas": 0}
+    medicao = getattr(_local, "medicao", None)
+    if medicao is None:
+        yield contadores
+        return
+    inicio = time.perf_counter()
+    inicio_cpu = time.thread_time()
+    try:
+        yield contadores
+    finally:
+        medicao.somar(etapa, time.perf_counter() - inicio, time.thread_time() - inicio_cpu, 1,
+                      contadores["paginas"], contadores["bytes"], contadores["tentativas"])
+
+
+def registrar_tentativa(etapa, quantidade=1):
+    """Conta uma nova tentativa (reparo, reenvio) da etapa na medição ativa."""
+    medicao = getattr(_local, "medicao", None)
+    if medicao is not None:
+        medicao.somar(etapa, tentativas=quantidade)
+
+
+def executar_medido(arquivo, perfilar, funcao, *args):
+    """
+    Executa funcao(*args) com uma medição ativa. Serve para os pools de
+    processos e threads, onde a medição precisa voltar junto com o resultado.
+
+    Returns:
+        tuple: (retorno da função, MedicaoArquivo)
+    """
+    iniciar_medicao(arquivo, perfilar)
+    try:
+        valor = funcao(*args)
+    finally:
+        medicao = finalizar_medicao()
+    return valor, medicao
+
+
+class PerfisLentos:
+    """
+    Mantém os perfis dos N arquivos mais lentos de uma execução (pela etapa
+    "arquivo") e descarta os demais assim que saem do top N.
+    """
+
+    def __init__(self, quantidade=PERFIL_ARQUIVOS_LENTOS, diretorio=DIRETORIO_PERFIS):
+        self.quantidade = quantidade
+        self.diretorio = diretorio
+        self._heap = []
+        self._contador = itertools.count()
+
+    @property
+    def ativo(self):
+        return self.quantidade > 0
+
+    def oferecer(self, medicao):
+        """Considera a medição de um arquivo para o top N."""
+        if not medicao.perfis:
+            return
+        if not self.ativo:
+            _remover(medicao.perfis)
+            return
+        item = (medicao.segundos_total, next(self._contador), medicao.arquivo, list(medicao.perfis))
+        if len(self._heap) < self.quantidade:
+            heapq.heappush(self._heap, item)
+        else:
+            descartado = heapq.heappushpop(self._heap, item)
+            _remover(descartado[3])
+
+    def salvar(self, execucao_id):
+        """
+        Junta os perfis parciais de cada arquivo do top N em
+        <diretorio>/<execução>/<posição>_<arquivo>.prof.
+
+        Returns:
+            list: (segundos, arquivo, caminho do perfil), do mais lento ao mais rápido
+        """
+        salvos = []
+        if not self._heap:
+            return salvos
+        destino = os.path.join(self.diretorio, str(execucao_id))
+        os.makedirs(destino, exist_ok=True)
+        for posicao, (segundos, _, arquivo, partes) in enumerate(
+                sorted(self._heap, key=lambda item: item[0], reverse=True), start=1):
+            nome = os.path.splitext(os.path.basename(arquivo))[0]
+            caminho = os.path.join(destino, f"{posicao:02d}_{nome}.prof")
+            pstats.Stats(*partes).dump_stats(caminho)
+            _remover(partes)
+            salvos.append((segundos, arquivo, caminho))
+        self._heap = []
+        return salvos
+
+
+def _remover(caminhos):
+    for caminho in caminhos:
+        try:
+            os.remove(caminho)
+        except FileNotFoundError:
+            pass
+
+
+def _escapar(valor):
+    return str(valor).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _rotulos(**rotulos):
+    valores = ",".join(
+        f'{nome}="{_escapar(valor)}"' for nome, valor in rotulos.items() if valor is not None)
+    return f"{{{valores}}}" if valores else ""
+
+
+def gerar_openmetrics(db_path="classificacoes.db", execucao_id=None):
+    """
+    Exporta os tempos por etapa no formato de texto do OpenMetrics (aceito
+    pelo Prometheus e pelo textfile collector do node_exporter).
+
+    Args:
+        db_path (str): Caminho para o arquivo do banco de dados
+        execucao_id (str): Restringe a uma execução (padrão: todas)
+
+    Returns:
+        str: Métricas em texto, terminadas por "# EOF"
+    """
+    conn = sqlite3.connect(db_path)
+    filtro = " WHERE execucao_id = ?" if execucao_id else ""
+    parametros = (execucao_id,) if execucao_id else ()
+    try:
+        etapas = conn.execute(f'''
+            SELECT etapa, SUM(segundos), SUM(cpu_segundos), SUM(chamadas), SUM(paginas),
+                   SUM(bytes), SUM(tentativas)
+            FROM tempos_etapas{filtro}
+            GROUP BY etapa
+            ORDER BY etapa
+        ''', parametros).fetchall()
+        tempos_arquivos = [linha[0] for linha in conn.execute(f'''
+            SELECT segundos FROM tempos_etapas
+            WHERE etapa = 'arquivo'{filtro.replace("WHERE", "AND")}
+        ''', parametros)]
+    finally:
+        conn.close()
+
+    linhas = []
+    contadores = [
+        ("extrator_etapa_seconds", "Tempo de parede por etapa", "seconds", 1),
+        ("extrator_etapa_cpu_seconds", "Tempo de CPU da thread por etapa", "seconds", 2),
+        ("extrator_etapa_chamadas", "Execuções de cada etapa", None, 3),
+        ("extrator_etapa_paginas", "Páginas processadas por etapa", None, 4),
+        ("extrator_etapa_bytes", "Bytes processados por etapa", "bytes", 5),
+        ("extrator_etapa_tentativas", "Tentativas extras (reparos e reenvios) por etapa", None, 6),
+    ]
+    for nome, ajuda, unidade, coluna in contadores:
+        linhas.append(f"# TYPE {nome} counter")
+        if unidade:
+            linhas.append(f"# UNIT {nome} {unidade}")
+        linhas.append(f"# HELP {nome} {ajuda}.")
+        for etapa in etapas:
+            valor = etapa[coluna] or 0
+            linhas.append(f"{nome}_total{_rotulos(etapa=etapa[0], execucao=execucao_id)} {valor}")
+
+    nome = "extrator_arquivo_seconds"
+    linhas.append(f"# TYPE {nome} histogram")
+    linhas.append(f"# UNIT {nome} seconds")
+    linhas.append(f"# HELP {nome} Tempo total de processamento por arquivo.")
+    for limite in LIMITES_HISTOGRAMA_ARQUIVO:
+        quantidade = sum(1 for segundos in tempos_arquivos if segundos <= limite)
+        linhas.append(f"{nome}_bucket{_rotulos(execucao=execucao_id, le=float(limite))} {quantidade}")
+    linhas.append(f"{nome}_bucket{_rotulos(execucao=execucao_id, le='+Inf')} {len(tempos_arquivos)}")
+    linhas.append(f"{nome}_count{_rotulos(execucao=execucao_id)} {len(tempos_arquivos)}")
+    linhas.append(f"{nome}_sum{_rotulos(execucao=execucao_id)} {sum(tempos_arquivos)}")
+    linhas.append("# EOF")
+    return "\n".join(linhas) + "\n"
+
+
+def arquivos_mais_lentos(db_path="classificacoes.db", execucao_id=None, quantidade=10):
+    """
+    Returns:
+        list: (arquivo, segundos, cpu_segundos, bytes) dos arquivos mais lentos
+    """
+    conn = sqlite3.connect(db_path)
+    try:
+        sql = '''
+            SELECT caminho_arquivo, segundos, cpu_segundos, bytes
+            FROM tempos_etapas
+            WHERE etapa = 'arquivo'
+        '''
+        parametros = []
+        if execucao_id:
+            sql += " AND execucao_id = ?"
+            parametros.append(execucao_id)
+        sql += " ORDER BY segundos DESC LIMIT ?"
+        parametros.append(quantidade)
+        return conn.execute(sql, parametros).fetchall()
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        description="Exporta os tempos por etapa (OpenMetrics) e lista os arquivos mais lentos.")
+    parser.add_argument("--db", default="classificacoes.db")
+    parser.add_argument("--execucao", default=None, help="Restringe a uma execução")
+    parser.add_argument("--saida", default=None,
+                        help="Arquivo .prom de saída (padrão: imprime na tela)")
+    parser.add_argument("--lentos", type=int, default=0,
+                        help="Lista os N arquivos mais lentos em vez das métricas")
+    args = parser.parse_args()
+
+    if args.lentos:
+        for arquivo, segundos, cpu, tamanho in arquivos_mais_lentos(args.db, args.execucao, args.lentos):
+            print(f"{segundos:8.2f}s  CPU {cpu:8.2f}s  {tamanho / 1024:9.1f} KB  {arquivo}")
+    else:
+        texto = gerar_openmetrics(args.db, args.execucao)
+        if args.saida:
+            temporario = args.saida + ".tmp"
+            with open(temporario, "w", encoding="utf-8") as f:
+                f.write(texto)
+            os.replace(temporario, args.saida)
+        else:
+            print(texto, end="")
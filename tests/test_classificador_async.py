@@ -0,0 +1,83 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+pytest.importorskip("flask")
+pytest.importorskip("openai")
+pytest.importorskip("fitz")
+pytest.importorskip("pytesseract")
+pytest.importorskip("pdf2image")
+pytest.importorskip("langchain")
+pytest.importorskip("langchain_openai")
+
+from werkzeug.serving import make_server
+
+import api_simulada
+from classificador_async import ClassificadorAsync, ClassificadorAsyncEmThread, classificar_textos
+
+
+TEXTO_BOLETO = ("Recibo do Pagador\nBeneficiário: Empresa Ltda\nNosso Número: 12345678901\n"
+                "Valor do Documento: R$ 150,00\nLinha digitável 23790.12345 60000.000003")
+
+
+@pytest.fixture
+def api(monkeypatch):
+    """Sobe api_simulada.app em uma porta livre e devolve a URL base (/v1)."""
+    monkeypatch.setenv("LATENCIA_CHAT_SIMULADA_MS", "50")
+    monkeypatch.setenv("VARIACAO_LATENCIA_CHAT_MS", "0")
+    monkeypatch.setitem(api_simulada.app.config, "RESPOSTAS_429_SIMULADAS", 0)
+    for chave in api_simulada.estatisticas_chat:
+        monkeypatch.setitem(api_simulada.estatisticas_chat, chave, 0)
+
+    servidor = make_server("127.0.0.1", 0, api_simulada.app, threaded=True)
+    threading.Thread(target=servidor.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{servidor.server_port}/v1"
+    servidor.shutdown()
+
+
+def test_limite_de_concorrencia(api):
+    resultados = classificar_textos([TEXTO_BOLETO] * 12, base_url=api, api_key="teste",
+                                    max_concorrencia=3)
+
+    assert all("erro" not in r for r in resultados)
+    assert {r["tipo"] for r in resultados} == {"boleto"}
+    assert api_simulada.estatisticas_chat["requisicoes"] == 12
+    assert api_simulada.estatisticas_chat["pico_em_andamento"] == 3
+
+
+def test_429_respeita_retry_after(api, monkeypatch):
+    monkeypatch.setitem(api_simulada.app.config, "RESPOSTAS_429_SIMULADAS", 2)
+    monkeypatch.setitem(api_simulada.app.config, "RETRY_AFTER_SIMULADO", "0.3")
+
+    async def _executar():
+        # espera_base alta: se o Retry-After fosse ignorado o backoff seria bem mais longo
+        async with ClassificadorAsync(base_url=api, api_key="teste", max_concorrencia=2,
+                                      espera_base=30.0, espera_maxima=30.0) as classificador:
+            inicio = time.monotonic()
+            resultados = await classificador.classificar_lote([TEXTO_BOLETO] * 2)
+            return resultados, classificador.estatisticas, time.monotonic() - inicio
+
+    resultados, estatisticas, duracao = asyncio.run(_executar())
+
+    assert all(r["tipo"] == "boleto" for r in resultados)
+    assert api_simulada.estatisticas_chat["respostas_429"] == 2
+    assert api_simulada.estatisticas_chat["requisicoes"] == 4
+    assert estatisticas["novas_tentativas"] == 2
+    assert estatisticas["pausas_rate_limit"] >= 1
+    assert 0.3 <= duracao < 5.0
+
+
+def test_cliente_compartilhado_entre_threads(api):
+    classificador = ClassificadorAsyncEmThread(base_url=api, api_key="teste", max_concorrencia=2)
+    try:
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            resultados = list(pool.map(classificador.classificar, [TEXTO_BOLETO] * 8))
+    finally:
+        estatisticas = classificador.fechar()
+
+    assert all(r["tipo"] == "boleto" for r in resultados)
+    assert estatisticas["requisicoes"] == 8
+    assert api_simulada.estatisticas_chat["pico_em_andamento"] == 2
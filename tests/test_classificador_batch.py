@@ -0,0 +1,125 @@
+import json
+import os
+import sqlite3
+import threading
+
+import pytest
+
+pytest.importorskip("flask")
+pytest.importorskip("openai")
+pytest.importorskip("fitz")
+pytest.importorskip("pytesseract")
+pytest.importorskip("pdf2image")
+pytest.importorskip("langchain")
+pytest.importorskip("langchain_openai")
+
+from werkzeug.serving import make_server
+
+import api_simulada
+import classificador_batch
+import main
+from classificador_batch import (acompanhar_lotes_batch, criar_cliente_batch, enviar_lote_batch,
+                                 preparar_lote_batch)
+from persistencia import sincronizar_escritor
+
+
+TEXTOS = {
+    "page_boleto.pdf": ("Recibo do Pagador\nBeneficiário: Empresa Ltda\nNosso Número: 12345678901\n"
+                        "Valor do Documento: R$ 150,00\nLocal de pagamento: qualquer banco"),
+    "page_voucher.pdf": ("Voucher de hospedagem\nNúmero da reserva: 98765\nHóspede: Maria Silva\n"
+                         "Check-in: 10/03 Check-out: 12/03\nQuarto: 204"),
+}
+
+
+@pytest.fixture
+def api(monkeypatch):
+    """Sobe api_simulada.app em uma porta livre, com os batches concluídos na primeira consulta."""
+    monkeypatch.setenv("ATRASO_BATCH_SIMULADO", "0")
+    monkeypatch.setitem(api_simulada.app.config, "RESPOSTAS_429_SIMULADAS", 0)
+
+    servidor = make_server("127.0.0.1", 0, api_simulada.app, threaded=True)
+    threading.Thread(target=servidor.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{servidor.server_port}/v1"
+    servidor.shutdown()
+
+
+@pytest.fixture
+def ambiente(tmp_path, monkeypatch):
+    """Diretório de amostragem com dois PDFs, banco temporário e extração sem OCR."""
+    monkeypatch.setattr(main, "PRE_CLASSIFICADOR", False)
+    monkeypatch.setattr(main, "CLASSIFICADOR_KNN", False)
+    # O conteúdo dos PDFs não importa: o texto vem de TEXTOS, sem passar pelo OCR
+    monkeypatch.setattr(classificador_batch, "extrair_texto_combinado",
+                        lambda arquivo_pdf: TEXTOS[os.path.basename(arquivo_pdf)])
+
+    diretorio_base = tmp_path / "amostragem"
+    (diretorio_base / "lote").mkdir(parents=True)
+    for nome in TEXTOS:
+        (diretorio_base / "lote" / nome).write_bytes(f"%PDF-1.4 {nome}".encode("utf-8"))
+
+    db_path = str(tmp_path / "classificacoes.db")
+    main.inicializar_banco_dados(db_path)
+    return {"base": str(diretorio_base), "saida": str(tmp_path / "saida"),
+            "lotes": str(tmp_path / "lotes"), "db": db_path}
+
+
+def _custom_ids(caminhos):
+    ids = []
+    for caminho in caminhos:
+        with open(caminho, "r", encoding="utf-8") as f:
+            ids.extend(json.loads(linha)["custom_id"] for linha in f if linha.strip())
+    return sorted(ids)
+
+
+def _consultar(db_path, sql, parametros=()):
+    sincronizar_escritor(db_path)
+    conn = sqlite3.connect(db_path)
+    try:
+        return conn.execute(sql, parametros).fetchall()
+    finally:
+        conn.close()
+
+
+def test_fluxo_completo_do_batch(api, ambiente):
+    db_path = ambiente["db"]
+    execucao_id, caminhos = preparar_lote_batch(
+        ambiente["base"], ambiente["saida"], ambiente["lotes"], db_path=db_path)
+    custom_ids = _custom_ids(caminhos)
+    assert len(custom_ids) == 2
+
+    # Retomar antes do envio reescreve os mesmos itens em vez de duplicá-los
+    retomada, caminhos = preparar_lote_batch(
+        ambiente["base"], ambiente["saida"], ambiente["lotes"], execucao_id=execucao_id, db_path=db_path)
+    assert retomada == execucao_id
+    assert _custom_ids(caminhos) == custom_ids
+    assert sorted(_consultar(db_path, "SELECT custom_id, status FROM lote_batch_itens")) == [
+        (custom_id, "preparado") for custom_id in custom_ids]
+
+    cliente = criar_cliente_batch(base_url=api, api_key="teste")
+    lotes = [enviar_lote_batch(caminho, execucao_id, ambiente["saida"], cliente, db_path)
+             for caminho in caminhos]
+    assert {status for _, status in _consultar(db_path, "SELECT custom_id, status FROM lote_batch_itens")} == {
+        "enviado"}
+
+    # Arquivos num batch enviado e sem resposta não são reenviados
+    _, caminhos = preparar_lote_batch(
+        ambiente["base"], ambiente["saida"], ambiente["lotes"], execucao_id=execucao_id, db_path=db_path)
+    assert caminhos == []
+
+    acompanhar_lotes_batch(uma_vez=True, client=cliente, db_path=db_path)
+
+    assert sorted(_consultar(db_path, "SELECT nome_arquivo, tipo_classificacao, origem_classificacao "
+                                      "FROM classificacoes")) == [
+        ("boleto.pdf", "boleto", "llm"), ("voucher.pdf", "voucher", "llm")]
+    for nome, tipo in (("boleto.json", "boleto"), ("voucher.json", "voucher")):
+        with open(os.path.join(ambiente["saida"], nome), "r", encoding="utf-8") as f:
+            assert json.load(f)["classificacao"]["tipo"] == tipo
+
+    assert sorted(_consultar(db_path, "SELECT custom_id, status, texto FROM lote_batch_itens")) == [
+        (custom_id, "classificado", "") for custom_id in custom_ids]
+    assert _consultar(db_path, "SELECT id, status FROM lotes_batch") == [
+        (lote_id, "completed") for lote_id in lotes]
+    assert set(_consultar(db_path, "SELECT status FROM execucao_arquivos WHERE execucao_id = ?",
+                          (execucao_id,))) == {("classificado",)}
+    assert _consultar(db_path, "SELECT status FROM execucoes WHERE id = ?", (execucao_id,)) == [
+        ("concluida",)]